@@ -78,7 +78,7 @@ def add_ingredient_route():
         except Exception as e:
             flash(f"오류가 발생했습니다: {e}", 'danger')
 
-    all_research = db._load_table('research-data')
+    all_research = db.get_table('research-data')
     nutrition_categories = db.get_nutrition_categories()
     return render_template('add_ingredient_form.html', all_research=all_research, nutrition_categories=nutrition_categories)
 
@@ -105,7 +105,7 @@ def add_cooking_method_route():
             return redirect(url_for('add_data.add_cooking_method_route'))
         except Exception as e:
             flash(f"오류가 발생했습니다: {e}", 'danger')
-    all_research = db._load_table('research-data')
+    all_research = db.get_table('research-data')
     return render_template('add_cooking_method_form.html', all_research=all_research)
 
 @bp.route('/research-data', methods=['GET', 'POST'])
@@ -175,15 +175,12 @@ def add_dish_route():
             return redirect(url_for('add_data.add_dish_route'))
         except Exception as e:
             flash(f"오류가 발생했습니다: {e}", 'danger')
-    all_ingredients = db._load_table('ingredient')
-    all_dishes = db._load_table('dish')
-    all_cooking_methods = db._load_table('cooking-methods')
-    
-    # Add display names for the current language
+    # Add display names for the current language (on copies: the cached rows are shared)
     lang = session.get('lang', 'kor')
-    for item in all_ingredients + all_dishes + all_cooking_methods:
-        item['display_name'] = get_display_name(item, lang)
-        
+    all_ingredients = [dict(item, display_name=get_display_name(item, lang)) for item in db.get_table('ingredient')]
+    all_dishes = [dict(item, display_name=get_display_name(item, lang)) for item in db.get_table('dish')]
+    all_cooking_methods = [dict(item, display_name=get_display_name(item, lang)) for item in db.get_table('cooking-methods')]
+
     return render_template('add_dish_form.html', 
                            all_ingredients=all_ingredients, 
                            all_dishes=all_dishes, 
@@ -204,8 +201,8 @@ def add_storaged_ingredient_route():
                 start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
             except ValueError:
                 flash("날짜 형식이 올바르지 않습니다. YYYY-MM-DD 형식으로 입력해주세요.", 'danger')
-                all_ingredients = db._load_table('ingredient')
-                all_dishes = db._load_table('dish')
+                all_ingredients = db.get_table('ingredient')
+                all_dishes = db.get_table('dish')
                 processing_options = db.PROCESSING_OPTIONS
                 return render_template('add_storaged_ingredient_form.html', 
                                     all_ingredients=all_ingredients,
@@ -213,12 +210,11 @@ def add_storaged_ingredient_route():
                                     processing_options=processing_options)
 
             # Get item data for validation
-            all_items = db._load_table('ingredient') + db._load_table('dish')
-            item = next((it for it in all_items if it['id'] == storage_id), None)
+            item = db.get_record('ingredient', storage_id) or db.get_record('dish', storage_id)
             if not item:
                 flash(f"해당 ID({storage_id})의 식재료 또는 요리를 찾을 수 없습니다.", 'danger')
-                all_ingredients = db._load_table('ingredient')
-                all_dishes = db._load_table('dish')
+                all_ingredients = db.get_table('ingredient')
+                all_dishes = db.get_table('dish')
                 return render_template('add_storaged_ingredient_form.html', all_ingredients=all_ingredients, all_dishes=all_dishes)
 
             # Additional validations based on mode
@@ -236,8 +232,8 @@ def add_storaged_ingredient_route():
                 # Check if ingredient is producible
                 if not item.get('production_time', {}).get('producible', False):
                     flash(f"선택한 항목({item['name'].get('kor', 'N/A')})은 생산이 불가능합니다.", 'danger')
-                    all_ingredients = db._load_table('ingredient')
-                    all_dishes = db._load_table('dish')
+                    all_ingredients = db.get_table('ingredient')
+                    all_dishes = db.get_table('dish')
                     processing_options = db.PROCESSING_OPTIONS
                     return render_template('add_storaged_ingredient_form.html',
                                         all_ingredients=all_ingredients,
@@ -258,8 +254,8 @@ def add_storaged_ingredient_route():
                 expiration_date = request.form.get('expiration_date')
                 if not expiration_date:
                     flash("보관 모드에서는 보관 기한을 입력해야 합니다.", 'danger')
-                    all_ingredients = db._load_table('ingredient')
-                    all_dishes = db._load_table('dish')
+                    all_ingredients = db.get_table('ingredient')
+                    all_dishes = db.get_table('dish')
                     processing_options = db.PROCESSING_OPTIONS
                     return render_template('add_storaged_ingredient_form.html',
                                         all_ingredients=all_ingredients,
@@ -270,8 +266,8 @@ def add_storaged_ingredient_route():
                     expiration_date_obj = datetime.strptime(expiration_date, '%Y-%m-%d')
                 except ValueError:
                     flash("날짜 형식이 올바르지 않습니다. YYYY-MM-DD 형식으로 입력해주세요.", 'danger')
-                    all_ingredients = db._load_table('ingredient')
-                    all_dishes = db._load_table('dish')
+                    all_ingredients = db.get_table('ingredient')
+                    all_dishes = db.get_table('dish')
                     processing_options = db.PROCESSING_OPTIONS
                     return render_template('add_storaged_ingredient_form.html',
                                         all_ingredients=all_ingredients,
@@ -281,8 +277,8 @@ def add_storaged_ingredient_route():
                 # expiration_date must be after or equal to start_date (we consider same-day storage allowed)
                 if expiration_date_obj.date() <= start_date:
                     flash("보관 기한은 시작일 이후여야 합니다.", 'danger')
-                    all_ingredients = db._load_table('ingredient')
-                    all_dishes = db._load_table('dish')
+                    all_ingredients = db.get_table('ingredient')
+                    all_dishes = db.get_table('dish')
                     processing_options = db.PROCESSING_OPTIONS
                     return render_template('add_storaged_ingredient_form.html',
                                         all_ingredients=all_ingredients,
@@ -299,8 +295,8 @@ def add_storaged_ingredient_route():
             flash(str(e), 'danger')
         except Exception as e:
             flash(f"오류가 발생했습니다: {e}", 'danger')
-    all_ingredients = db._load_table('ingredient')
-    all_dishes = db._load_table('dish')
+    all_ingredients = db.get_table('ingredient')
+    all_dishes = db.get_table('dish')
     return render_template('add_storaged_ingredient_form.html', all_ingredients=all_ingredients, all_dishes=all_dishes)
 
 @bp.route('/nutrition-category', methods=['POST'])
@@ -41,7 +41,7 @@ def signup():
             flash(f"입력 중 오류가 발생했습니다: {e}", 'danger')
     
     # load ingredient list from database_handler
-    all_ingredients = db._load_table('ingredient')
+    all_ingredients = db.get_table('ingredient')
     return render_template('signup.html', all_ingredients=all_ingredients)
 
 @bp.route('/login', methods=['GET', 'POST'])
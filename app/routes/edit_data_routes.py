@@ -2,7 +2,7 @@
 edit_data_routes.py - 데이터 수정을 위한 라우트 모듈
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, flash
 import database_handler as db
 from datetime import datetime
 
@@ -11,8 +11,7 @@ bp = Blueprint('edit_data', __name__, url_prefix='/edit')
 @bp.route('/research/<int:research_id>')
 def edit_research_route(research_id):
     """연구 자료 수정 페이지"""
-    research_data = db._load_table('research-data')
-    research = next((item for item in research_data if item['id'] == research_id), None)
+    research = db.get_record('research-data', research_id)
     if not research:
         return redirect(url_for('visualize.visualize_home'))
     return render_template('edit_research_form.html', research=research)
@@ -35,11 +34,10 @@ def edit_research_submit(research_id):
 @bp.route('/ingredient/<ingredient_id>')
 def edit_ingredient_route(ingredient_id):
     """식재료 수정 페이지"""
-    ingredient_data = db._load_table('ingredient')
-    ingredient = next((item for item in ingredient_data if item['id'] == ingredient_id), None)
+    ingredient = db.get_record('ingredient', ingredient_id)
     if not ingredient:
         return redirect(url_for('visualize.visualize_home'))
-    research_data = db._load_table('research-data')
+    research_data = db.get_table('research-data')
     nutrition_categories = db.get_nutrition_categories()
     return render_template('edit_ingredient_form.html', 
                          ingredient=ingredient,
@@ -91,11 +89,10 @@ def edit_ingredient_submit(ingredient_id):
 @bp.route('/cooking-method/<int:method_id>')
 def edit_cooking_method_route(method_id):
     """조리 방법 수정 페이지"""
-    cooking_methods = db._load_table('cooking-methods')
-    method = next((item for item in cooking_methods if item['id'] == method_id), None)
+    method = db.get_record('cooking-methods', method_id)
     if not method:
         return redirect(url_for('visualize.visualize_home'))
-    research_data = db._load_table('research-data')
+    research_data = db.get_table('research-data')
     return render_template('edit_cooking_method_form.html', 
                          method=method,
                          research_data=research_data)
@@ -119,14 +116,15 @@ def edit_cooking_method_submit(method_id):
 @bp.route('/dish/<dish_id>')
 def edit_dish_route(dish_id):
     """요리 수정 페이지"""
-    dish_data = db._load_table('dish')
-    dish = next((item for item in dish_data if item['id'] == dish_id), None)
+    dish = db.get_record('dish', dish_id)
     if not dish:
         return redirect(url_for('visualize.visualize_home'))
+    # Copy before normalizing fields for the template; the cached table is shared
+    dish = dict(dish)
     
-    ingredients = db._load_table('ingredient')
-    all_dishes = db._load_table('dish')
-    cooking_methods = db._load_table('cooking-methods')
+    ingredients = db.get_table('ingredient')
+    all_dishes = db.get_table('dish')
+    cooking_methods = db.get_table('cooking-methods')
     nutrition_categories = db.get_nutrition_categories()
     # Normalize dish['name'] into a dict for the template (kor/eng)
     if isinstance(dish.get('name'), str):
@@ -201,6 +199,8 @@ def edit_dish_submit(dish_id):
         db.update_dish(dish_id, name, image_url, required_ingredients,
                       required_cooking_method_ids, nutrition_data=None,
                       cooking_instructions=cooking_instructions)
+    except db.DishCycleError as e:
+        flash(f"요리를 저장하지 못했습니다: {e}", 'danger')
     except Exception as e:
         # Log error and return to detail page with no crash
         print(f"[edit_dish_submit] update_dish raised exception: {e}")
@@ -0,0 +1,99 @@
+"""
+bom.py - 요리 재료 명세(BOM) 전개
+
+Flattens a dish into the base ingredients it is made of, in grams per gram of
+dish. A sub-dish entry of amount_g grams contributes amount_g times the
+sub-dish's own per-gram breakdown, so nested recipes are scaled correctly.
+The per-gram breakdown of each dish is memoized and computed at most once.
+The memo is dropped as soon as the dish table changes (including pending
+changes inside the current transaction), so edits never serve stale amounts.
+
+    bom.expand_dish('d3')                       # one serving: the whole recipe
+    bom.expand_dish('d3', amount_g=150)         # 150 g of the dish
+    bom.expand_meals(['d3', ('d7', 200)])       # a whole meal list at once
+"""
+
+import threading
+
+import database_handler as db
+
+_BOM_CACHE = {'version': None, 'per_gram': {}}
+_BOM_LOCK = threading.RLock()
+
+
+def _memo():
+    version = db.get_table_version('dish')
+    with _BOM_LOCK:
+        if _BOM_CACHE['version'] != version:
+            _BOM_CACHE['version'] = version
+            _BOM_CACHE['per_gram'] = {}
+        return _BOM_CACHE['per_gram']
+
+
+def _dish_mass(dish):
+    return sum(req.get('amount_g', 0) or 0 for req in dish.get('required_ingredients', []))
+
+
+def _per_gram(dish_id, memo, visiting):
+    cached = memo.get(dish_id)
+    if cached is not None:
+        return cached
+    dish = db.get_record('dish', dish_id)
+    if dish is None:
+        return {}
+    if dish_id in visiting:
+        raise db.DishCycleError(list(visiting) + [dish_id])
+
+    visiting[dish_id] = True
+    try:
+        totals = {}
+        for req in dish.get('required_ingredients', []):
+            amount = req.get('amount_g', 0) or 0
+            if db._required_item_type(req) == 'dish':
+                for ingredient_id, per_gram in _per_gram(req.get('id'), memo, visiting).items():
+                    totals[ingredient_id] = totals.get(ingredient_id, 0.0) + amount * per_gram
+            else:
+                ingredient_id = req.get('id')
+                totals[ingredient_id] = totals.get(ingredient_id, 0.0) + amount
+    finally:
+        del visiting[dish_id]
+
+    mass = _dish_mass(dish)
+    result = {ingredient_id: grams / mass for ingredient_id, grams in totals.items()} if mass > 0 else {}
+    memo[dish_id] = result
+    return result
+
+
+def get_per_gram(dish_id):
+    """Base ingredient grams per gram of the dish ({ingredient_id: g/g}). Shared: do not modify."""
+    return _per_gram(dish_id, _memo(), {})
+
+
+def get_serving_mass(dish_id):
+    """Mass of one serving of a dish (the sum of its required amounts), in grams."""
+    dish = db.get_record('dish', dish_id)
+    return _dish_mass(dish) if dish else 0.0
+
+
+def expand_dish(dish_id, amount_g=None):
+    """Base ingredient grams for `amount_g` grams of a dish (default: one serving)."""
+    if amount_g is None:
+        amount_g = get_serving_mass(dish_id)
+    return {ingredient_id: per_gram * amount_g for ingredient_id, per_gram in get_per_gram(dish_id).items()}
+
+
+def expand_meals(meals):
+    """Total base ingredient grams for a list of meals.
+
+    Each meal is a dish id (one serving) or a (dish_id, amount_g) pair. Every
+    distinct dish is flattened once, however often it appears.
+    """
+    memo = _memo()
+    totals = {}
+    for meal in meals:
+        dish_id, amount_g = meal if isinstance(meal, (tuple, list)) else (meal, None)
+        if amount_g is None:
+            amount_g = get_serving_mass(dish_id)
+        for ingredient_id, per_gram in _per_gram(dish_id, memo, {}).items():
+            totals[ingredient_id] = totals.get(ingredient_id, 0.0) + per_gram * amount_g
+    return totals
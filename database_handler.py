@@ -1,64 +1,555 @@
+import functools
+import hashlib
+import itertools
 import json
-import os
-from datetime import datetime
+import threading
+from contextlib import ExitStack, contextmanager
+
+import inventory_ledger
+import nutrition_engine
+import storage_backend
+import user_db_handler
 
 DATA_FILES = {
     'ingredient': 'ingredient.json',
     'storaged-ingredient': 'storaged-ingredient.json',
+    'inventory-ledger': 'inventory_ledger.json',
     'cooking-methods': 'cooking-methods.json',
     'research-data': 'research-data.json',
     'dish': 'dish.json',
-    'nutrition': 'nutrition.json'  # legacy; prefer embedding nutrition into ingredient.json
+    'nutrition': 'nutrition.json',  # legacy; prefer embedding nutrition into ingredient.json
+    user_db_handler.USER_TABLE: user_db_handler.USER_DB_PATH
 }
 
-def _load_table(table_name):
+# Process-wide cache of parsed tables keyed by table name.
+# Each entry remembers the backend signature of the data it was loaded from
+# ((mtime, size) for JSON files, a version row for SQLite), so edits made by
+# another process or by hand are picked up on the next read.
+_TABLE_CACHE = {}
+_TABLE_VERSIONS = {}
+_CACHE_STATS = {'hits': 0, 'misses': 0}
+_CACHE_LOCK = threading.RLock()
+
+# Per-thread transaction state (see transaction()). Saves made inside a
+# transaction are kept in 'pending' and flushed once when it ends.
+_TX = threading.local()
+# Serial number of each pending table entry, so its versions never repeat those of an earlier transaction
+_PENDING_SERIALS = itertools.count(1)
+
+def _clone_records(value):
+    """Copy JSON-shaped data (dicts, lists, scalars). Faster than copy.deepcopy."""
+    if isinstance(value, dict):
+        return {k: _clone_records(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone_records(v) for v in value]
+    return value
+
+def _store_cache_entry(table_name, backend, signature, data):
+    _TABLE_CACHE[table_name] = {'backend': backend, 'signature': signature, 'data': data}
+    _TABLE_VERSIONS[table_name] = _TABLE_VERSIONS.get(table_name, 0) + 1
+
+def get_table(table_name):
+    """Return the cached rows of a table, re-parsing the file only when it changed.
+
+    The returned list is shared by every caller in the process: treat it as
+    read-only. Use _load_table() when you need a copy to modify and save.
+    """
+    pending = _pending_entry(table_name)
+    if pending is not None:
+        return pending['rows']
+
     path = DATA_FILES[table_name]
-    if not os.path.exists(path):
-        return []
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    backend = storage_backend.get_backend()
+    signature = backend.signature(table_name, path)
+    with _CACHE_LOCK:
+        entry = _TABLE_CACHE.get(table_name)
+        if entry is not None and entry['backend'] is backend and entry['signature'] == signature:
+            _CACHE_STATS['hits'] += 1
+            return entry['data']
+
+        _CACHE_STATS['misses'] += 1
+        data = backend.load(table_name, path) if signature is not None else []
+        _store_cache_entry(table_name, backend, signature, data)
+        return data
+
+def get_table_version(table_name):
+    """Return a value that changes every time the cached table is replaced."""
+    get_table(table_name)
+    pending = _pending_entry(table_name)
+    if pending is not None:
+        return ('pending', pending['serial'], pending['version'])
+    return _TABLE_VERSIONS.get(table_name, 0)
+
+def invalidate_table_cache(table_name=None):
+    """Drop one cached table (or all of them) so the next read re-parses the file."""
+    with _CACHE_LOCK:
+        names = [table_name] if table_name else list(_TABLE_CACHE)
+        for name in names:
+            if _TABLE_CACHE.pop(name, None) is not None:
+                _TABLE_VERSIONS[name] = _TABLE_VERSIONS.get(name, 0) + 1
+
+def get_table_cache_stats():
+    """Return cache hit/miss counters and the names of the currently cached tables."""
+    with _CACHE_LOCK:
+        return {
+            'hits': _CACHE_STATS['hits'],
+            'misses': _CACHE_STATS['misses'],
+            'tables': sorted(_TABLE_CACHE)
+        }
+
+# Secondary indexes kept for each table in addition to the id index: field -> {value: [rows]}
+SECONDARY_INDEX_FIELDS = {
+    'storaged-ingredient': ('storage-id', 'mode'),
+}
+_INDEX_CACHE = {}
+
+def _build_indexes(table_name, data):
+    by_id = {}
+    positions = {}
+    by_field = {field: {} for field in SECONDARY_INDEX_FIELDS.get(table_name, ())}
+    for pos, row in enumerate(data):
+        row_id = row.get('id')
+        if row_id is not None:
+            by_id[row_id] = row
+            positions[row_id] = pos
+        for field, index in by_field.items():
+            index.setdefault(row.get(field), []).append(row)
+    return {'by_id': by_id, 'positions': positions, 'by_field': by_field}
+
+def _get_indexes(table_name):
+    """Return the indexes for a table, rebuilding them whenever the table version changes."""
+    with _CACHE_LOCK:
+        data = get_table(table_name)
+        version = get_table_version(table_name)
+        entry = _INDEX_CACHE.get(table_name)
+        if entry is None or entry['version'] != version:
+            entry = _build_indexes(table_name, data)
+            entry['version'] = version
+            _INDEX_CACHE[table_name] = entry
+        return entry
+
+def get_id_map(table_name):
+    """Return the {id: row} map of a table. Shared with the cache: treat as read-only."""
+    return _get_indexes(table_name)['by_id']
+
+def get_record(table_name, record_id):
+    """Look up one row by primary key in O(1). Returns None when it does not exist."""
+    return _get_indexes(table_name)['by_id'].get(record_id)
+
+def get_records_by(table_name, field, value):
+    """Return all rows whose `field` equals `value` using a secondary index.
+
+    Only fields listed in SECONDARY_INDEX_FIELDS are indexed; anything else raises KeyError.
+    """
+    by_field = _get_indexes(table_name)['by_field']
+    if field not in by_field:
+        raise KeyError(f"No index on '{field}' for table '{table_name}'")
+    return by_field[field].get(value, [])
+
+def _record_position(table_name, record_id):
+    """Position of a row in the table list, or None. Valid for copies from _load_table()."""
+    return _get_indexes(table_name)['positions'].get(record_id)
+
+# Reverse relationship indexes ("where is this used / what cites this").
+# Rebuilt whenever one of the source tables changes version, i.e. after every add/update.
+_RELATION_SOURCE_TABLES = ('dish', 'ingredient', 'cooking-methods')
+_RELATION_CACHE = {}
+
+def _required_item_type(req):
+    """Type of a required_ingredients entry; legacy entries without 'type' are ingredients."""
+    return req.get('type') or 'ingredient'
+
+def _add_relation(index, key, record_id):
+    # Rows are indexed one at a time, so a repeated reference can only repeat the last entry
+    users = index.setdefault(key, [])
+    if not users or users[-1] != record_id:
+        users.append(record_id)
+
+def _build_relations():
+    ingredient_to_dishes = {}
+    dish_to_parents = {}
+    method_to_dishes = {}
+    research_to_ingredients = {}
+    research_to_methods = {}
+
+    for dish in get_table('dish'):
+        dish_id = dish.get('id')
+        for req in dish.get('required_ingredients', []):
+            target = dish_to_parents if _required_item_type(req) == 'dish' else ingredient_to_dishes
+            _add_relation(target, req.get('id'), dish_id)
+        for method_id in dish.get('cooking-method-ids', []):
+            _add_relation(method_to_dishes, method_id, dish_id)
+
+    for ingredient in get_table('ingredient'):
+        for research_id in ingredient.get('research_ids', []):
+            _add_relation(research_to_ingredients, research_id, ingredient.get('id'))
+    for method in get_table('cooking-methods'):
+        for research_id in method.get('research_ids', []):
+            _add_relation(research_to_methods, research_id, method.get('id'))
+
+    return {
+        'ingredient_to_dishes': ingredient_to_dishes,
+        'dish_to_parents': dish_to_parents,
+        'method_to_dishes': method_to_dishes,
+        'research_to_ingredients': research_to_ingredients,
+        'research_to_methods': research_to_methods,
+        'transitive': {}
+    }
+
+def _get_relations():
+    with _CACHE_LOCK:
+        versions = tuple(get_table_version(name) for name in _RELATION_SOURCE_TABLES)
+        if _RELATION_CACHE.get('versions') != versions:
+            _RELATION_CACHE.clear()
+            _RELATION_CACHE.update(_build_relations())
+            _RELATION_CACHE['versions'] = versions
+        return _RELATION_CACHE
+
+def _walk_parents(start_ids, dish_to_parents):
+    """Collect every dish reachable upwards through sub-dish edges (cycle safe)."""
+    seen = set()
+    stack = list(start_ids)
+    while stack:
+        dish_id = stack.pop()
+        if dish_id in seen:
+            continue
+        seen.add(dish_id)
+        stack.extend(dish_to_parents.get(dish_id, []))
+    return seen
+
+def _rows_in_table_order(table_name, ids):
+    indexes = _get_indexes(table_name)
+    positions = indexes['positions']
+    ordered = sorted((i for i in ids if i in positions), key=positions.__getitem__)
+    return [indexes['by_id'][i] for i in ordered]
+
+def get_dishes_using_ingredient(ingredient_id, transitive=False):
+    """Dishes that list the ingredient in required_ingredients.
+
+    With transitive=True, dishes that use it through a sub-dish are included too.
+    The result is memoized until the dish table changes.
+    """
+    relations = _get_relations()
+    direct = relations['ingredient_to_dishes'].get(ingredient_id, [])
+    if not transitive:
+        return _rows_in_table_order('dish', direct)
+    key = ('ingredient', ingredient_id)
+    if key not in relations['transitive']:
+        relations['transitive'][key] = _walk_parents(direct, relations['dish_to_parents'])
+    return _rows_in_table_order('dish', relations['transitive'][key])
+
+def get_parent_dishes(dish_id, transitive=False):
+    """Dishes that use `dish_id` as a sub-dish (optionally through further nesting)."""
+    relations = _get_relations()
+    direct = relations['dish_to_parents'].get(dish_id, [])
+    if not transitive:
+        return _rows_in_table_order('dish', direct)
+    key = ('dish', dish_id)
+    if key not in relations['transitive']:
+        relations['transitive'][key] = _walk_parents(direct, relations['dish_to_parents'])
+    return _rows_in_table_order('dish', relations['transitive'][key])
+
+def get_dishes_using_cooking_method(method_id):
+    """Dishes whose cooking-method-ids contain `method_id`."""
+    return _rows_in_table_order('dish', _get_relations()['method_to_dishes'].get(method_id, []))
+
+def get_research_citations(research_id):
+    """Ingredients and cooking methods that cite a research entry in their research_ids."""
+    relations = _get_relations()
+    return {
+        'ingredient': _rows_in_table_order('ingredient', relations['research_to_ingredients'].get(research_id, [])),
+        'cooking-methods': _rows_in_table_order('cooking-methods', relations['research_to_methods'].get(research_id, []))
+    }
+
+def _current_transaction():
+    return getattr(_TX, 'state', None)
+
+def _pending_entry(table_name):
+    state = _current_transaction()
+    return state['pending'].get(table_name) if state is not None else None
+
+def _lock_in_transaction(state, table_name):
+    if table_name not in state['locked']:
+        backend = storage_backend.get_backend()
+        state['locks'].enter_context(backend.lock(table_name, DATA_FILES[table_name]))
+        state['locked'].add(table_name)
+
+@contextmanager
+def transaction(*table_names):
+    """Read-modify-write one or more tables under an exclusive cross-process lock.
+
+    The named tables are locked up front (in a fixed order, to avoid deadlocks);
+    any other table read with _load_table() inside the block is locked on first use.
+    Every _save_table() inside the block only updates an in-transaction copy,
+    and each table is flushed once when the block exits, all tables in one
+    atomic commit. An exception discards all pending changes. Nested
+    transactions join the outer one.
+
+        with db.transaction('dish'):
+            dishes = db._load_table('dish')
+            ...
+            db._save_table('dish', dishes)
+    """
+    state = _current_transaction()
+    if state is not None:
+        for name in sorted(table_names):
+            _lock_in_transaction(state, name)
+        yield
+        return
+
+    state = {'locks': ExitStack(), 'locked': set(), 'pending': {}}
+    _TX.state = state
+    try:
+        with state['locks']:
+            for name in sorted(table_names):
+                _lock_in_transaction(state, name)
+            yield
+            _flush_transaction(state)
+    finally:
+        _TX.state = None
+
+def _flush_transaction(state):
+    backend = storage_backend.get_backend()
+    pending = state['pending']
+    state['pending'] = {}
+    if not pending:
+        return
+    writes = [(table_name, DATA_FILES[table_name], pending[table_name]['rows'], pending[table_name]['base'],
+               pending[table_name]['ops'])
+              for table_name in sorted(pending)]
+    with _CACHE_LOCK:
+        backend.save_many(writes)
+        for table_name, path, rows, *_ in writes:
+            _store_cache_entry(table_name, backend, backend.signature(table_name, path), rows)
+
+class UnitOfWork:
+    """Working copies of the tables touched by one unit_of_work() block."""
+
+    def __init__(self):
+        self._rows = {}
+        self._dirty = {}
+
+    def load(self, table_name):
+        """Mutable rows of a table; loaded on first use and shared by later calls."""
+        if table_name not in self._rows:
+            self._rows[table_name] = _load_table(table_name)
+        return self._rows[table_name]
+
+    def save(self, table_name, changed_ids=None):
+        """Mark a loaded table as changed. It is written when the block commits.
+
+        changed_ids, when known, are the only rows that changed (see _save_table).
+        """
+        if table_name in self._dirty and self._dirty[table_name] is None:
+            return
+        if changed_ids is None:
+            self._dirty[table_name] = None
+        else:
+            self._dirty.setdefault(table_name, set()).update(changed_ids)
+
+    def _stage(self):
+        for table_name, changed_ids in self._dirty.items():
+            _save_table(table_name, self._rows[table_name], changed_ids)
+        self._dirty = {}
+
+@contextmanager
+def unit_of_work(*table_names):
+    """Change several tables together: each is loaded once and all are committed atomically.
+
+        with db.unit_of_work('ingredient', 'dish') as uow:
+            dishes = uow.load('dish')
+            ...
+            uow.save('dish')
+
+    Changes made through the working copies are only visible to get_table()
+    and helpers such as add_dish() after the block ends, so do not mix both
+    for the same table inside one block.
+    """
+    with transaction(*table_names):
+        uow = UnitOfWork()
+        yield uow
+        uow._stage()
+
+def _transactional(*table_names):
+    """Run the decorated read-modify-write function inside transaction(*table_names)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with transaction(*table_names):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _load_table(table_name):
+    """Return a private, mutable copy of a table (served from the cache).
+
+    Inside a transaction the table is locked first and pending changes are visible.
+    """
+    state = _current_transaction()
+    if state is not None:
+        _lock_in_transaction(state, table_name)
+    return _clone_records(get_table(table_name))
+
+def _copy_for_update(table_name, record_ids):
+    """Rows of a table in which only the given records are private, mutable copies.
+
+    The other rows are shared with the cache. Change only those records, then
+    save with _save_table(table_name, rows, changed_ids=record_ids).
+    """
+    state = _current_transaction()
+    if state is not None:
+        _lock_in_transaction(state, table_name)
+    rows = list(get_table(table_name))
+    for record_id in record_ids:
+        pos = _record_position(table_name, record_id)
+        if pos is not None:
+            rows[pos] = _clone_records(rows[pos])
+    return rows
+
+def _tracked_changes(current, data, changed_ids):
+    """(rows, ops) for a save in which only the rows with changed_ids differ from `current`.
+
+    Unchanged rows are taken from `current` as they are; only the changed rows
+    are copied and compared. Returns None when the change is not a set of
+    updates, deletes and rows added at the end (e.g. rows were reordered).
+    """
+    changed_ids = set(changed_ids)
+    current_ids = []
+    before = {}
+    for row in current:
+        row_id = row.get('id')
+        current_ids.append(row_id)
+        if row_id in changed_ids:
+            before[row_id] = row
+    data_ids = []
+    after = {}
+    for row in data:
+        row_id = row.get('id')
+        data_ids.append(row_id)
+        if row_id in changed_ids:
+            after[row_id] = row
+    deleted = [row_id for row_id in before if row_id not in after]
+    added = [row_id for row_id in after if row_id not in before]
+    # Surviving rows keep their order and new rows come last
+    if data_ids != [row_id for row_id in current_ids if row_id not in deleted] + added:
+        return None
+
+    ops = [{'op': 'delete', 'id': row_id} for row_id in deleted]
+    replaced = {}
+    for row_id, row in after.items():
+        if row_id in before and row == before[row_id]:
+            continue
+        # Keep our own copy so later mutations by the caller do not leak into the cache
+        replaced[row_id] = _clone_records(row)
+        if row_id in before:
+            ops.append({'op': 'update', 'id': row_id, 'record': replaced[row_id]})
+    ops.extend({'op': 'append', 'record': replaced[row_id]} for row_id in added)
+    rows = [replaced.get(row.get('id'), row) for row in current if row.get('id') not in deleted]
+    rows.extend(replaced[row_id] for row_id in added)
+    return rows, ops
+
+def _write_rows(table_name, rows, ops):
+    """Make `rows` the new content of a table (staged when inside a transaction).
+
+    `rows` belongs to the cache from now on. ops are the changes relative to the
+    current content, or None to let the backend diff the whole table.
+    """
+    state = _current_transaction()
+    if state is not None:
+        entry = state['pending'].get(table_name)
+        if entry is None:
+            entry = {'base': get_table(table_name), 'version': 0, 'ops': [], 'serial': next(_PENDING_SERIALS)}
+            state['pending'][table_name] = entry
+        entry['rows'] = rows
+        entry['ops'] = entry['ops'] + ops if ops is not None and entry['ops'] is not None else None
+        entry['version'] += 1
+        return
 
-def _save_table(table_name, data):
     path = DATA_FILES[table_name]
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    backend = storage_backend.get_backend()
+    with _CACHE_LOCK:
+        entry = _TABLE_CACHE.get(table_name)
+        previous = entry['data'] if entry is not None and entry['backend'] is backend else None
+        backend.save(table_name, path, rows, previous=previous, ops=ops)
+        _store_cache_entry(table_name, backend, backend.signature(table_name, path), rows)
 
-def _get_next_id(table_name):
-    data = _load_table(table_name)
-    prefix = ''
-    if table_name == 'ingredient':
-        prefix = 'i'
-    elif table_name == 'dish':
-        prefix = 'd'
-    elif table_name == 'nutrition':
-        prefix = 'N'
-    else:
-        if not data:
-            return 1
-        return max(item.get('id', 0) for item in data) + 1
+def _save_table(table_name, data, changed_ids=None):
+    """Save a whole table (inside a transaction, when the transaction ends).
 
-    if not data:
-        return f"{prefix}1"
+    changed_ids, when given, are the ids of the only rows that were added,
+    modified or removed. The other rows are then neither copied nor compared,
+    and the backend writes just the changed rows. Without it the table is
+    copied and diffed in full.
+    """
+    state = _current_transaction()
+    if state is not None:
+        _lock_in_transaction(state, table_name)
+    tracked = None
+    if changed_ids is not None:
+        tracked = _tracked_changes(get_table(table_name), data, changed_ids)
+    if tracked is None:
+        # Keep our own copy so later mutations by the caller do not leak into the cache
+        tracked = (_clone_records(data), None)
+    _write_rows(table_name, *tracked)
+
+def _append_rows(table_name, new_rows):
+    """Add rows at the end of a table; the rows already in it are not copied or compared."""
+    state = _current_transaction()
+    if state is not None:
+        _lock_in_transaction(state, table_name)
+    new_rows = _clone_records(list(new_rows))
+    _write_rows(table_name, get_table(table_name) + new_rows, [{'op': 'append', 'record': row} for row in new_rows])
+
+# Raised by update_dish() and the nutrition recompute when dishes use each other in a cycle
+DishCycleError = nutrition_engine.DishCycleError
 
+# String ids carry a per-table prefix ("i12", "d3"); the other tables use plain integers.
+ID_PREFIXES = {
+    'ingredient': 'i',
+    'dish': 'd',
+    'nutrition': 'N'
+}
+
+def _max_id_number(table_name):
+    """Largest numeric id part currently in a table (full scan; used to seed the sequence)."""
+    prefix = ID_PREFIXES.get(table_name, '')
     max_id = 0
-    for item in data:
+    for item in get_table(table_name):
         item_id = item.get('id')
-        if isinstance(item_id, str) and item_id.startswith(prefix):
-            try:
-                num_part = int(item_id[len(prefix):])
-                if num_part > max_id:
-                    max_id = num_part
-            except (ValueError, TypeError):
+        if prefix:
+            if not (isinstance(item_id, str) and item_id.startswith(prefix)):
                 continue
-    
-    return f"{prefix}{max_id + 1}"
+            item_id = item_id[len(prefix):]
+        try:
+            max_id = max(max_id, int(item_id))
+        except (ValueError, TypeError):
+            continue
+    return max_id
 
+def _get_next_id(table_name):
+    """Allocate the next id from the table's persistent sequence in O(1).
+
+    The sequence is seeded from the largest existing id on first use. If the
+    data was replaced behind its back (e.g. a restored JSON file) and the
+    allocated id is already taken, the sequence is re-seeded from the table.
+    """
+    prefix = ID_PREFIXES.get(table_name, '')
+    backend = storage_backend.get_backend()
+    path = DATA_FILES[table_name]
+    while True:
+        number = backend.next_sequence(table_name, path, lambda: _max_id_number(table_name))
+        new_id = f"{prefix}{number}" if prefix else number
+        if get_record(table_name, new_id) is None:
+            return new_id
+        # The id is already taken: re-seed from the data and try again
+        backend.reset_sequence(table_name, path, _max_id_number(table_name))
+
+@_transactional('ingredient')
 def add_ingredient(name, research_ids, nutrition_data, production_time):
     """Add ingredient and embed nutrition_data into the ingredient record.
 
     nutrition_data: list of nutrients e.g. [{"name":.., "amount_per_unit_mass": ..}, ...]
     """
-    data = _load_table('ingredient')
     new_id = _get_next_id('ingredient')
 
     # Embed nutrition directly into ingredient record (new format)
@@ -69,13 +560,13 @@ def add_ingredient(name, research_ids, nutrition_data, production_time):
         "nutrition": nutrition_data,
         "production_time": production_time
     }
-    data.append(new_item)
-    _save_table('ingredient', data)
+    _append_rows('ingredient', [new_item])
 
     # For backwards compatibility, we do not create nutrition.json entries anymore.
     print(f"New ingredient '{name.get('kor', 'N/A')}' added with ID {new_id}.")
     return new_id
 
+@_transactional('nutrition')
 def add_nutrition(nutrition_data):
     """Legacy helper kept for compatibility: writes to nutrition.json (deprecated).
 
@@ -102,8 +593,7 @@ def get_ingredient_nutrition(ingredient_id):
     New format: nutrition embedded in ingredient['nutrition'] as a list of nutrients.
     Legacy fallback: read nutrition.json and match by ingredient['nutrition_id'].
     """
-    ingredient_data = _load_table('ingredient')
-    ingredient = next((item for item in ingredient_data if item.get('id') == ingredient_id), None)
+    ingredient = get_record('ingredient', ingredient_id)
     if not ingredient:
         return None
 
@@ -115,10 +605,10 @@ def get_ingredient_nutrition(ingredient_id):
     nut_id = ingredient.get('nutrition_id')
     if not nut_id:
         return None
-    nutrition_data = _load_table('nutrition')
-    nutrition = next((item for item in nutrition_data if item.get('id') == nut_id), None)
+    nutrition = get_record('nutrition', nut_id)
     return nutrition.get('nutrients') if nutrition else None
 
+@_transactional('research-data')
 def update_research_data(research_id, reference_data, summary):
     """Update an existing research data entry.
     
@@ -127,29 +617,30 @@ def update_research_data(research_id, reference_data, summary):
         reference_data: Dictionary containing link and title
         summary: Dictionary containing kor and eng summaries
     """
-    data = _load_table('research-data')
-    for item in data:
-        if item['id'] == research_id:
-            # Preserve existing reference_data keys when the form omits them
-            existing_ref = item.get('reference_data', {}) or {}
-            merged_ref = existing_ref.copy()
-            # Only overwrite keys that are provided (non-None)
-            for k, v in (reference_data or {}).items():
-                if v is not None:
-                    merged_ref[k] = v
-
-            # Preserve existing summary keys similarly
-            existing_summary = item.get('summary', {}) or {}
-            merged_summary = existing_summary.copy()
-            for k, v in (summary or {}).items():
-                if v is not None:
-                    merged_summary[k] = v
-
-            item['reference_data'] = merged_ref
-            item['summary'] = merged_summary
-            _save_table('research-data', data)
-            print(f"Research data with ID {research_id} updated successfully.")
-            return True
+    data = _copy_for_update('research-data', [research_id])
+    pos = _record_position('research-data', research_id)
+    if pos is not None:
+        item = data[pos]
+        # Preserve existing reference_data keys when the form omits them
+        existing_ref = item.get('reference_data', {}) or {}
+        merged_ref = existing_ref.copy()
+        # Only overwrite keys that are provided (non-None)
+        for k, v in (reference_data or {}).items():
+            if v is not None:
+                merged_ref[k] = v
+
+        # Preserve existing summary keys similarly
+        existing_summary = item.get('summary', {}) or {}
+        merged_summary = existing_summary.copy()
+        for k, v in (summary or {}).items():
+            if v is not None:
+                merged_summary[k] = v
+
+        item['reference_data'] = merged_ref
+        item['summary'] = merged_summary
+        _save_table('research-data', data, changed_ids=[research_id])
+        print(f"Research data with ID {research_id} updated successfully.")
+        return True
     print(f"Research data with ID {research_id} not found.")
     return False
 
@@ -159,28 +650,26 @@ def update_ingredient_nutrition_reference(ingredient_id, nutrition_id):
     With the new embedded format this is typically unnecessary; keep it for backwards
     compatibility but do nothing if nutrition.json is absent.
     """
-    nutrition_path = DATA_FILES.get('nutrition')
-    if not nutrition_path or not os.path.exists(nutrition_path):
-        return
-    nutrition_data = _load_table('nutrition')
-    ingredient_data = _load_table('ingredient')
-
-    for item in nutrition_data:
-        if item.get('id') == nutrition_id:
-            item['ingredient_id'] = ingredient_id
-            break
+    with unit_of_work('ingredient', 'nutrition') as uow:
+        if not get_table('nutrition'):
+            return
 
-    for item in ingredient_data:
-        if item.get('id') == ingredient_id:
-            item['nutrition_id'] = nutrition_id
-            break
+        nutrition_pos = _record_position('nutrition', nutrition_id)
+        if nutrition_pos is not None:
+            uow.load('nutrition')[nutrition_pos]['ingredient_id'] = ingredient_id
+            uow.save('nutrition')
 
-    _save_table('nutrition', nutrition_data)
-    _save_table('ingredient', ingredient_data)
+        ingredient_pos = _record_position('ingredient', ingredient_id)
+        if ingredient_pos is not None:
+            uow.load('ingredient')[ingredient_pos]['nutrition_id'] = nutrition_id
+            uow.save('ingredient')
 
 def update_ingredient(ingredient_id, name, research_ids, nutrition_data, production_time):
     """Update an existing ingredient entry.
 
+    Dishes that use the ingredient (directly or through sub-dishes) get their
+    nutrition_info recalculated in the same commit when the nutrition changed.
+
     Parameters:
     - ingredient_id: numeric id
     - name: dict of language codes to names
@@ -188,27 +677,56 @@ def update_ingredient(ingredient_id, name, research_ids, nutrition_data, product
     - nutrition_data: list of nutrient dicts (name, amount_per_unit_mass)
     - production_time: dict or other value to store in ingredient['production_time']
     """
-    data = _load_table('ingredient')
-    for item in data:
-        if item.get('id') == ingredient_id:
-            # Replace fields provided. Use provided values directly so caller controls structure.
-            item['name'] = name
-            item['research_ids'] = research_ids
-            item['nutrition'] = nutrition_data
-            item['production_time'] = production_time
-            _save_table('ingredient', data)
-            print(f"Ingredient with ID {ingredient_id} updated.")
-            return True
-    print(f"Ingredient with ID {ingredient_id} not found.")
-    return False
+    with unit_of_work('ingredient', 'dish') as uow:
+        pos = _record_position('ingredient', ingredient_id)
+        if pos is None:
+            print(f"Ingredient with ID {ingredient_id} not found.")
+            return False
+        item = uow.load('ingredient')[pos]
+        nutrition_changed = item.get('nutrition') != nutrition_data
+        # Replace fields provided. Use provided values directly so caller controls structure.
+        item['name'] = name
+        item['research_ids'] = research_ids
+        item['nutrition'] = nutrition_data
+        item['production_time'] = production_time
+        uow.save('ingredient', [ingredient_id])
+        dependents = _dependent_dish_ids(ingredient_ids=[ingredient_id])
+        if nutrition_changed and dependents:
+            _propagate_nutrition(uow.load('dish'), uow.load('ingredient'), ingredient_ids=[ingredient_id])
+            uow.save('dish', dependents)
+    print(f"Ingredient with ID {ingredient_id} updated.")
+    return True
+
+def _dependent_dish_ids(ingredient_ids=(), dish_ids=()):
+    """Ids of every dish whose nutrition depends on the given ingredients or dishes (reverse index)."""
+    relations = _get_relations()
+    direct = []
+    for ingredient_id in ingredient_ids:
+        direct.extend(relations['ingredient_to_dishes'].get(ingredient_id, []))
+    for dish_id in dish_ids:
+        direct.extend(relations['dish_to_parents'].get(dish_id, []))
+    return _walk_parents(direct, relations['dish_to_parents'])
 
+def _propagate_nutrition(dishes, all_ingredients, ingredient_ids=(), dish_ids=()):
+    """Recompute only the dishes that depend on changed ingredients/dishes.
+
+    `dishes` is a mutable copy of the dish table that already holds the changed
+    dishes; the dependents are updated in it in place. Returns their number.
+    """
+    affected = _dependent_dish_ids(ingredient_ids, dish_ids)
+    if not affected:
+        return 0
+    dish_map = {dish['id']: dish for dish in dishes}
+    batch = [dish_map[dish_id] for dish_id in affected if dish_id in dish_map]
+    recalculate_all_dish_nutrition(batch, all_ingredients, dish_map)
+    return len(batch)
+
+@_transactional('inventory-ledger', 'storaged-ingredient')
 def add_storaged_ingredient(storage_id, mass_g, start_date, mode, processing_type=None,
                           expiration_date=None, min_end_date=None, max_end_date=None):
-    data = _load_table('storaged-ingredient')
-    ingredients = _load_table('ingredient')
     
     # Find the ingredient
-    ingredient = next((item for item in ingredients if item['id'] == storage_id), None)
+    ingredient = get_record('ingredient', storage_id)
     if not ingredient:
         raise ValueError(f"Ingredient with ID {storage_id} not found.")
     
@@ -238,13 +756,116 @@ def add_storaged_ingredient(storage_id, mass_g, start_date, mode, processing_typ
         new_item["max_end_date"] = max_end_date
     else:
         new_item["expiration_date"] = expiration_date
-    data.append(new_item)
-    _save_table('storaged-ingredient', data)
+    record_inventory_events([{'type': inventory_ledger.RECEIPT, 'lot': new_item}])
     print(f"New {mode} ingredient batch added with ID {new_id}.")
     return new_id
 
+# Inventory ledger: storaged-ingredient is the current state of the append-only
+# 'inventory-ledger' table (see inventory_ledger.py); every stock change goes through here.
+_LEDGER_INDEX = {}
+
+def _ledger_checkpoints(cut_length=None):
+    """Checkpoint (times, positions) of the ledger, kept up to date as rows are appended.
+
+    With cut_length the times are cut to that many characters, as
+    inventory_ledger.state_as_of() expects; the cut lists are kept too.
+    """
+    with _CACHE_LOCK:
+        rows = get_table('inventory-ledger')
+        version = get_table_version('inventory-ledger')
+        if _LEDGER_INDEX.get('version') != version:
+            seen = _LEDGER_INDEX.get('length', 0)
+            if 0 < seen <= len(rows) and rows[seen - 1] is _LEDGER_INDEX['last_row']:
+                # Appended since the last call (the old rows are shared): scan only the new ones
+                times, positions = inventory_ledger.checkpoint_positions(rows[seen:])
+                old_times, old_positions = _LEDGER_INDEX['checkpoints']
+                checkpoints = (old_times + times, old_positions + [seen + pos for pos in positions])
+                cut = {length: old_cut + inventory_ledger.cut_times(times, length)
+                       for length, old_cut in _LEDGER_INDEX['cut'].items()}
+            else:
+                checkpoints = inventory_ledger.checkpoint_positions(rows)
+                cut = {}
+            _LEDGER_INDEX.update(version=version, checkpoints=checkpoints, cut=cut, length=len(rows),
+                                 last_row=rows[-1] if rows else None)
+        times, positions = _LEDGER_INDEX['checkpoints']
+        if cut_length is None:
+            return rows, (times, positions)
+        cut = _LEDGER_INDEX['cut']
+        if cut_length not in cut:
+            cut[cut_length] = inventory_ledger.cut_times(times, cut_length)
+        return rows, (cut[cut_length], positions)
+
+@_transactional('inventory-ledger', 'storaged-ingredient')
+def record_inventory_events(events):
+    """Append stock events to the ledger and apply them to storaged-ingredient, atomically.
+
+    An invalid event (e.g. consuming more than a lot holds) raises ValueError and
+    nothing is written. Returns the appended ledger rows. Only the new ledger
+    rows and the lots they touch are written.
+    """
+    rows, (_, positions) = _ledger_checkpoints()
+    last = rows[-1] if rows else None
+    lot_rows = get_table('storaged-ingredient')
+    lots = {lot['id']: lot for lot in lot_rows}
+    changed_lots = set()
+    appended = []
+
+    def _append(event):
+        nonlocal last
+        at = inventory_ledger.now()
+        if last is not None and last.get('at', '') > at:
+            at = last['at']  # keep 'at' non-decreasing if the clock goes back
+        row = dict(event, id=last['id'] + 1 if last is not None else 1, at=at)
+        appended.append(row)
+        last = row
+
+    if not rows:
+        # Opening balance: the lots that existed before the ledger
+        _append(inventory_ledger.checkpoint_event(lot_rows))
+        since_checkpoint = 0
+    else:
+        since_checkpoint = len(rows) - 1 - positions[-1] if positions else len(rows)
+    for event in events:
+        lot_id = event['lot']['id'] if event.get('type') == inventory_ledger.RECEIPT else event.get('lot_id')
+        if lot_id in lots and lot_id not in changed_lots:
+            # Copy on first change; the cached row stays as it is
+            lots[lot_id] = _clone_records(lots[lot_id])
+        changed_lots.add(lot_id)
+        inventory_ledger.apply_event(lots, event)
+        _append(event)
+        since_checkpoint += 1
+        if since_checkpoint >= inventory_ledger.CHECKPOINT_INTERVAL:
+            _append(inventory_ledger.checkpoint_event(lots.values()))
+            since_checkpoint = 0
+
+    _save_table('storaged-ingredient', list(lots.values()), changed_ids=changed_lots)
+    _append_rows('inventory-ledger', appended)
+    return appended
+
+def complete_production(lot_id, expiration_date, mass_g=None):
+    """Turn a finished production lot into a storage lot (optionally with the actual yield)."""
+    event = {'type': inventory_ledger.PRODUCTION_COMPLETION, 'lot_id': lot_id, 'expiration_date': expiration_date}
+    if mass_g is not None:
+        event['mass_g'] = mass_g
+    record_inventory_events([event])
+
+def adjust_storaged_ingredient(lot_id, delta_g, reason=''):
+    """Correct the mass of a lot by delta_g grams (e.g. after a stock count)."""
+    record_inventory_events([{'type': inventory_ledger.ADJUSTMENT, 'lot_id': lot_id,
+                              'delta_g': delta_g, 'reason': reason}])
+
+def get_inventory_as_of(as_of):
+    """Lots as recorded up to `as_of` ('YYYY-MM-DD' includes the whole day, or an ISO timestamp).
+
+    Replays only the ledger events after the nearest checkpoint. The current
+    state is simply get_table('storaged-ingredient').
+    """
+    rows, checkpoints = _ledger_checkpoints(len(as_of))
+    return list(inventory_ledger.state_as_of(rows, checkpoints, as_of).values())
+
+
+@_transactional('cooking-methods')
 def add_cooking_method(name, description, research_ids):
-    data = _load_table('cooking-methods')
     new_id = _get_next_id('cooking-methods')
     new_item = {
         "id": new_id,
@@ -252,35 +873,35 @@ def add_cooking_method(name, description, research_ids):
         "description": description,
         "research_ids": research_ids
     }
-    data.append(new_item)
-    _save_table('cooking-methods', data)
+    _append_rows('cooking-methods', [new_item])
     print(f"New cooking method '{name.get('kor', 'N/A')}' added with ID {new_id}.")
     return new_id
 
+@_transactional('cooking-methods')
 def update_cooking_method(method_id, name, description, research_ids):
     """Update an existing cooking method entry."""
-    data = _load_table('cooking-methods')
-    for item in data:
-        if item.get('id') == method_id:
-            item['name'] = name
-            item['description'] = description
-            item['research_ids'] = research_ids
-            _save_table('cooking-methods', data)
-            print(f"Cooking method with ID {method_id} updated.")
-            return True
+    data = _copy_for_update('cooking-methods', [method_id])
+    pos = _record_position('cooking-methods', method_id)
+    if pos is not None:
+        item = data[pos]
+        item['name'] = name
+        item['description'] = description
+        item['research_ids'] = research_ids
+        _save_table('cooking-methods', data, changed_ids=[method_id])
+        print(f"Cooking method with ID {method_id} updated.")
+        return True
     print(f"Cooking method with ID {method_id} not found.")
     return False
 
+@_transactional('research-data')
 def add_research_data(reference_data, summary):
-    data = _load_table('research-data')
     new_id = _get_next_id('research-data')
     new_item = {
         "id": new_id,
         "reference_data": reference_data,
         "summary": summary
     }
-    data.append(new_item)
-    _save_table('research-data', data)
+    _append_rows('research-data', [new_item])
     print(f"New research data added with ID {new_id}.")
     return new_id
 
@@ -298,6 +919,17 @@ def get_dish_total_mass(dish):
         total_mass += ing.get('amount_g', 0)
     return total_mass
 
+def get_dish_totals(dish):
+    """(total mass in g, {nutrient name: amount per serving}) of a dish.
+
+    Reads the fields stored when the dish was saved; only records written before
+    they existed are computed on the fly.
+    """
+    if 'total_mass_g' in dish and 'nutrition_totals' in dish:
+        return dish['total_mass_g'], dish['nutrition_totals']
+    fields = nutrition_engine.serving_fields(dish.get('nutrition_info', []), get_dish_total_mass(dish))
+    return fields['total_mass_g'], fields['nutrition_totals']
+
 def get_nutrition_categories():
     with open('nutrition_category.json', 'r', encoding='utf-8') as f:
         return json.load(f)
@@ -305,31 +937,27 @@ def get_nutrition_categories():
 def add_nutrition_category(name, unit):
     """새로운 영양 정보 카테고리를 추가합니다."""
     try:
-        with open('nutrition_category.json', 'r+', encoding='utf-8') as f:
-            categories = json.load(f)
-            
+        with storage_backend.file_lock('nutrition_category.json.lock'):
+            try:
+                with open('nutrition_category.json', 'r', encoding='utf-8') as f:
+                    categories = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                # If file doesn't exist or is empty, create a new one
+                categories = []
+
             # Check for duplicates
             if any(c['name'].lower() == name.lower() for c in categories):
                 return None  # Category already exists
 
             new_category = {'name': name, 'unit': unit}
             categories.append(new_category)
-            
-            f.seek(0)
-            json.dump(categories, f, ensure_ascii=False, indent=4)
-            f.truncate()
-            
+            storage_backend.atomic_write_json('nutrition_category.json', categories)
             return new_category
-    except (FileNotFoundError, json.JSONDecodeError):
-        # If file doesn't exist or is empty, create a new one
-        new_category = {'name': name, 'unit': unit}
-        with open('nutrition_category.json', 'w', encoding='utf-8') as f:
-            json.dump([new_category], f, ensure_ascii=False, indent=4)
-        return new_category
     except Exception as e:
         print(f"Error adding nutrition category: {e}")
         return None
 
+@_transactional('dish')
 def add_dish(name, image_url, required_ingredients, required_cooking_method_ids, nutrition_data=None, cooking_instructions=None):
     """Add a dish.
 
@@ -341,70 +969,17 @@ def add_dish(name, image_url, required_ingredients, required_cooking_method_ids,
     - nutrition_data: list of nutrient dicts (each with 'name' and 'amount_per_unit_mass')
     - cooking_instructions: optional dict of language codes to instructions
     """
-    data = _load_table('dish')
     new_id = _get_next_id('dish')
 
     # If nutrition_data was provided explicitly, use it.
-    # Otherwise, compute totals based on required_ingredients which include amounts.
-    final_nutrition = []
+    # Otherwise, compute per-gram values from required_ingredients, which include amounts.
+    # Either way the per-serving totals (mass, nutrients, calories) are stored with the dish.
     if nutrition_data:
-        final_nutrition = nutrition_data
+        derived = nutrition_engine.serving_fields(
+            nutrition_data, get_dish_total_mass({'required_ingredients': required_ingredients}))
+        derived['nutrition_info'] = nutrition_data
     else:
-        # Load nutrition categories to ensure we return a complete list (including zeros)
-        try:
-            with open('nutrition_category.json', 'r', encoding='utf-8') as f:
-                categories = [c.get('name') for c in __import__('json').load(f)]
-        except Exception:
-            categories = []
-
-        # Initialize sums for all categories
-        nutrient_sums = {cat: 0.0 for cat in categories}
-        total_mass_g = 0.0
-
-        # Sum nutrients by name and calculate total mass
-        for req in required_ingredients:
-            item_id = req.get('id')
-            item_type = req.get('type', 'ingredient') # Default to ingredient
-            amount = req.get('amount_g', 0)
-            total_mass_g += amount
-
-            if item_type == 'ingredient':
-                ing_nut = get_ingredient_nutrition(item_id) or []
-                for nutr in ing_nut:
-                    nutr_name = nutr.get('name')
-                    per_g = nutr.get('amount_per_unit_mass', 0)
-                    added = per_g * amount
-                    if nutr_name in nutrient_sums:
-                        nutrient_sums[nutr_name] += added
-                    else:
-                        nutrient_sums[nutr_name] = nutrient_sums.get(nutr_name, 0.0) + added
-            elif item_type == 'dish':
-                sub_dish = next((d for d in data if d['id'] == item_id), None)
-                if sub_dish:
-                    sub_dish_nut = sub_dish.get('nutrition_info', [])
-                    for nutr in sub_dish_nut:
-                        nutr_name = nutr.get('name')
-                        # Sub-dish nutrition is now stored as amount_per_unit_mass
-                        per_g = nutr.get('amount_per_unit_mass', 0)
-                        added = per_g * amount
-                        if nutr_name in nutrient_sums:
-                            nutrient_sums[nutr_name] += added
-                        else:
-                            nutrient_sums[nutr_name] = nutrient_sums.get(nutr_name, 0.0) + added
-
-        # Convert total sums to per-gram values
-        final_nutrition = []
-        seen = set()
-        for cat in categories:
-            total_val = nutrient_sums.get(cat, 0.0)
-            per_g_val = total_val / total_mass_g if total_mass_g > 0 else 0.0
-            out_name = cat if cat != 'Calories' else 'Calories (Total)'
-            final_nutrition.append({"name": out_name, "amount_per_unit_mass": per_g_val})
-            seen.add(out_name)
-        for k, v in nutrient_sums.items():
-            if k not in seen and k != 'Calories':
-                per_g_val = v / total_mass_g if total_mass_g > 0 else 0.0
-                final_nutrition.append({"name": k, "amount_per_unit_mass": per_g_val})
+        derived = _compute_dish_fields(required_ingredients)
 
     new_item = {
         "id": new_id,
@@ -412,11 +987,13 @@ def add_dish(name, image_url, required_ingredients, required_cooking_method_ids,
         "image_url": image_url,
         "required_ingredients": required_ingredients,
         "cooking_instructions": cooking_instructions,
-        "nutrition_info": final_nutrition,
-        "cooking-method-ids": required_cooking_method_ids
+        "nutrition_info": derived['nutrition_info'],
+        "cooking-method-ids": required_cooking_method_ids,
+        "total_mass_g": derived['total_mass_g'],
+        "nutrition_totals": derived['nutrition_totals'],
+        "calories": derived['calories']
     }
-    data.append(new_item)
-    _save_table('dish', data)
+    _append_rows('dish', [new_item])
     # name may sometimes be a plain string (legacy callers); handle both dict and str
     try:
         display_name = name.get('kor') if isinstance(name, dict) else str(name)
@@ -425,6 +1002,7 @@ def add_dish(name, image_url, required_ingredients, required_cooking_method_ids,
     print(f"New dish '{display_name or 'N/A'}' added with ID {new_id}.")
     return new_id
 
+@_transactional('dish')
 def update_dish(dish_id, name, image_url, required_ingredients, required_cooking_method_ids,
               nutrition_data=None, cooking_instructions=None):
     """Update an existing dish.
@@ -437,73 +1015,30 @@ def update_dish(dish_id, name, image_url, required_ingredients, required_cooking
     - required_cooking_method_ids: list of cooking method ids
     - nutrition_data: list of nutrient dicts (each with 'name' and 'amount_per_unit_mass')
     - cooking_instructions: optional dict of language codes to instructions
+
+    Dishes that use this one as a sub-dish (directly or nested) are recalculated
+    in the same save. Raises DishCycleError if a sub-dish already uses this dish.
     """
-    data = _load_table('dish')
-    dish = next((item for item in data if item['id'] == dish_id), None)
+    # Only the dish and the dishes built on it can change
+    changed_ids = [dish_id, *_dependent_dish_ids(dish_ids=[dish_id])]
+    data = _copy_for_update('dish', changed_ids)
+    pos = _record_position('dish', dish_id)
+    dish = data[pos] if pos is not None else None
     if not dish:
         raise ValueError(f"Dish with ID {dish_id} not found")
+    _check_sub_dish_cycle(dish_id, required_ingredients)
 
     # If nutrition_data was provided explicitly, use it.
-    # Otherwise, compute totals based on required_ingredients which include amounts.
-    final_nutrition = []
+    # Otherwise, compute per-gram values from required_ingredients, which include amounts.
+    # Either way the per-serving totals (mass, nutrients, calories) are stored with the dish.
     if nutrition_data:
-        final_nutrition = nutrition_data
+        derived = nutrition_engine.serving_fields(
+            nutrition_data, get_dish_total_mass({'required_ingredients': required_ingredients}))
+        derived['nutrition_info'] = nutrition_data
     else:
-        # Load nutrition categories to ensure we return a complete list (including zeros)
-        try:
-            with open('nutrition_category.json', 'r', encoding='utf-8') as f:
-                categories = [c.get('name') for c in __import__('json').load(f)]
-        except Exception:
-            categories = []
-
-        # Initialize sums for all categories
-        nutrient_sums = {cat: 0.0 for cat in categories}
-        total_mass_g = 0.0
-
-        # Sum nutrients by name and calculate total mass
-        for req in required_ingredients:
-            item_id = req.get('id')
-            item_type = req.get('type', 'ingredient') # Default to ingredient
-            amount = req.get('amount_g', 0)
-            total_mass_g += amount
-
-            if item_type == 'ingredient':
-                ing_nut = get_ingredient_nutrition(item_id) or []
-                for nutr in ing_nut:
-                    nutr_name = nutr.get('name')
-                    per_g = nutr.get('amount_per_unit_mass', 0)
-                    added = per_g * amount
-                    if nutr_name in nutrient_sums:
-                        nutrient_sums[nutr_name] += added
-                    else:
-                        nutrient_sums[nutr_name] = nutrient_sums.get(nutr_name, 0.0) + added
-            elif item_type == 'dish':
-                sub_dish = next((d for d in data if d['id'] == item_id), None)
-                if sub_dish:
-                    sub_dish_nut = sub_dish.get('nutrition_info', [])
-                    for nutr in sub_dish_nut:
-                        nutr_name = nutr.get('name')
-                        # Sub-dish nutrition is now stored as amount_per_unit_mass
-                        per_g = nutr.get('amount_per_unit_mass', 0)
-                        added = per_g * amount
-                        if nutr_name in nutrient_sums:
-                            nutrient_sums[nutr_name] += added
-                        else:
-                            nutrient_sums[nutr_name] = nutrient_sums.get(nutr_name, 0.0) + added
-
-        # Convert total sums to per-gram values
-        final_nutrition = []
-        seen = set()
-        for cat in categories:
-            total_val = nutrient_sums.get(cat, 0.0)
-            per_g_val = total_val / total_mass_g if total_mass_g > 0 else 0.0
-            out_name = cat if cat != 'Calories' else 'Calories (Total)'
-            final_nutrition.append({"name": out_name, "amount_per_unit_mass": per_g_val})
-            seen.add(out_name)
-        for k, v in nutrient_sums.items():
-            if k not in seen and k != 'Calories':
-                per_g_val = v / total_mass_g if total_mass_g > 0 else 0.0
-                final_nutrition.append({"name": k, "amount_per_unit_mass": per_g_val})
+        derived = _compute_dish_fields(required_ingredients)
+
+    nutrition_changed = dish.get('nutrition_info') != derived['nutrition_info']
 
     # Update the dish
     dish.update({
@@ -511,45 +1046,167 @@ def update_dish(dish_id, name, image_url, required_ingredients, required_cooking
         "image_url": image_url,
         "required_ingredients": required_ingredients,
         "cooking_instructions": cooking_instructions,
-        "nutrition_info": final_nutrition,
-        "cooking-method-ids": required_cooking_method_ids
+        "nutrition_info": derived['nutrition_info'],
+        "cooking-method-ids": required_cooking_method_ids,
+        "total_mass_g": derived['total_mass_g'],
+        "nutrition_totals": derived['nutrition_totals'],
+        "calories": derived['calories']
     })
 
-    _save_table('dish', data)
+    if nutrition_changed:
+        _propagate_nutrition(data, get_id_map('ingredient'), dish_ids=[dish_id])
+
+    _save_table('dish', data, changed_ids=changed_ids)
     dish_name = name.get('kor', 'N/A') if isinstance(name, dict) else str(name)
     print(f"Dish '{dish_name}' (ID: {dish_id}) updated.")
 
+def _sub_dish_path(start_id, target_id):
+    """Dish ids from start_id down through sub-dishes to target_id (BFS), or None."""
+    previous = {start_id: None}
+    queue = [start_id]
+    for dish_id in queue:
+        if dish_id == target_id:
+            path = []
+            while dish_id is not None:
+                path.append(dish_id)
+                dish_id = previous[dish_id]
+            return path[::-1]
+        dish = get_record('dish', dish_id)
+        for sub_id in nutrition_engine.sub_dish_ids(dish or {}):
+            if sub_id not in previous:
+                previous[sub_id] = dish_id
+                queue.append(sub_id)
+    return None
+
+def _check_sub_dish_cycle(dish_id, required_ingredients):
+    """Raise DishCycleError if giving `dish_id` these sub-dishes would make it contain itself."""
+    users = {row['id'] for row in get_parent_dishes(dish_id, transitive=True)}
+    for req in required_ingredients:
+        sub_id = req.get('id')
+        if _required_item_type(req) != 'dish' or (sub_id != dish_id and sub_id not in users):
+            continue
+        path = _sub_dish_path(sub_id, dish_id) or [sub_id, dish_id]
+        raise DishCycleError([dish_id] + path)
+
+def _ingredient_nutrition(ingredient):
+    """Embedded nutrition, or the legacy nutrition.json entry (see get_ingredient_nutrition)."""
+    if 'nutrition' in ingredient:
+        return ingredient['nutrition']
+    return get_ingredient_nutrition(ingredient.get('id')) or []
+
+def _compute_dish_fields(required_ingredients):
+    """nutrition_info and per-serving fields for a dish made of `required_ingredients` (current tables)."""
+    return nutrition_engine.compute_dish_fields(
+        [{'required_ingredients': required_ingredients}], get_id_map('ingredient'), get_id_map('dish'),
+        ingredient_nutrition=_ingredient_nutrition)[0]
+
+def recalculate_all_dish_nutrition(dishes, all_ingredients, all_dishes=None):
+    """Recalculate nutrition_info, total_mass_g, nutrition_totals and calories of many
+    dishes in one vectorized batch (updates them in place).
+
+    all_ingredients / all_dishes may be lists or {id: record} maps; all_dishes
+    defaults to `dishes` and is where sub-dishes are looked up. Dishes are
+    computed in dependency order; raises DishCycleError (nothing is updated)
+    if they use each other in a cycle.
+    """
+    ingredient_map = all_ingredients if isinstance(all_ingredients, dict) else {ing['id']: ing for ing in all_ingredients}
+    if all_dishes is None:
+        all_dishes = dishes
+    dish_map = all_dishes if isinstance(all_dishes, dict) else {d['id']: d for d in all_dishes}
+    results = nutrition_engine.compute_dish_fields(dishes, ingredient_map, dish_map,
+                                                   ingredient_nutrition=_ingredient_nutrition)
+    for dish, fields in zip(dishes, results):
+        dish.update(fields)
+    return dishes
+
 def recalculate_dish_nutrition(dish, all_ingredients, all_dishes):
-    """Recalculates the nutrition for a single dish based on its ingredients."""
-    nutrient_sums = {}
-    total_mass_g = 0.0
-
-    for req in dish.get('required_ingredients', []):
-        item_id = req.get('id')
-        item_type = req.get('type', 'ingredient')
-        amount = req.get('amount_g', 0)
-        total_mass_g += amount
-
-        if item_type == 'ingredient':
-            ingredient = next((ing for ing in all_ingredients if ing['id'] == item_id), None)
-            if ingredient:
-                for nutr in ingredient.get('nutrition', []):
-                    nutr_name = nutr.get('name')
-                    per_g = nutr.get('amount_per_unit_mass', 0)
-                    nutrient_sums[nutr_name] = nutrient_sums.get(nutr_name, 0.0) + (per_g * amount)
-        elif item_type == 'dish':
-            sub_dish = next((d for d in all_dishes if d['id'] == item_id), None)
-            if sub_dish:
-                for nutr in sub_dish.get('nutrition_info', []):
-                    nutr_name = nutr.get('name')
-                    per_g = nutr.get('amount_per_unit_mass', 0)
-                    nutrient_sums[nutr_name] = nutrient_sums.get(nutr_name, 0.0) + (per_g * amount)
-
-    final_nutrition = []
-    for name, total_val in nutrient_sums.items():
-        per_g_val = total_val / total_mass_g if total_mass_g > 0 else 0.0
-        output_name = 'Calories (Total)' if name == 'Calories' else name
-        final_nutrition.append({"name": output_name, "amount_per_unit_mass": per_g_val})
-
-    dish['nutrition_info'] = final_nutrition
+    """Recalculates the nutrition for a single dish based on its ingredients.
+
+    all_ingredients / all_dishes may be lists or {id: record} maps. To recalculate
+    many dishes use recalculate_all_dish_nutrition(), which computes them in one batch.
+    """
+    recalculate_all_dish_nutrition([dish], all_ingredients, all_dishes)
     return dish
+
+# Startup bookkeeping for derived dish nutrition (see refresh_dish_nutrition)
+NUTRITION_STATE_FILE = 'nutrition_state.json'
+NUTRITION_STATE_FORMAT = 2
+
+def _digest(value):
+    return hashlib.blake2b(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8'),
+                           digest_size=8).hexdigest()
+
+def get_nutrition_inputs_fingerprint():
+    """Content hash of the ingredient and dish tables and nutrition_category.json, as stored."""
+    backend = storage_backend.get_backend()
+    digest = hashlib.blake2b(digest_size=16)
+    for table_name in ('ingredient', 'dish'):
+        digest.update(backend.content_hash(table_name, DATA_FILES[table_name]).encode('ascii'))
+    try:
+        with open(nutrition_engine.CATEGORY_FILE, 'rb') as f:
+            digest.update(f.read())
+    except FileNotFoundError:
+        pass
+    return digest.hexdigest()
+
+def _nutrition_record_hashes(ingredients, dishes):
+    """Per-record hashes of what dish nutrition is derived from (and of the stored result)."""
+    return {
+        'categories': _digest(list(nutrition_engine.get_category_columns())),
+        'ingredients': {str(ing['id']): _digest(_ingredient_nutrition(ing)) for ing in ingredients},
+        'dishes': {str(dish['id']): _digest([dish.get('required_ingredients', []), dish.get('nutrition_info'),
+                                             dish.get('total_mass_g'), dish.get('nutrition_totals')])
+                   for dish in dishes}
+    }
+
+def _load_nutrition_state():
+    try:
+        with open(NUTRITION_STATE_FILE, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return state if state.get('format') == NUTRITION_STATE_FORMAT else None
+
+def refresh_dish_nutrition():
+    """Bring the derived dish nutrition up to date; meant to run once at startup.
+
+    Returns 'unchanged' when the inputs fingerprint matches the one saved by the
+    previous run (nothing is loaded or written), 'incremental' when only dishes
+    affected by changed ingredients/dishes were recalculated, or 'full'.
+    """
+    state = _load_nutrition_state()
+    if state is not None and state.get('fingerprint') == get_nutrition_inputs_fingerprint():
+        return 'unchanged'
+
+    with unit_of_work('ingredient', 'dish') as uow:
+        ingredients = get_table('ingredient')
+        dishes = uow.load('dish')
+        hashes = _nutrition_record_hashes(ingredients, dishes)
+        if state is None or state.get('categories') != hashes['categories']:
+            mode = 'full'
+            recalculate_all_dish_nutrition(dishes, get_id_map('ingredient'))
+            uow.save('dish')
+        else:
+            mode = 'incremental'
+            changed_ingredients = [ing['id'] for ing in ingredients
+                                   if state['ingredients'].get(str(ing['id'])) != hashes['ingredients'][str(ing['id'])]]
+            changed_dishes = [dish['id'] for dish in dishes
+                              if state['dishes'].get(str(dish['id'])) != hashes['dishes'][str(dish['id'])]]
+            if changed_ingredients or changed_dishes:
+                dish_map = {dish['id']: dish for dish in dishes}
+                recalculate_all_dish_nutrition([dish_map[dish_id] for dish_id in changed_dishes],
+                                               get_id_map('ingredient'), dish_map)
+                _propagate_nutrition(dishes, get_id_map('ingredient'),
+                                     ingredient_ids=changed_ingredients, dish_ids=changed_dishes)
+                uow.save('dish')
+        hashes = _nutrition_record_hashes(ingredients, dishes)
+
+    backend = storage_backend.get_backend()
+    if hasattr(backend, 'compact'):
+        # Startup folds logs into snapshots; do it now so the stored bytes match next time
+        backend.compact('dish', DATA_FILES['dish'])
+    # Fingerprint the tables as saved, so the next start can skip all of this
+    hashes['format'] = NUTRITION_STATE_FORMAT
+    hashes['fingerprint'] = get_nutrition_inputs_fingerprint()
+    storage_backend.atomic_write_json(NUTRITION_STATE_FILE, hashes)
+    return mode
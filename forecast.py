@@ -0,0 +1,211 @@
+"""
+forecast.py - 재고 소진 및 유통기한 폐기 예측
+
+Projects the stock of every ingredient day by day over a mission horizon:
+- Daily consumption rates come from the crew's food_timeline. The servings
+  logged over the last HISTORY_DAYS days are expanded into base ingredients
+  (bom.expand_dish) and averaged per day.
+- Lots are consumed first-expiring-first-out at that rate, as lot_allocator
+  does. Storage lots are available now and stop being usable after their
+  expiration date; stock left in a lot that has already expired is waste,
+  and the allocator does not draw from it. Production lots arrive at their
+  max_end_date (worst case) and do not expire within the forecast.
+
+With a constant rate, each lot's consumption window has a closed form. Lots
+of all ingredients are laid out in an (ingredients x lots) array in FEFO
+order, and one vectorized step per lot column gives when each lot starts and
+ends, how much of it expires unused, and where stock first runs out. The daily
+stock curve is then one broadcast over (ingredients x days).
+
+The result is cached until the lots, the timelines or the dishes change.
+
+    result = forecast.get_forecast()
+    result['stockout']['i1']     # '2027-03-02', or None if stock lasts the horizon
+    result['waste'][12]          # grams of lot 12 expected to expire unused
+"""
+
+import math
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import bom
+import database_handler as db
+import storage_timeline
+import user_db_handler
+
+HORIZON_DAYS = 1000
+HISTORY_DAYS = 30
+
+# Unserved demand below this many grams is float dust
+EPSILON_G = 1e-6
+
+_FORECAST_CACHE = {'key': None, 'result': None}
+_FORECAST_LOCK = threading.Lock()
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def consumption_rates(users, today, history_days=HISTORY_DAYS):
+    """{ingredient id: grams per day} from the servings logged in the last `history_days` days.
+
+    The average runs from the first logged day in the window to today, so a
+    short history is not diluted by days before the crew started logging.
+    """
+    window_start = today - timedelta(days=history_days - 1)
+    servings = {}
+    first_day = None
+    for user in users:
+        for entry in user.get('food_timeline', []):
+            day = _parse_date(entry.get('date'))
+            if day is None or not window_start <= day <= today:
+                continue
+            first_day = day if first_day is None else min(first_day, day)
+            for intake_item in entry.get('intake', []):
+                dish_id = intake_item.get('dish_id')
+                servings[dish_id] = servings.get(dish_id, 0) + 1
+    if not servings:
+        return {}
+
+    days = (today - first_day).days + 1
+    rates = {}
+    for dish_id, count in servings.items():
+        try:
+            grams = bom.expand_dish(dish_id)
+        except db.DishCycleError:
+            continue
+        for ingredient_id, amount in grams.items():
+            rates[ingredient_id] = rates.get(ingredient_id, 0.0) + amount * count / days
+    return rates
+
+
+def _lot_table(lots, today):
+    """Per ingredient, its lots as (sort key, lot id, mass, arrival day, expiry day) in FEFO order."""
+    by_ingredient = {}
+    for lot in lots:
+        ingredient_id = lot.get('storage-id')
+        mass = lot.get('mass_g', 0) or 0
+        if not ingredient_id or mass <= 0:
+            continue
+        if lot.get('mode') == 'production':
+            finish = storage_timeline.parse_lot(lot)['max_end']
+            arrival = max(0, (finish - today).days) if finish else 0
+            expiry = math.inf
+        elif lot.get('mode') == 'storage':
+            arrival = 0
+            expiration = storage_timeline.parse_lot(lot)['expiration']
+            # Usable through the expiration date itself (storage_timeline.usable_on, as allocated)
+            expiry = (expiration - today).days + 1 if expiration else math.inf
+        else:
+            continue
+        by_ingredient.setdefault(ingredient_id, []).append(((expiry, arrival, str(lot.get('id'))),
+                                                            lot.get('id'), mass, arrival, expiry))
+    for entries in by_ingredient.values():
+        entries.sort(key=lambda entry: entry[0])
+    return by_ingredient
+
+
+def project(lots, rates, today, horizon_days=HORIZON_DAYS):
+    """Forecast for `lots` (storaged-ingredient rows) consumed at `rates` ({ingredient id: g/day}).
+
+    Returns a dict with start (date), horizon_days, ingredient_ids, rates_g_per_day
+    and stock_g ((ingredients x horizon_days + 1) array, day 0 = today), unmet_g
+    (same shape: cumulative demand the lots could not serve), stockout
+    ({ingredient id: first day without stock as 'YYYY-MM-DD', or None}) and
+    waste ({lot id: grams expected to expire unused within the horizon}).
+    """
+    lot_table = _lot_table(lots, today)
+    ingredient_ids = list(lot_table) + [i for i in rates if i not in lot_table]
+    count = len(ingredient_ids)
+    width = max((len(entries) for entries in lot_table.values()), default=0)
+
+    mass = np.zeros((count, width))
+    arrival = np.zeros((count, width))
+    expiry = np.full((count, width), np.inf)
+    valid = np.zeros((count, width), dtype=bool)
+    lot_ids = [[None] * width for _ in range(count)]
+    for row, ingredient_id in enumerate(ingredient_ids):
+        for col, (_, lot_id, lot_mass, lot_arrival, lot_expiry) in enumerate(lot_table.get(ingredient_id, ())):
+            mass[row, col] = lot_mass
+            arrival[row, col] = lot_arrival
+            expiry[row, col] = lot_expiry
+            valid[row, col] = True
+            lot_ids[row][col] = lot_id
+    rate = np.array([rates.get(ingredient_id, 0.0) for ingredient_id in ingredient_ids])
+    consuming = rate > 0
+    safe_rate = np.where(consuming, rate, 1.0)
+
+    # FEFO: lot k is drawn from once the earlier-expiring lots are used up or expired
+    start = np.zeros((count, width))
+    waste = np.zeros((count, width))
+    stock_end = np.zeros(count)  # when the lots so far stop supplying stock
+    stockout = np.full(count, np.inf)
+    for col in range(width):
+        v = valid[:, col]
+        gap = v & consuming & (arrival[:, col] > stock_end)
+        stockout = np.where(gap & np.isinf(stockout), stock_end, stockout)
+        s = np.where(v, np.maximum(stock_end, arrival[:, col]), stock_end)
+        run_out = np.where(consuming, s + mass[:, col] / safe_rate, np.inf)
+        end = np.minimum(expiry[:, col], run_out)
+        used = np.clip(rate * np.where(consuming, end - s, 0.0), 0, mass[:, col])
+        expires_unused = v & (expiry[:, col] <= horizon_days) & (expiry[:, col] < run_out)
+        waste[:, col] = np.where(expires_unused, mass[:, col] - used, 0.0)
+        start[:, col] = s
+        # Lots of ingredients that are not consumed never end; their stock_end stays 0
+        stock_end = np.where(v & consuming, np.maximum(s, end), stock_end)
+    stockout = np.where(np.isinf(stockout) & consuming, stock_end, stockout)
+
+    # Daily stock: each lot holds its mass from arrival, minus what was drawn since its start, until expiry
+    days = np.arange(horizon_days + 1, dtype=float)
+    stock = np.zeros((count, horizon_days + 1))
+    served = np.zeros((count, horizon_days + 1))
+    for col in range(width):
+        # Drawing stops at expiry
+        elapsed = np.where(consuming[:, None],
+                           np.minimum(days[None, :], expiry[:, col, None]) - start[:, col, None], 0.0)
+        drawn = np.where(valid[:, col, None], np.clip(rate[:, None] * elapsed, 0, mass[:, col, None]), 0.0)
+        served += drawn
+        present = valid[:, col, None] & (days[None, :] >= arrival[:, col, None]) & (days[None, :] < expiry[:, col, None])
+        stock += np.where(present, mass[:, col, None] - drawn, 0.0)
+    # Demand the lots could not serve, cumulative from today (float dust below EPSILON_G dropped)
+    unmet = np.maximum(rate[:, None] * days[None, :] - served - EPSILON_G, 0.0)
+
+    stockout_dates = {}
+    for ingredient_id, day in zip(ingredient_ids, stockout.tolist()):
+        stockout_dates[ingredient_id] = (today + timedelta(days=math.floor(day))).isoformat() \
+            if day <= horizon_days else None
+    lot_waste = {}
+    for row in range(count):
+        for col in range(width):
+            if valid[row, col]:
+                lot_waste[lot_ids[row][col]] = waste[row, col].item()
+
+    return {
+        'start': today,
+        'horizon_days': horizon_days,
+        'ingredient_ids': ingredient_ids,
+        'rates_g_per_day': rate,
+        'stock_g': stock,
+        'unmet_g': unmet,
+        'stockout': stockout_dates,
+        'waste': lot_waste,
+    }
+
+
+def get_forecast(horizon_days=HORIZON_DAYS, history_days=HISTORY_DAYS):
+    """Forecast for the current lots and crew history (cached until either changes). Do not modify."""
+    today = datetime.now().date()
+    key = (db.get_table_version('storaged-ingredient'), db.get_table_version(user_db_handler.USER_TABLE),
+           db.get_table_version('dish'), today, horizon_days, history_days)
+    with _FORECAST_LOCK:
+        if _FORECAST_CACHE['key'] != key:
+            rates = consumption_rates(db.get_table(user_db_handler.USER_TABLE), today, history_days)
+            _FORECAST_CACHE['result'] = project(db.get_table('storaged-ingredient'), rates, today, horizon_days)
+            _FORECAST_CACHE['key'] = key
+        return _FORECAST_CACHE['result']
@@ -0,0 +1,63 @@
+"""
+intake_totals.py - 사용자별 날짜별 섭취 영양 합계
+
+Each user record keeps 'daily_totals': {date: {nutrient name: amount}}, the
+summed per-serving nutrition_totals of the dishes logged on that date.
+add_intake adds one dish to the aggregate when it appends the intake, so the
+dashboard reads today's totals with one lookup instead of walking the
+timeline and recomputing every dish.
+
+Totals are taken from the dish as it was when the intake was logged. Users
+saved before the aggregate existed are filled in by
+scripts/backfill_daily_totals.py. Until then, the totals of a date are
+computed from the timeline on read.
+"""
+
+import database_handler as db
+
+DAILY_TOTALS_FIELD = 'daily_totals'
+
+
+def _dish_totals(dish_id):
+    dish = db.get_record('dish', dish_id)
+    if not dish or 'nutrition_info' not in dish:
+        return {}
+    return db.get_dish_totals(dish)[1]
+
+
+def _add_dish(totals, dish_id):
+    for name, amount in _dish_totals(dish_id).items():
+        totals[name] = totals.get(name, 0) + amount
+
+
+def add_intake(user, date, dish_id):
+    """Add one serving of a dish to the user's totals for `date` (mutates the user record).
+
+    Call after the intake was appended to food_timeline.
+    """
+    if user.get(DAILY_TOTALS_FIELD) is None:
+        # First intake since the aggregate was introduced: the timeline already holds it
+        user[DAILY_TOTALS_FIELD] = compute_daily_totals(user)
+        return
+    _add_dish(user[DAILY_TOTALS_FIELD].setdefault(date, {}), dish_id)
+
+
+def compute_daily_totals(user, dates=None):
+    """{date: totals} recomputed from the user's food_timeline (optionally only for `dates`)."""
+    daily_totals = {}
+    for entry in user.get('food_timeline', []):
+        date = entry.get('date')
+        if dates is not None and date not in dates:
+            continue
+        totals = daily_totals.setdefault(date, {})
+        for intake_item in entry.get('intake', []):
+            _add_dish(totals, intake_item.get('dish_id'))
+    return daily_totals
+
+
+def get_daily_totals(user, date):
+    """Nutrient totals the user logged on `date` ({} when nothing was logged). Do not modify."""
+    daily_totals = user.get(DAILY_TOTALS_FIELD)
+    if daily_totals is None:
+        return compute_daily_totals(user, dates={date}).get(date, {})
+    return daily_totals.get(date, {})
@@ -0,0 +1,127 @@
+"""
+inventory_ledger.py - 재고 원장 (추가 전용 이벤트 기록)
+
+Every stock movement is an event appended to the 'inventory-ledger' table:
+- receipt                 a new lot ('lot': the full storaged-ingredient row)
+- production_completion   a production lot becomes a storage lot
+                          ('lot_id', 'expiration_date', optional 'mass_g' yield)
+- consumption             grams taken from a storage lot ('lot_id', 'mass_g')
+- adjustment              a correction of a lot's mass ('lot_id', 'delta_g', 'reason')
+- checkpoint              the state of every lot at that point ('lots')
+
+Rows carry an increasing 'id' and the time they were recorded ('at', ISO
+format). The storaged-ingredient table is the current state of the ledger:
+database_handler applies each event with apply_event() to the lots in the
+same transaction that appends it. The first event of a ledger is an opening
+checkpoint of the lots that existed before the ledger.
+
+A checkpoint is appended every CHECKPOINT_INTERVAL events. The state as of a
+time starts from the last checkpoint at or before it and replays only the
+events after that checkpoint.
+
+This module only works on rows; reading and writing tables is done by
+database_handler.
+"""
+
+import bisect
+from datetime import datetime
+
+RECEIPT = 'receipt'
+PRODUCTION_COMPLETION = 'production_completion'
+CONSUMPTION = 'consumption'
+ADJUSTMENT = 'adjustment'
+CHECKPOINT = 'checkpoint'
+
+CHECKPOINT_INTERVAL = 200
+
+# Consumption may leave float dust; amounts this close count as available
+EPSILON_G = 1e-9
+
+
+def now():
+    """Timestamp stored in 'at' (sorts in time order as a string)."""
+    return datetime.now().isoformat(timespec='microseconds')
+
+
+def _lot(lots, event):
+    lot = lots.get(event.get('lot_id'))
+    if lot is None:
+        raise ValueError(f"Storage lot {event.get('lot_id')} does not exist.")
+    return lot
+
+
+def apply_event(lots, event):
+    """Apply one ledger event to {lot id: lot row} in place. Invalid events raise ValueError."""
+    kind = event.get('type')
+    if kind == RECEIPT:
+        lot = dict(event['lot'])
+        lots[lot['id']] = lot
+    elif kind == PRODUCTION_COMPLETION:
+        lot = _lot(lots, event)
+        if lot.get('mode') != 'production':
+            raise ValueError(f"Storage lot {lot['id']} is not in production.")
+        lot['mode'] = 'storage'
+        lot['expiration_date'] = event.get('expiration_date')
+        if event.get('mass_g') is not None:
+            lot['mass_g'] = event['mass_g']
+        for field in ('min_end_date', 'max_end_date'):
+            lot.pop(field, None)
+    elif kind == CONSUMPTION:
+        lot = _lot(lots, event)
+        grams = event.get('mass_g', 0)
+        if lot.get('mode') != 'storage':
+            raise ValueError(f"Storage lot {lot['id']} is not in storage.")
+        if (lot.get('mass_g', 0) or 0) + EPSILON_G < grams:
+            raise ValueError(f"Storage lot {lot['id']} holds less than {grams} g.")
+        lot['mass_g'] = max(0, lot['mass_g'] - grams)
+    elif kind == ADJUSTMENT:
+        lot = _lot(lots, event)
+        lot['mass_g'] = max(0, (lot.get('mass_g', 0) or 0) + event.get('delta_g', 0))
+    elif kind == CHECKPOINT:
+        lots.clear()
+        lots.update((lot['id'], dict(lot)) for lot in event.get('lots', []))
+    else:
+        raise ValueError(f"Unknown inventory event type: {kind!r}")
+
+
+def checkpoint_event(lots):
+    """A checkpoint of the given lot rows (in table order)."""
+    return {'type': CHECKPOINT, 'lots': [dict(lot) for lot in lots]}
+
+
+def checkpoint_positions(rows):
+    """(times, positions) of the checkpoint rows of a ledger, in ledger order."""
+    times, positions = [], []
+    for pos, row in enumerate(rows):
+        if row.get('type') == CHECKPOINT:
+            times.append(row.get('at'))
+            positions.append(pos)
+    return times, positions
+
+
+def cut_times(times, length):
+    """Checkpoint times cut to `length` characters, the precision of an as_of value."""
+    return [(t or '')[:length] for t in times]
+
+
+def state_as_of(rows, checkpoints, as_of):
+    """{lot id: lot row} as recorded up to `as_of` (a date 'YYYY-MM-DD' or an ISO timestamp).
+
+    checkpoints is checkpoint_positions(rows) with the times already cut to
+    len(as_of) characters (cut_times()), so callers can keep them between
+    queries. A date includes the whole day. Returns {} before the first event.
+    """
+    times, positions = checkpoints
+
+    def _until(at):
+        return (at or '')[:len(as_of)] <= as_of
+
+    # Last checkpoint recorded at or before as_of ('at' increases along the ledger)
+    index = bisect.bisect_right(times, as_of) - 1
+    start = positions[index] if index >= 0 else 0
+    lots = {}
+    for row in rows[start:]:
+        if not _until(row.get('at')):
+            break
+        apply_event(lots, row)
+    return lots
@@ -0,0 +1,174 @@
+"""
+lot_allocator.py - 선입선출(FEFO) 재고 배치 할당
+
+Stock of one ingredient can be spread over several storage lots. The
+allocator keeps, per ingredient, a heap of the lots in mode 'storage' that
+hold stock. Lots are ordered by expiration date (expiration_date, or
+start_date + shelf_life), then start_date, then id; lots without one come
+last. A request is split across lots first-expiring-first-out. Lots that have
+expired by the consumption date are skipped (storage_timeline.usable_on):
+their stock is waste, as forecast counts it.
+
+allocate() returns a plan of (lot id, ingredient id, grams) steps plus the
+missing amounts. It touches only the lots it draws from: k lots cost
+O(k log n). consume() then records the whole plan as consumption events in
+the inventory ledger, inside the caller's transaction, so the deduction
+commits atomically with whatever else the caller writes.
+
+The heaps follow the ledger instead of being rebuilt on every stock change.
+Lot masses are read when a lot is drawn from, so consumptions and
+adjustments need no heap update. Lots the new ledger events bring into stock
+are pushed, and empty or expired lots are dropped when they reach the top of
+a heap. The heaps are only rebuilt (heapify) when storaged-ingredient
+changed outside the ledger, when ledger rows the heaps followed were rolled
+back, and once when the first ledger rows are written.
+
+    plan, missing = lot_allocator.allocate({'i1': 250, 'i2': 40}, as_of='2026-10-17')
+    if not missing:
+        lot_allocator.consume(plan, dish_id='d3')
+"""
+
+import heapq
+import threading
+from datetime import date, datetime
+
+import database_handler as db
+import inventory_ledger
+import storage_timeline
+
+# Amounts below this are treated as fully allocated (float deductions leave dust)
+EPSILON_G = inventory_ledger.EPSILON_G
+
+_HEAPS = {'storage_version': None, 'ledger_version': None, 'ledger_length': 0, 'ledger_last': None,
+          'by_ingredient': {}, 'members': set()}
+_HEAP_LOCK = threading.Lock()
+
+
+def _lot_key(lot):
+    expiration = storage_timeline.parse_lot(lot)['expiration']
+    return (expiration is None, expiration or date.max, lot.get('start_date') or '', lot.get('id'))
+
+
+def _in_stock(lot):
+    return lot is not None and lot.get('mode') == 'storage' and (lot.get('mass_g', 0) or 0) > EPSILON_G
+
+
+def _push(heaps, lot):
+    heapq.heappush(heaps['by_ingredient'].setdefault(lot.get('storage-id'), []), (_lot_key(lot), lot.get('id')))
+    heaps['members'].add(lot.get('id'))
+
+
+def _build_heaps(heaps, today):
+    by_ingredient = {}
+    members = set()
+    for lot in db.get_records_by('storaged-ingredient', 'mode', 'storage'):
+        ingredient_id = lot.get('storage-id')
+        if ingredient_id and _in_stock(lot) and storage_timeline.usable_on(lot, today):
+            by_ingredient.setdefault(ingredient_id, []).append((_lot_key(lot), lot.get('id')))
+            members.add(lot.get('id'))
+    for heap in by_ingredient.values():
+        heapq.heapify(heap)
+    heaps['by_ingredient'] = by_ingredient
+    heaps['members'] = members
+
+
+def _follow_ledger(heaps, rows):
+    """Push the lots that the ledger rows appended since the last refresh put into stock."""
+    for row in rows[heaps['ledger_length']:]:
+        kind = row.get('type')
+        if kind == inventory_ledger.CHECKPOINT:
+            continue
+        lot_id = row['lot']['id'] if kind == inventory_ledger.RECEIPT else row.get('lot_id')
+        if lot_id in heaps['members']:
+            continue
+        lot = db.get_record('storaged-ingredient', lot_id)
+        if _in_stock(lot) and lot.get('storage-id'):
+            _push(heaps, lot)
+
+
+def _heaps(today):
+    storage_version = db.get_table_version('storaged-ingredient')
+    ledger_version = db.get_table_version('inventory-ledger')
+    if _HEAPS['storage_version'] == storage_version and _HEAPS['ledger_version'] == ledger_version:
+        return _HEAPS
+    rows = db.get_table('inventory-ledger')
+    seen = _HEAPS['ledger_length']
+    # Incremental only when the stock changed through the ledger and the rows followed so far
+    # are still there (the same row objects, not rolled back or reloaded). Heaps built before
+    # the ledger had rows are rebuilt once: nothing ties them to the ledger.
+    followable = (_HEAPS['storage_version'] is not None and _HEAPS['ledger_version'] != ledger_version
+                  and 0 < seen <= len(rows) and rows[seen - 1] is _HEAPS['ledger_last'])
+    if followable:
+        _follow_ledger(_HEAPS, rows)
+    else:
+        _build_heaps(_HEAPS, today)
+    _HEAPS.update(storage_version=storage_version, ledger_version=ledger_version,
+                  ledger_length=len(rows), ledger_last=rows[-1] if rows else None)
+    return _HEAPS
+
+
+def _as_date(value):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.now().date()
+
+
+def allocate(requirements, as_of=None):
+    """Plan the lots to draw `requirements` ({ingredient id: grams}) from, first-expiring first.
+
+    as_of is the consumption date (a date or 'YYYY-MM-DD', default today); lots
+    that expired before it are not drawn from. Lots that expired before today
+    are dropped from the heaps for good, so a back-dated consume cannot use
+    them either.
+
+    Returns (plan, missing): plan is a list of (lot id, ingredient id, grams);
+    missing maps each ingredient that is short to the grams that could not be
+    allocated. A plan with missing amounts should not be applied.
+    """
+    today = datetime.now().date()
+    as_of = _as_date(as_of) if as_of is not None else today
+    plan = []
+    missing = {}
+    with _HEAP_LOCK:
+        heaps = _heaps(today)
+        for ingredient_id, amount in requirements.items():
+            remaining = amount
+            heap = heaps['by_ingredient'].get(ingredient_id, [])
+            popped = []
+            try:
+                while remaining > EPSILON_G and heap:
+                    entry = heapq.heappop(heap)
+                    lot = db.get_record('storaged-ingredient', entry[1])
+                    if not _in_stock(lot) or not storage_timeline.usable_on(lot, today):
+                        # Empty or expired for good: a later ledger event pushes it again if needed
+                        heaps['members'].discard(entry[1])
+                        continue
+                    popped.append(entry)
+                    if not storage_timeline.usable_on(lot, as_of):
+                        continue
+                    take = min(lot.get('mass_g', 0) or 0, remaining)
+                    plan.append((entry[1], ingredient_id, take))
+                    remaining -= take
+            finally:
+                # Planning does not consume: restore the heap
+                for entry in popped:
+                    heapq.heappush(heap, entry)
+            if remaining > EPSILON_G:
+                missing[ingredient_id] = remaining
+    return plan, missing
+
+
+def consume(plan, **details):
+    """Record an allocation plan as consumption events in the inventory ledger.
+
+    The whole plan commits atomically with the caller's transaction. A lot that
+    no longer holds its planned amount raises ValueError and nothing is
+    deducted. `details` (e.g. dish_id=...) are stored on every event.
+    """
+    return db.record_inventory_events([
+        dict(details, type=inventory_ledger.CONSUMPTION, lot_id=lot_id, ingredient_id=ingredient_id, mass_g=grams)
+        for lot_id, ingredient_id, grams in plan
+    ])
@@ -0,0 +1,144 @@
+"""
+makeability.py - 현재 재고로 만들 수 있는 요리 색인
+
+For every dish, the index holds how many whole servings the stored lots
+(mode 'storage', not expired as of today: storage_timeline.usable_on, the
+rule lot_allocator draws by) allow and which ingredient runs out first (the
+limiting ingredient). Requirements are the base ingredients of one serving, expanded
+through sub-dishes with bom.expand_dish(), so they match what a consume
+deducts.
+
+The index is rebuilt only when the dish table changes. When a lot changes
+(add_storaged_ingredient, a consume in add_intake, an edit) or a new day
+begins (lots may have expired), the stock per
+ingredient is compared with the previous stock, and only the dishes using an
+ingredient whose stock changed are recomputed. Reads are O(1) between changes.
+
+    makeability.get_makeability('d3')      # (servings, limiting ingredient id)
+    makeability.get_makeable_dish_ids()    # dishes with at least one serving in stock
+"""
+
+import math
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import bom
+import database_handler as db
+import storage_timeline
+
+_INDEX = {'dish_version': None, 'storage_version': None, 'day': None}
+_INDEX_LOCK = threading.RLock()
+
+
+def _stock_by_ingredient(today):
+    stock = {}
+    for lot in db.get_records_by('storaged-ingredient', 'mode', 'storage'):
+        ingredient_id = lot.get('storage-id')
+        if ingredient_id and storage_timeline.usable_on(lot, today):
+            stock[ingredient_id] = stock.get(ingredient_id, 0) + (lot.get('mass_g', 0) or 0)
+    return stock
+
+
+def _servings(needs, stock):
+    """(whole servings, limiting ingredient id); (inf, None) for a dish that needs nothing."""
+    servings, limiting = math.inf, None
+    for ingredient_id, grams in needs.items():
+        if grams > 0:
+            possible = stock.get(ingredient_id, 0) / grams
+            if possible < servings:
+                servings, limiting = possible, ingredient_id
+    if limiting is None:
+        return math.inf, None
+    # Tolerance for amounts left over by float deductions (300 g - 3 x 100 g)
+    return max(0, math.floor(servings + 1e-9)), limiting
+
+
+def _update_rows(index, rows):
+    stock = index['stock']
+    for row in rows:
+        dish_id = index['dish_ids'][row]
+        needs = index['needs'][row]
+        if needs is None:
+            servings, limiting = 0, None
+        else:
+            servings, limiting = _servings(needs, stock)
+        index['servings'][row] = servings
+        index['limiting'][row] = limiting
+        if servings >= 1:
+            index['makeable'].add(dish_id)
+        else:
+            index['makeable'].discard(dish_id)
+
+
+def _rebuild(index, today):
+    dishes = db.get_table('dish')
+    index['dish_ids'] = [dish.get('id') for dish in dishes]
+    index['rows'] = {dish_id: row for row, dish_id in enumerate(index['dish_ids'])}
+    index['needs'] = []
+    index['ingredient_rows'] = {}
+    for row, dish_id in enumerate(index['dish_ids']):
+        try:
+            needs = bom.expand_dish(dish_id)
+        except db.DishCycleError:
+            needs = None  # never makeable until the cycle is fixed
+        index['needs'].append(needs)
+        for ingredient_id in needs or ():
+            index['ingredient_rows'].setdefault(ingredient_id, []).append(row)
+    index['servings'] = np.zeros(len(dishes))
+    index['limiting'] = [None] * len(dishes)
+    index['makeable'] = set()
+    index['stock'] = _stock_by_ingredient(today)
+    _update_rows(index, range(len(dishes)))
+
+
+def _refresh_stock(index, today):
+    stock = _stock_by_ingredient(today)
+    previous = index['stock']
+    changed = [ingredient_id for ingredient_id in stock.keys() | previous.keys()
+               if stock.get(ingredient_id, 0) != previous.get(ingredient_id, 0)]
+    index['stock'] = stock
+    rows = set()
+    for ingredient_id in changed:
+        rows.update(index['ingredient_rows'].get(ingredient_id, ()))
+    _update_rows(index, rows)
+
+
+def get_index():
+    """The current index (shared: treat as read-only).
+
+    Keys: dish_version, dish_ids (dish table order), servings (float array aligned
+    with dish_ids), limiting, makeable (set of dish ids), stock ({ingredient id: g}).
+    """
+    dish_version = db.get_table_version('dish')
+    storage_version = db.get_table_version('storaged-ingredient')
+    today = datetime.now().date()
+    with _INDEX_LOCK:
+        if _INDEX['dish_version'] != dish_version:
+            _rebuild(_INDEX, today)
+        elif _INDEX['storage_version'] != storage_version or _INDEX['day'] != today:
+            _refresh_stock(_INDEX, today)
+        _INDEX['dish_version'] = dish_version
+        _INDEX['storage_version'] = storage_version
+        _INDEX['day'] = today
+        return _INDEX
+
+
+def get_makeability(dish_id):
+    """(servings, limiting ingredient id) for a dish; (0, None) for an unknown dish.
+
+    servings is the number of whole servings the stock allows (inf when the
+    dish needs no ingredients, limiting is then None).
+    """
+    index = get_index()
+    row = index['rows'].get(dish_id)
+    if row is None:
+        return 0, None
+    servings = index['servings'][row].item()
+    return (int(servings) if servings != math.inf else servings), index['limiting'][row]
+
+
+def get_makeable_dish_ids():
+    """Ids of the dishes that can be cooked at least once from current stock (shared set)."""
+    return get_index()['makeable']
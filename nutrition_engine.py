@@ -0,0 +1,274 @@
+"""
+nutrition_engine.py - 영양소 행렬 기반 요리 영양 계산
+
+Nutrient names from nutrition_category.json are interned into column indexes.
+Each ingredient becomes one row of an (ingredients x nutrients) float array of
+per-gram amounts. Each dish becomes a sparse vector of grams per ingredient,
+stored as (dish, ingredient, amount) triples. Dish totals for a whole batch are
+then a single sparse-by-dense matrix product (np.add.at over the triples),
+instead of dict loops over every nutrient of every ingredient.
+
+Sub-dishes contribute amount_g times their per-gram nutrition_info. Dishes of
+one batch are computed in dependency (topological) order, so a sub-dish in the
+batch contributes its freshly computed row, computed once however many dishes
+use it. Sub-dishes outside the batch contribute their stored nutrition_info.
+Dishes that use each other in a cycle raise DishCycleError instead of recursing.
+
+Output follows the category order, includes zeros, and names the energy
+column 'Calories (Total)'. Nutrients that are not categories are appended
+after the categories when non-zero. compute_dish_fields() also returns the
+per-serving values stored on dish records: total_mass_g, nutrition_totals
+({name: amount in one serving}) and calories.
+"""
+
+import json
+import os
+
+import numpy as np
+
+CATEGORY_FILE = 'nutrition_category.json'
+
+# Input names that share a column with a category (dishes store 'Calories (Total)')
+NAME_ALIASES = {'Calories (Total)': 'Calories'}
+# Names written to nutrition_info for category columns
+OUTPUT_NAMES = {'Calories': 'Calories (Total)'}
+CALORIES_NAME = 'Calories (Total)'
+
+_CATEGORY_CACHE = {}
+
+
+class DishCycleError(ValueError):
+    """Dishes that use each other as sub-dishes, directly or through other dishes."""
+
+    def __init__(self, cycle):
+        self.cycle = list(cycle)
+        super().__init__("Dishes form a cycle: " + " -> ".join(str(dish_id) for dish_id in self.cycle))
+
+
+def sub_dish_ids(dish):
+    """Ids of the sub-dishes listed in a dish's required_ingredients."""
+    return [req.get('id') for req in dish.get('required_ingredients', []) if req.get('type') == 'dish']
+
+
+def dependency_order(dishes):
+    """Indexes of `dishes` ordered so that every sub-dish in the list comes before the dishes using it.
+
+    Kahn's algorithm, linear in dishes + sub-dish references. Raises DishCycleError
+    with the ids of one cycle if the dishes cannot be ordered.
+    """
+    rows = {dish.get('id'): row for row, dish in enumerate(dishes) if dish.get('id') is not None}
+    subs = [[rows[sub_id] for sub_id in sub_dish_ids(dish) if sub_id in rows] for dish in dishes]
+    users = [[] for _ in dishes]
+    pending = [0] * len(dishes)
+    for row, sub_rows in enumerate(subs):
+        pending[row] = len(sub_rows)
+        for sub_row in sub_rows:
+            users[sub_row].append(row)
+
+    order = [row for row in range(len(dishes)) if pending[row] == 0]
+    for row in order:
+        for user_row in users[row]:
+            pending[user_row] -= 1
+            if pending[user_row] == 0:
+                order.append(user_row)
+
+    if len(order) < len(dishes):
+        # Every unordered dish waits on an unordered sub-dish; follow those edges until one repeats
+        row = next(r for r in range(len(dishes)) if pending[r] > 0)
+        path = []
+        seen = {}
+        while row not in seen:
+            seen[row] = len(path)
+            path.append(row)
+            row = next(sub_row for sub_row in subs[row] if pending[sub_row] > 0)
+        cycle = path[seen[row]:] + [row]
+        raise DishCycleError([dishes[r].get('id') for r in cycle])
+    return order
+
+
+def _default_ingredient_nutrition(ingredient):
+    return ingredient.get('nutrition', [])
+
+
+def get_category_columns():
+    """Category names in column order (re-read when nutrition_category.json changes)."""
+    try:
+        st = os.stat(CATEGORY_FILE)
+        signature = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        signature = None
+    if _CATEGORY_CACHE.get('signature') != signature or 'names' not in _CATEGORY_CACHE:
+        names = []
+        if signature is not None:
+            try:
+                with open(CATEGORY_FILE, 'r', encoding='utf-8') as f:
+                    names = [c.get('name') for c in json.load(f) if c.get('name')]
+            except (OSError, json.JSONDecodeError):
+                names = []
+        _CATEGORY_CACHE['names'] = tuple(names)
+        _CATEGORY_CACHE['signature'] = signature
+    return _CATEGORY_CACHE['names']
+
+
+class _Columns:
+    """Name -> column index for one computation: the categories plus any extra names seen."""
+
+    def __init__(self, categories):
+        self.names = list(categories)
+        self.category_count = len(self.names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def column(self, name):
+        name = NAME_ALIASES.get(name, name)
+        col = self.index.get(name)
+        if col is None:
+            col = self.index[name] = len(self.names)
+            self.names.append(name)
+        return col
+
+    def add_list(self, nutrition_list):
+        """Intern the names of a nutrition list; returns (columns, values) arrays."""
+        cols = []
+        values = []
+        for nutr in nutrition_list or []:
+            name = nutr.get('name')
+            if name is None:
+                continue
+            cols.append(self.column(name))
+            values.append(nutr.get('amount_per_unit_mass', 0) or 0)
+        return cols, values
+
+
+def _fill_rows(row_lists, width):
+    """Dense (len(row_lists) x width) array from per-row (columns, values) lists."""
+    matrix = np.zeros((len(row_lists), width))
+    if not row_lists:
+        return matrix
+    row_idx = np.repeat(np.arange(len(row_lists)), [len(cols) for cols, _ in row_lists])
+    col_idx = np.fromiter((c for cols, _ in row_lists for c in cols), dtype=np.intp, count=len(row_idx))
+    values = np.fromiter((v for _, vals in row_lists for v in vals), dtype=float, count=len(row_idx))
+    # add.at sums repeated names in one list, like the old dict accumulation
+    np.add.at(matrix, (row_idx, col_idx), values)
+    return matrix
+
+
+def serving_fields(nutrition_info, total_mass_g):
+    """Derived per-serving fields of a dish from its per-gram nutrition_info and total mass."""
+    totals = {}
+    for nutr in nutrition_info or []:
+        name = nutr.get('name')
+        if name is not None:
+            totals[name] = totals.get(name, 0.0) + (nutr.get('amount_per_unit_mass', 0) or 0) * total_mass_g
+    return {
+        'total_mass_g': total_mass_g,
+        'nutrition_totals': totals,
+        'calories': totals.get(CALORIES_NAME, totals.get('Calories', 0.0))
+    }
+
+
+def _to_dish_fields(per_gram, mass, columns):
+    """nutrition_info lists plus per-serving fields for the rows of a per-gram matrix."""
+    output_names = [OUTPUT_NAMES.get(name, name) for name in columns.names]
+    category_names = output_names[:columns.category_count]
+    extra_names = output_names[columns.category_count:]
+    calories_col = output_names.index(CALORIES_NAME) if CALORIES_NAME in output_names else None
+    masses = mass.tolist()
+    per_serving = (per_gram * mass[:, None]).tolist()
+    result = []
+    # tolist() converts the whole matrix to Python floats at once (much faster than per element)
+    for row, serving_row, total_mass in zip(per_gram.tolist(), per_serving, masses):
+        nutrition = [{"name": name, "amount_per_unit_mass": value} for name, value in zip(category_names, row)]
+        totals = dict(zip(category_names, serving_row))
+        if extra_names:
+            for offset, name in enumerate(extra_names, columns.category_count):
+                if row[offset] != 0:
+                    nutrition.append({"name": name, "amount_per_unit_mass": row[offset]})
+                    totals[name] = serving_row[offset]
+        result.append({
+            'nutrition_info': nutrition,
+            'total_mass_g': total_mass,
+            'nutrition_totals': totals,
+            'calories': serving_row[calories_col] if calories_col is not None else 0.0
+        })
+    return result
+
+
+def compute_dish_nutrition(dishes, ingredient_map, dish_map, ingredient_nutrition=None):
+    """Per-gram nutrition_info lists for `dishes` (records with required_ingredients), in order.
+
+    ingredient_map / dish_map: {id: record}. ingredient_nutrition(ingredient) returns
+    the ingredient's nutrient list (default: ingredient['nutrition']).
+    """
+    return [fields['nutrition_info'] for fields in
+            compute_dish_fields(dishes, ingredient_map, dish_map, ingredient_nutrition)]
+
+
+def compute_dish_fields(dishes, ingredient_map, dish_map, ingredient_nutrition=None):
+    """Like compute_dish_nutrition(), but returns for each dish a dict with
+    nutrition_info, total_mass_g, nutrition_totals and calories."""
+    ingredient_nutrition = ingredient_nutrition or _default_ingredient_nutrition
+    columns = _Columns(get_category_columns())
+
+    # 1. Sparse dish vectors as COO triples; intern every referenced nutrient list
+    ingredient_rows = {}
+    ingredient_lists = []
+    sub_rows = {}
+    sub_lists = []
+    coo_dish, coo_ingredient, coo_amount = [], [], []
+    sub_items = {}
+    dish_mass = []
+    for d_row, dish in enumerate(dishes):
+        total_mass = 0.0
+        for req in dish.get('required_ingredients', []):
+            item_id = req.get('id')
+            amount = req.get('amount_g', 0) or 0
+            total_mass += amount
+            if req.get('type', 'ingredient') == 'dish':
+                sub_dish = dish_map.get(item_id)
+                if sub_dish is None:
+                    continue
+                if item_id not in sub_rows:
+                    sub_rows[item_id] = len(sub_lists)
+                    sub_lists.append(columns.add_list(sub_dish.get('nutrition_info', [])))
+                sub_items.setdefault(d_row, []).append((item_id, amount))
+                continue
+            ingredient = ingredient_map.get(item_id)
+            if ingredient is None:
+                continue
+            row = ingredient_rows.get(item_id)
+            if row is None:
+                row = ingredient_rows[item_id] = len(ingredient_lists)
+                ingredient_lists.append(columns.add_list(ingredient_nutrition(ingredient)))
+            coo_dish.append(d_row)
+            coo_ingredient.append(row)
+            coo_amount.append(amount)
+        dish_mass.append(total_mass)
+
+    mass = np.asarray(dish_mass, dtype=float)
+    width = len(columns.names)
+    ingredient_matrix = _fill_rows(ingredient_lists, width)
+    stored_sub_matrix = _fill_rows(sub_lists, width)
+
+    # 2. totals = A @ M for the whole batch, A being the sparse dish x ingredient amounts
+    totals = np.zeros((len(dishes), width))
+    if coo_dish:
+        amounts = np.asarray(coo_amount, dtype=float)
+        np.add.at(totals, np.asarray(coo_dish), amounts[:, None] * ingredient_matrix[np.asarray(coo_ingredient)])
+
+    safe_mass = np.where(mass > 0, mass, 1.0)
+    per_gram = np.where((mass > 0)[:, None], totals / safe_mass[:, None], 0.0)
+
+    # 3. Sub-dish contributions in dependency order: a sub-dish of the batch is final before it is used
+    if sub_items:
+        batch_rows = {dish.get('id'): d_row for d_row, dish in enumerate(dishes) if dish.get('id') is not None}
+        for d_row in dependency_order(dishes):
+            for sub_id, amount in sub_items.get(d_row, ()):
+                b_row = batch_rows.get(sub_id)
+                if b_row is not None:
+                    totals[d_row] += amount * per_gram[b_row]
+                else:
+                    totals[d_row] += amount * stored_sub_matrix[sub_rows[sub_id]]
+            if d_row in sub_items:
+                per_gram[d_row] = totals[d_row] / mass[d_row] if mass[d_row] > 0 else 0.0
+
+    return _to_dish_fields(per_gram, mass, columns)
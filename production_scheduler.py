@@ -0,0 +1,103 @@
+"""
+production_scheduler.py - 생산 배치 일정 제안
+
+Proposes when to start producing each producible ingredient, and how much,
+so supply keeps up with the projected demand even when every batch takes its
+worst-case production time (production_time['max'] days).
+
+Demand and current supply come from forecast.project(). Its unmet_g row is
+the cumulative demand that the current lots (storage lots plus running
+production) cannot serve. New batches never expire and are drawn after the
+expiring lots, so a plan avoids shortfalls exactly when its cumulative
+arrivals stay at or above unmet_g. Batch j must therefore arrive before
+unmet_g first exceeds j batches' worth. Those days come from one searchsorted
+per ingredient over the whole horizon, and the start date is the arrival day
+minus the worst-case production time.
+
+Batches cover BATCH_DAYS of demand each; the last one covers only what is
+left of the horizon. When a batch would have to start in the past, it starts
+today and is flagged late: a shortfall is then expected until it completes.
+
+    for batch in production_scheduler.propose_schedule():
+        print(batch['ingredient_id'], batch['start_date'], batch['mass_g'])
+"""
+
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import database_handler as db
+import forecast
+import user_db_handler
+
+HORIZON_DAYS = 365
+BATCH_DAYS = 30
+
+
+def _production_days(ingredient):
+    """(min, max) production days of a producible ingredient, or None."""
+    production_time = ingredient.get('production_time') or {}
+    if not production_time.get('producible'):
+        return None
+    try:
+        min_days = float(production_time.get('min', 0) or 0)
+        max_days = float(production_time.get('max', 0) or 0)
+    except (TypeError, ValueError):
+        return None
+    return math.ceil(min_days), math.ceil(max(max_days, min_days))
+
+
+def schedule(projection, ingredients, batch_days=BATCH_DAYS):
+    """Batches that keep the producible `ingredients` ({id: record}) supplied over a projection.
+
+    projection is a forecast.project() result. Returns a list of dicts with
+    ingredient_id, start_date, min_end_date, max_end_date, mass_g and late,
+    ordered by start date.
+    """
+    today = projection['start']
+    unmet = projection['unmet_g']
+    rates = projection['rates_g_per_day']
+    batches = []
+    for row, ingredient_id in enumerate(projection['ingredient_ids']):
+        ingredient = ingredients.get(ingredient_id)
+        days = _production_days(ingredient) if ingredient else None
+        total = unmet[row, -1]
+        if days is None or total <= 0:
+            continue
+        min_days, max_days = days
+        batch_mass = rates[row] * batch_days
+        count = math.ceil(total / batch_mass)
+        # Batch j is needed before the unmet demand first exceeds j batches
+        needed = np.searchsorted(unmet[row], np.arange(count) * batch_mass, side='right')
+        arrivals = np.maximum(needed - 1, 0)
+        masses = np.full(count, batch_mass, dtype=float)
+        masses[-1] = total - batch_mass * (count - 1)
+        for arrival, mass in zip(arrivals.tolist(), masses.tolist()):
+            start = arrival - max_days
+            late = start < 0
+            start = max(start, 0)
+            start_date = today + timedelta(days=start)
+            batches.append({
+                'ingredient_id': ingredient_id,
+                'start_date': start_date.isoformat(),
+                'min_end_date': (start_date + timedelta(days=min_days)).isoformat(),
+                'max_end_date': (start_date + timedelta(days=max_days)).isoformat(),
+                # Rounded up so the rounding never reopens a shortfall
+                'mass_g': math.ceil(mass * 10) / 10,
+                'late': late,
+            })
+    batches.sort(key=lambda batch: (batch['start_date'], str(batch['ingredient_id'])))
+    return batches
+
+
+def propose_schedule(horizon_days=HORIZON_DAYS, batch_days=BATCH_DAYS, history_days=forecast.HISTORY_DAYS):
+    """Production batches for every producible ingredient, from current lots and crew history."""
+    today = datetime.now().date()
+    rates = forecast.consumption_rates(db.get_table(user_db_handler.USER_TABLE), today, history_days)
+    producible = {ingredient['id']: ingredient for ingredient in db.get_table('ingredient')
+                  if _production_days(ingredient) is not None}
+    lots = [lot for lot in db.get_table('storaged-ingredient') if lot.get('storage-id') in producible]
+    projection = forecast.project(lots, {i: rate for i, rate in rates.items() if i in producible},
+                                  today, horizon_days)
+    return schedule(projection, producible, batch_days)
@@ -0,0 +1,182 @@
+"""
+recommender.py - 대시보드 요리 추천 점수 계산
+
+Scores every dish of the catalog in one vectorized pass instead of nested
+Python loops per request. The catalog is compiled once per dish table
+version into arrays:
+- a (dishes x nutrients) matrix of per-serving nutrient totals
+- per dish, a bitset of its transitive base ingredients (through sub-dishes),
+  packed into uint64 words
+
+Per request only the requirement weights are built; which dishes can be
+cooked from current stock comes from the incrementally maintained
+makeability index (makeability.py). The user's like/forbid lists compile to bitsets of the same layout, so
+exclusion is one AND across the catalog and the like count is a popcount of
+one AND. The k best dishes are then picked with a partial sort
+(np.argpartition), so the cost stays flat as the catalog grows.
+
+Scoring:
+- dishes that contain a forbidden ingredient (also inside a sub-dish), or
+  cannot be cooked once from the stored lots, are skipped
+- for each nutrient whose daily requirement is not yet met:
+  + 100 * per-serving amount / requirement
+- + 50 for every liked ingredient the dish contains (also inside a sub-dish)
+- ties keep catalog order
+"""
+
+import threading
+
+import numpy as np
+
+import database_handler as db
+import makeability
+import nutrition_engine
+from user_db_handler import normalize_ingredient_ids
+
+LIKE_BONUS = 50
+
+# Set bits per byte value, to popcount the bitset words through a uint8 view
+_POPCOUNT8 = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+_MODEL_CACHE = {'version': None, 'model': None}
+_MODEL_LOCK = threading.Lock()
+
+
+def _ingredient_bitsets(dishes):
+    """(bit index {ingredient id: bit}, [int bitset per dish]) of the transitive base ingredients."""
+    bit_index = {}
+    direct = []
+    for dish in dishes:
+        mask = 0
+        for req in dish.get('required_ingredients') or []:
+            if db._required_item_type(req) != 'dish':
+                mask |= 1 << bit_index.setdefault(req.get('id'), len(bit_index))
+        direct.append(mask)
+
+    rows = {dish.get('id'): row for row, dish in enumerate(dishes)}
+    try:
+        order = nutrition_engine.dependency_order(dishes)
+    except nutrition_engine.DishCycleError:
+        # Cycles are rejected on write; for stored legacy cycles use one pass in catalog order
+        order = range(len(dishes))
+    masks = list(direct)
+    for row in order:
+        for sub_id in nutrition_engine.sub_dish_ids(dishes[row]):
+            sub_row = rows.get(sub_id)
+            if sub_row is not None:
+                masks[row] |= masks[sub_row]
+    return bit_index, masks
+
+
+def _pack_bitsets(masks, bit_count):
+    """(len(masks) x words) uint64 array from Python int bitsets."""
+    words = max(1, (bit_count + 63) // 64)
+    packed = np.zeros((len(masks), words), dtype=np.uint64)
+    for word in range(words):
+        shift = 64 * word
+        packed[:, word] = [(mask >> shift) & 0xFFFFFFFFFFFFFFFF for mask in masks]
+    return packed
+
+
+def _build_model(dishes):
+    nutrient_index = {}
+    totals_rows = []
+    for dish in dishes:
+        totals = {}
+        if dish.get('nutrition_info'):
+            _, totals = db.get_dish_totals(dish)
+        totals_rows.append({nutrient_index.setdefault(name, len(nutrient_index)): amount
+                            for name, amount in totals.items()})
+
+    nutrient_totals = np.zeros((len(dishes), len(nutrient_index)))
+    for row, totals in enumerate(totals_rows):
+        if totals:
+            nutrient_totals[row, list(totals)] = list(totals.values())
+
+    bit_index, masks = _ingredient_bitsets(dishes)
+
+    return {
+        'dishes': dishes,
+        'nutrient_index': nutrient_index,
+        'nutrient_totals': nutrient_totals,
+        'bit_index': bit_index,
+        'ingredient_bits': _pack_bitsets(masks, len(bit_index)),
+    }
+
+
+def get_model():
+    """Compiled arrays for the current dish table (rebuilt when the table changes)."""
+    version = db.get_table_version('dish')
+    with _MODEL_LOCK:
+        if _MODEL_CACHE['version'] != version:
+            _MODEL_CACHE['model'] = _build_model(db.get_table('dish'))
+            _MODEL_CACHE['model']['version'] = version
+            _MODEL_CACHE['version'] = version
+        return _MODEL_CACHE['model']
+
+
+def compile_mask(model, ingredient_ids):
+    """Bitset (uint64 words) of a like/forbid ingredient list, in the model's bit layout.
+
+    Ingredients no dish uses have no bit and are left out. Returns None for an empty mask.
+    """
+    mask = 0
+    for ingredient_id in normalize_ingredient_ids(ingredient_ids):
+        bit = model['bit_index'].get(ingredient_id)
+        if bit is not None:
+            mask |= 1 << bit
+    if not mask:
+        return None
+    return _pack_bitsets([mask], len(model['bit_index']))[0]
+
+
+def score_dishes(requirements, intake_totals, like_ids=(), forbid_ids=()):
+    """Scores of every dish (catalog order) and the mask of dishes that may be recommended.
+
+    requirements / intake_totals: {nutrient name: amount per day / eaten today}.
+    like_ids / forbid_ids: ingredient ids from the user record (legacy numbers are accepted).
+    """
+    model = get_model()
+    stock = makeability.get_index()
+    if stock['dish_version'] != model['version']:
+        # The dish table changed between the two reads; both follow the latest version
+        model = get_model()
+        stock = makeability.get_index()
+
+    weights = np.zeros(len(model['nutrient_index']))
+    for name, col in model['nutrient_index'].items():
+        requirement = requirements.get(name, 0)
+        if requirement > 0 and requirement - intake_totals.get(name, 0) > 0:
+            weights[col] = 100.0 / requirement
+    scores = model['nutrient_totals'] @ weights
+
+    bits = model['ingredient_bits']
+    like_mask = compile_mask(model, like_ids)
+    if like_mask is not None:
+        like_counts = _POPCOUNT8[(bits & like_mask).view(np.uint8)].sum(axis=1)
+        scores = scores + LIKE_BONUS * like_counts
+
+    allowed = stock['servings'] >= 1
+    forbid_mask = compile_mask(model, forbid_ids)
+    if forbid_mask is not None:
+        allowed &= ~(bits & forbid_mask).any(axis=1)
+    return scores, allowed
+
+
+def top_k(scores, allowed, k):
+    """Rows of the k highest scores among allowed rows, best first (ties in row order)."""
+    candidates = np.flatnonzero(allowed)
+    if len(candidates) > k:
+        # Partial sort: only the k best candidates are ordered
+        part = np.argpartition(-scores[candidates], k - 1)[:k]
+        candidates = candidates[part]
+    return sorted(candidates.tolist(), key=lambda row: (-scores[row], row))
+
+
+def recommend_dishes(requirements, intake_totals, like_ids=(), forbid_ids=(), k=3):
+    """The k best dish records to suggest on the dashboard."""
+    if k <= 0:
+        return []
+    scores, allowed = score_dishes(requirements, intake_totals, like_ids, forbid_ids)
+    dishes = get_model()['dishes']
+    return [dishes[row] for row in top_k(scores, allowed, k)]
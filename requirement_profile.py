@@ -0,0 +1,83 @@
+"""
+requirement_profile.py - 사용자별 일일 영양 권장량
+
+The dashboard and the recommender used to overwrite the module-global
+DAILY_REQUIREMENTS with the current user's energy and macronutrient
+targets on every request. That races between users on a threaded server.
+Here each profile is computed from (weight, age, gender, activity_level) once
+and cached. Profiles are read-only mappings. A profile edit changes the
+cache key, so the next read computes the new profile.
+"""
+
+from functools import lru_cache
+from types import MappingProxyType
+
+SCHOFIELD = {
+    'male': [
+        (0, 3, 59.512, -30.4),
+        (3, 10, 22.706, 504.3),
+        (10, 18, 17.686, 658.2),
+        (18, 30, 15.057, 692.2),
+        (30, 60, 11.472, 873.1),
+        (60, 120, 11.711, 587.7),  # older-adult coeff (Schofield includes >60 variant)
+    ],
+    'female': [
+        (0, 3, 58.317, -31.1),
+        (3, 10, 20.315, 485.9),
+        (10, 18, 13.384, 692.6),
+        (18, 30, 14.818, 486.6),
+        (30, 60, 8.126, 845.6),
+        (60, 120, 9.082, 658.5),
+    ]
+}
+
+def schofield_bmr(weight: float, age: int, sex: str) -> float:
+    sex = sex.lower()
+    if sex not in SCHOFIELD:
+        raise ValueError("sex must be 'male' or 'female'")
+    for (amin, amax, a, b) in SCHOFIELD[sex]:
+        if amin <= age <= amax:
+            return a * weight + b
+    # fallback to closest age bracket
+    brackets = SCHOFIELD[sex]
+    if age < brackets[0][0]:
+        a, b = brackets[0][2], brackets[0][3]
+    else:
+        a, b = brackets[-1][2], brackets[-1][3]
+    return a * weight + b
+
+PAL = [1.4, 1.55, 1.75, 1.9, 2.2]
+
+# Define daily nutritional requirements (defaults; energy and macronutrients are per user)
+DAILY_REQUIREMENTS = MappingProxyType({
+    "Calories (Total)": 2000,
+    "Carbohydrates": 300,
+    "Protein": 50,
+    "Dietary Fiber": 25,
+    "Vitamin B1 (Thiamin)": 1.2,
+    "Vitamin B2 (Riboflavin)": 1.3,
+    "Vitamin B3 (Niacin)": 16,
+    "Vitamin B6": 1.7,
+    "Vitamin D": 15,
+    "Folate": 400,
+    "Vitamin C": 90,
+    "Vitamin B12" : 2.4,
+    "Fat":0,
+    "Sodium":2000
+})
+
+@lru_cache(maxsize=1024)
+def requirements_for(weight, age, gender, activity_level):
+    """Read-only daily requirements for one body profile (cached)."""
+    bmr = schofield_bmr(weight, age, gender)
+    energy = bmr * activity_level
+    requirements = dict(DAILY_REQUIREMENTS)
+    requirements['Calories (Total)'] = energy
+    requirements['Protein'] = energy * 0.25 / 4
+    requirements['Fat'] = energy * 0.25 / 4
+    requirements['Carbohydrates'] = energy * 0.5 / 4
+    return MappingProxyType(requirements)
+
+def get_user_requirements(user):
+    """Daily requirements of a user record, from its weight/age/gender/activity_level."""
+    return requirements_for(user['weight'], user['age'], user['gender'], user['activity_level'])
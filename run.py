@@ -1,24 +1,26 @@
 from app import create_app
 
 import database_handler as db
+import storage_backend
 
 def initialize_database():
-    """Recalculate nutrition for all dishes on server startup."""
+    """Recalculate dish nutrition on server startup when its inputs changed."""
     print("Initializing and updating dish nutrition data...")
-    all_dishes = db._load_table('dish')
-    all_ingredients = db._load_table('ingredient')
-    
-    updated_dishes = []
-    for dish in all_dishes:
-        updated_dish = db.recalculate_dish_nutrition(dish, all_ingredients, all_dishes)
-        updated_dishes.append(updated_dish)
-    
-    db._save_table('dish', updated_dishes)
-    print("Dish nutrition data updated successfully.")
+    try:
+        mode = db.refresh_dish_nutrition()
+    except db.DishCycleError as e:
+        print(f"Dish nutrition was not updated: {e}")
+        return
+    if mode == 'unchanged':
+        print("Ingredients and dishes are unchanged since the last start; nothing to recalculate.")
+    else:
+        print(f"Dish nutrition data updated successfully ({mode} recalculation).")
 
 app = create_app()
 
 
 if __name__ == '__main__':
+    # Fold pending write-ahead logs into the JSON files before doing anything else
+    storage_backend.compact_all(db.DATA_FILES)
     initialize_database()
     app.run(debug=True)
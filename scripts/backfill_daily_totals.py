@@ -0,0 +1,49 @@
+"""
+Backfill the per-date intake totals ('daily_totals') of every user from their food_timeline.
+
+Usage (from the repository root):
+    python scripts/backfill_daily_totals.py [--dry-run]
+
+Users that already have daily_totals are recomputed too, so the command can be
+re-run after dish nutrition was corrected. Timelines are also put back in
+newest-first order, which the dashboard relies on. Works with the configured
+storage backend (JSON files or SQLite).
+"""
+
+import argparse
+import os
+import sys
+
+# Ensure repo root is on sys.path so imports like `import database_handler` work when running from /scripts
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+import database_handler as db
+import intake_totals
+import user_db_handler
+
+
+def backfill(dry_run=False):
+    with db.unit_of_work(user_db_handler.USER_TABLE) as uow:
+        users = uow.load(user_db_handler.USER_TABLE)
+        changed = 0
+        for user in users:
+            daily_totals = intake_totals.compute_daily_totals(user)
+            timeline = sorted(user.get('food_timeline', []), key=lambda x: x['date'], reverse=True)
+            if user.get(intake_totals.DAILY_TOTALS_FIELD) != daily_totals or user.get('food_timeline', []) != timeline:
+                user[intake_totals.DAILY_TOTALS_FIELD] = daily_totals
+                if 'food_timeline' in user:
+                    user['food_timeline'] = timeline
+                changed += 1
+            print(f"user {user.get('id')}: {len(daily_totals)} day(s)")
+        if changed and not dry_run:
+            uow.save(user_db_handler.USER_TABLE)
+    print(f"{'Would update' if dry_run else 'Updated'} {changed} of {len(users)} users.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Recompute daily intake totals from food timelines.')
+    parser.add_argument('--dry-run', action='store_true', help='report only, do not save')
+    args = parser.parse_args()
+    backfill(args.dry_run)
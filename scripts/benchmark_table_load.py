@@ -0,0 +1,120 @@
+"""
+Benchmark: load time and memory of the JSON tables, parsed JSON vs the pickle snapshot cache.
+
+Usage (from the repository root):
+    python scripts/benchmark_table_load.py [--scale N] [--repeat R]
+
+Each table is copied to a temporary directory (the repository files are not
+touched). --scale N multiplies the dish table N times, with suffixed ids, to
+simulate a large catalog. For every table the script reports:
+- json: json.load of the indented file (what every cache miss used to do)
+- cache build: first load through the backend (parse JSON + write <file>.pickle)
+- cache hit: later loads served from <file>.pickle
+and, for json and cache hit, the peak and retained memory measured with tracemalloc.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Ensure repo root is on sys.path so imports like `import database_handler` work when running from /scripts
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+import database_handler as db
+import storage_backend
+
+
+def _timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _memory(func):
+    """(peak, retained) bytes allocated while calling func; the result is kept alive for `retained`."""
+    tracemalloc.start()
+    try:
+        result = func()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak, retained
+
+
+def _json_load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _prepare_tables(work_dir, scale):
+    tables = {}
+    for table_name, path in db.DATA_FILES.items():
+        if not os.path.exists(path):
+            continue
+        target = os.path.join(work_dir, os.path.basename(path))
+        if table_name == 'dish' and scale > 1:
+            rows = _json_load(path)
+            scaled = []
+            for copy in range(scale):
+                for row in rows:
+                    row = dict(row)
+                    row['id'] = f"{row['id']}_{copy}"
+                    scaled.append(row)
+            storage_backend.atomic_write_json(target, scaled)
+        else:
+            shutil.copyfile(path, target)
+        tables[table_name] = target
+    return tables
+
+
+def run(scale, repeat):
+    # Cache every table regardless of size so small tables are measured too
+    backend = storage_backend.JsonFileBackend(wal=False, snapshot_cache=True, snapshot_cache_min_bytes=0)
+    work_dir = tempfile.mkdtemp(prefix='aero-bench-')
+    try:
+        tables = _prepare_tables(work_dir, scale)
+        header = f"{'table':<22}{'size':>10}{'json':>10}{'build':>10}{'hit':>10}{'speedup':>9}" \
+                 f"{'json peak':>12}{'hit peak':>12}{'json kept':>12}{'hit kept':>12}"
+        print(header)
+        print('-' * len(header))
+        for table_name, path in tables.items():
+            json_time = _timed(lambda: _json_load(path), repeat)
+
+            cache_path = backend.snapshot_cache_path(path)
+            start = time.perf_counter()
+            backend.load(table_name, path)
+            build_time = time.perf_counter() - start
+            if not os.path.exists(cache_path):
+                print(f"{table_name}: snapshot cache was not written")
+                continue
+            hit_time = _timed(lambda: backend.load(table_name, path), repeat)
+
+            json_peak, json_kept = _memory(lambda: _json_load(path))
+            hit_peak, hit_kept = _memory(lambda: backend.load(table_name, path))
+            size_mb = os.path.getsize(path) / 1e6
+            print(f"{table_name:<22}{size_mb:>8.2f}MB{json_time * 1000:>8.1f}ms{build_time * 1000:>8.1f}ms"
+                  f"{hit_time * 1000:>8.1f}ms{json_time / hit_time:>8.1f}x"
+                  f"{json_peak / 1e6:>10.1f}MB{hit_peak / 1e6:>10.1f}MB"
+                  f"{json_kept / 1e6:>10.1f}MB{hit_kept / 1e6:>10.1f}MB")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare JSON parsing with the pickle snapshot cache.')
+    parser.add_argument('--scale', type=int, default=1, help='multiply the dish table this many times')
+    parser.add_argument('--repeat', type=int, default=5, help='timed loads per measurement (median is reported)')
+    args = parser.parse_args()
+    run(args.scale, args.repeat)
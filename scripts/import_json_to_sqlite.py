@@ -0,0 +1,36 @@
+"""
+One-shot importer: copy every JSON table into the SQLite storage backend.
+
+Usage (from the repository root):
+    python scripts/import_json_to_sqlite.py [path/to/aero.db]
+
+Afterwards start the app with AERO_STORAGE_BACKEND=sqlite (and AERO_SQLITE_PATH
+if a custom path was used). The JSON files are left untouched.
+"""
+
+import os
+import sys
+
+# Ensure repo root is on sys.path so imports like `import database_handler` work when running from /scripts
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+import database_handler as db
+import storage_backend
+
+
+def import_all(sqlite_path):
+    backend = storage_backend.SqliteBackend(sqlite_path)
+    for table_name, path in db.DATA_FILES.items():
+        if not os.path.exists(path):
+            print(f"Skipping {table_name}: {path} not found")
+            continue
+        count = backend.import_json(table_name, path)
+        print(f"Imported {count} records into '{table_name}' from {path}")
+    print(f"\nImport complete: {sqlite_path}")
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else os.environ.get('AERO_SQLITE_PATH', storage_backend.DEFAULT_SQLITE_PATH)
+    import_all(target)
@@ -0,0 +1,40 @@
+"""
+Print proposed production batches for the producible ingredients.
+
+Usage (from the repository root):
+    python scripts/plan_production.py [--horizon-days 365] [--batch-days 30]
+
+Demand is projected from the crew's recent food_timeline and the current lots.
+Each batch is scheduled to complete by its worst-case (max) production time
+before stock would run short. Batches marked LATE cannot complete in time
+even if started today.
+"""
+
+import argparse
+import os
+import sys
+
+# Ensure repo root is on sys.path so imports like `import database_handler` work when running from /scripts
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+import production_scheduler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Propose production start dates and batch masses.')
+    parser.add_argument('--horizon-days', type=int, default=production_scheduler.HORIZON_DAYS,
+                        help='planning horizon in days (default: %(default)s)')
+    parser.add_argument('--batch-days', type=int, default=production_scheduler.BATCH_DAYS,
+                        help='days of demand covered by one batch (default: %(default)s)')
+    args = parser.parse_args()
+    batches = production_scheduler.propose_schedule(args.horizon_days, args.batch_days)
+    if not batches:
+        print('No production needed within the horizon.')
+        sys.exit(0)
+    print(f'{len(batches)} batch(es):')
+    for batch in batches:
+        flag = '  LATE' if batch['late'] else ''
+        print(f"  {batch['start_date']}  {batch['ingredient_id']}  {batch['mass_g']} g  "
+              f"(done {batch['min_end_date']} ~ {batch['max_end_date']}){flag}")
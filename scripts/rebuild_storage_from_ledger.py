@@ -0,0 +1,66 @@
+"""
+Rebuild storaged-ingredient from the inventory ledger (or check that they agree).
+
+Usage (from the repository root):
+    python scripts/rebuild_storage_from_ledger.py [--check]
+    python scripts/rebuild_storage_from_ledger.py --as-of 2026-01-31
+
+storaged-ingredient is the current state of the append-only inventory ledger.
+This replays the ledger from its last checkpoint and rewrites the table when it
+differs (e.g. after a restore or a manual edit of storaged-ingredient.json).
+--check only reports the differences. --as-of prints the lots held at that date
+or ISO timestamp instead.
+"""
+
+import argparse
+import os
+import sys
+
+# Ensure repo root is on sys.path so imports like `import database_handler` work when running from /scripts
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+import database_handler as db
+
+
+def _print_lots(lots):
+    for lot in lots:
+        print(f"  lot {lot.get('id')}: {lot.get('storage-id')} {lot.get('mode')} {lot.get('mass_g')} g")
+
+
+def rebuild(check=False):
+    if not db.get_table('inventory-ledger'):
+        print('The inventory ledger is empty; it starts with the next stock change.')
+        return 0
+    with db.transaction('inventory-ledger', 'storaged-ingredient'):
+        # The last row is the most recent event, so "as of" its time is the current state
+        latest = db.get_table('inventory-ledger')[-1]['at']
+        derived = db.get_inventory_as_of(latest)
+        current = db._load_table('storaged-ingredient')
+        if derived == current:
+            print(f'storaged-ingredient matches the ledger ({len(current)} lots).')
+            return 0
+        derived_by_id = {lot['id']: lot for lot in derived}
+        current_by_id = {lot['id']: lot for lot in current}
+        differing = sorted((lot_id for lot_id in derived_by_id.keys() | current_by_id.keys()
+                            if derived_by_id.get(lot_id) != current_by_id.get(lot_id)), key=str)
+        print(f'{len(differing)} lot(s) differ from the ledger: {differing}')
+        if check:
+            return 1
+        db._save_table('storaged-ingredient', derived)
+    print('storaged-ingredient rebuilt from the ledger.')
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Derive storaged-ingredient from the inventory ledger.')
+    parser.add_argument('--check', action='store_true', help='only report differences (exit code 1 if any)')
+    parser.add_argument('--as-of', help='print the lots held at this date (YYYY-MM-DD) or ISO timestamp')
+    args = parser.parse_args()
+    if args.as_of:
+        lots = db.get_inventory_as_of(args.as_of)
+        print(f'{len(lots)} lot(s) as of {args.as_of}:')
+        _print_lots(lots)
+        sys.exit(0)
+    sys.exit(rebuild(args.check))
@@ -0,0 +1,867 @@
+"""
+storage_backend.py - 테이블 저장소 백엔드 (JSON 파일 / SQLite)
+
+database_handler and user_db_handler read and write whole tables (lists of
+records) through the backend returned by get_backend(). The backend is chosen
+with the AERO_STORAGE_BACKEND environment variable ('json' by default, or
+'sqlite') or by calling configure() before the first request.
+
+Every backend implements the same methods:
+- signature(table_name, path): cheap value that changes whenever the table changes
+- load(table_name, path): return the table as a list of records
+- save(table_name, path, rows, previous=None, ops=None): persist `rows`; `previous`
+  is the last loaded version and lets row-level backends write only what
+  changed. `ops`, when given, are the mutations that turn the stored table into
+  `rows` (see apply_ops); they are written as they are, without diffing
+- save_many(writes): save several tables as one atomic commit; `writes` is a
+  list of (table_name, path, rows, previous, ops) tuples
+- lock(table_name, path): context manager holding an exclusive, cross-process
+  lock on the table, used for read-modify-write transactions
+- next_sequence(table_name, path, current_max): allocate the next number of the
+  table's persistent id sequence; current_max() is only called the first time,
+  to start the sequence after the largest id already in the table
+- reset_sequence(table_name, path, value): set the last allocated number
+- content_hash(table_name, path): hex digest of the stored content, for
+  detecting real changes (unlike signature(), which may change on rewrites)
+"""
+
+import gc
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+from contextlib import ExitStack, contextmanager
+
+DEFAULT_SQLITE_PATH = 'aero.db'
+
+# Bump when the layout of the <file>.pickle snapshot cache changes; old caches are then ignored
+SNAPSHOT_CACHE_FORMAT = 1
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _os_lock(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ~10 seconds; keep waiting like flock does
+                continue
+
+    def _os_unlock(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _os_lock(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def _os_unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+_held_locks = {}
+_held_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(lock_path):
+    """Exclusive lock shared by threads and processes, re-entrant within a thread.
+
+    Threads of this process queue on an RLock; the first acquisition also takes an
+    OS-level lock on `lock_path` so other worker processes wait as well.
+    """
+    key = os.path.abspath(lock_path)
+    with _held_locks_guard:
+        state = _held_locks.setdefault(key, {'lock': threading.RLock(), 'depth': 0, 'fd': None})
+    with state['lock']:
+        if state['depth'] == 0:
+            fd = os.open(key, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _os_lock(fd)
+            except BaseException:
+                os.close(fd)
+                raise
+            state['fd'] = fd
+        state['depth'] += 1
+        try:
+            yield
+        finally:
+            state['depth'] -= 1
+            if state['depth'] == 0:
+                fd, state['fd'] = state['fd'], None
+                try:
+                    _os_unlock(fd)
+                finally:
+                    os.close(fd)
+
+
+def _write_json_synced(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def atomic_write_json(path, data):
+    """Write JSON to a temp file, fsync it and rename it over `path`.
+
+    Readers see either the old or the new file, never a truncated one.
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    try:
+        _write_json_synced(tmp_path, data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _intern_strings(value):
+    """Copy JSON-shaped data with keys and short strings interned.
+
+    Nutrient names and field names repeat in every record; interned, pickle
+    stores each of them once and the loaded rows share them.
+    """
+    if isinstance(value, dict):
+        return {sys.intern(k): _intern_strings(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_intern_strings(v) for v in value]
+    if isinstance(value, str) and len(value) <= 64:
+        return sys.intern(value)
+    return value
+
+
+@contextmanager
+def _gc_paused():
+    # Building many small dicts/lists triggers repeated cyclic GC passes that find nothing
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _record_key(row):
+    # json.dumps keeps 1 and "1" distinct, matching the JSON files
+    return json.dumps(row.get('id'), ensure_ascii=False)
+
+
+def diff_rows(rows, previous):
+    """Compute the mutations that turn `previous` into `rows`.
+
+    Returns (ops, reordered). ops is a list of dicts, deletes first, then inserts
+    (with their final position) and updates in row order. reordered is True when
+    surviving records changed their relative order, which ops cannot express.
+    """
+    prev_by_key = {_record_key(row): row for row in previous}
+    new_keys = set()
+    ops = []
+    survivors = []
+    for pos, row in enumerate(rows):
+        key = _record_key(row)
+        new_keys.add(key)
+        prev_row = prev_by_key.get(key)
+        if prev_row is None:
+            ops.append({'op': 'insert', 'position': pos, 'record': row})
+            continue
+        survivors.append(key)
+        if prev_row != row:
+            ops.append({'op': 'update', 'id': row.get('id'), 'record': row})
+
+    deletes = [{'op': 'delete', 'id': row.get('id')} for key, row in prev_by_key.items() if key not in new_keys]
+    prev_order = [_record_key(row) for row in previous if _record_key(row) in new_keys]
+    return deletes + ops, prev_order != survivors
+
+
+def apply_ops(rows, ops):
+    """Replay mutation records on a list of rows in place.
+
+    Besides the ops of diff_rows, {'op': 'append', 'record': ...} adds a record
+    at the end (written by saves that know exactly which rows they changed).
+    """
+    positions = None
+    for op in ops:
+        kind = op.get('op')
+        if kind == 'insert':
+            rows.insert(min(op['position'], len(rows)), op['record'])
+            positions = None
+            continue
+        if kind == 'append':
+            if positions is not None:
+                positions[_record_key(op['record'])] = len(rows)
+            rows.append(op['record'])
+            continue
+        if positions is None:
+            positions = {_record_key(row): i for i, row in enumerate(rows)}
+        pos = positions.get(_record_key(op))
+        if pos is None:
+            continue
+        if kind == 'update':
+            rows[pos] = op['record']
+        elif kind == 'delete':
+            del rows[pos]
+            positions = None
+    return rows
+
+
+class JsonFileBackend:
+    """One pretty-printed JSON file per table (the original layout).
+
+    With the write-ahead log enabled (the default), save() does not rewrite the
+    file. It appends the inserted/updated/deleted records to `<file>.wal`, one JSON
+    object per line, and fsyncs. load() replays the log on top of the last
+    snapshot. Once the log grows past max(compact_min_bytes, snapshot size) a
+    background thread folds it into a fresh snapshot, so the cost of rewriting
+    the whole file is amortized over many writes.
+
+    save_many() makes a change to several files atomic with a commit journal
+    (commit.journal next to the data files), see _recover().
+
+    With snapshot_cache enabled (the default), every parsed JSON file is also
+    stored as `<file>.pickle`, tagged with the JSON file's mtime/size/inode.
+    Later loads read the pickle, which is about three times faster than parsing
+    the indented JSON. Any change to the JSON file makes the tag stale, and the
+    cache is then rebuilt on the next load. The JSON file stays the source of truth.
+    Files smaller than snapshot_cache_min_bytes are always parsed directly, since
+    for them the extra file costs more than it saves
+    (see scripts/benchmark_table_load.py).
+    """
+
+    name = 'json'
+
+    def __init__(self, wal=True, compact_min_bytes=256 * 1024, snapshot_cache=True,
+                 snapshot_cache_min_bytes=64 * 1024):
+        self.wal = wal
+        self.compact_min_bytes = compact_min_bytes
+        self.snapshot_cache = snapshot_cache
+        self.snapshot_cache_min_bytes = snapshot_cache_min_bytes
+        self._compacting_guard = threading.Lock()
+        self._compacting = set()
+
+    def lock(self, table_name, path):
+        return file_lock(path + '.lock')
+
+    @staticmethod
+    def sequences_path(path):
+        return os.path.join(os.path.dirname(path), 'sequences.json')
+
+    def next_sequence(self, table_name, path, current_max):
+        seq_path = self.sequences_path(path)
+        with file_lock(seq_path + '.lock'):
+            try:
+                with open(seq_path, 'r', encoding='utf-8') as f:
+                    sequences = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                sequences = {}
+            last = sequences.get(table_name)
+            if last is None:
+                last = current_max()
+            sequences[table_name] = last + 1
+            atomic_write_json(seq_path, sequences)
+        return last + 1
+
+    def reset_sequence(self, table_name, path, value):
+        seq_path = self.sequences_path(path)
+        with file_lock(seq_path + '.lock'):
+            try:
+                with open(seq_path, 'r', encoding='utf-8') as f:
+                    sequences = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                sequences = {}
+            sequences[table_name] = value
+            atomic_write_json(seq_path, sequences)
+
+    @staticmethod
+    def wal_path(path):
+        return path + '.wal'
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def signature(self, table_name, path):
+        snapshot = self._stat(path)
+        log = self._stat(self.wal_path(path))
+        if snapshot is None and log is None:
+            return None
+        return (snapshot, log)
+
+    @staticmethod
+    def snapshot_cache_path(path):
+        return path + '.pickle'
+
+    @staticmethod
+    def _source_tag(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def content_hash(self, table_name, path):
+        digest = hashlib.blake2b(digest_size=16)
+        with self.lock(table_name, path):
+            self._recover(self.journal_path(path))
+            for part in (path, self.wal_path(path)):
+                digest.update(b'\0')
+                try:
+                    with open(part, 'rb') as f:
+                        for chunk in iter(lambda: f.read(1 << 20), b''):
+                            digest.update(chunk)
+                except FileNotFoundError:
+                    pass
+        return digest.hexdigest()
+
+    def _read_snapshot(self, path):
+        source = self._source_tag(path)
+        if source is None:
+            return []
+        use_cache = self.snapshot_cache and source[1] >= self.snapshot_cache_min_bytes
+        if use_cache:
+            rows = self._read_snapshot_cache(path, source)
+            if rows is not None:
+                return rows
+        with open(path, 'r', encoding='utf-8') as f:
+            rows = json.load(f)
+        if use_cache:
+            self._write_snapshot_cache(path, source, rows)
+        return rows
+
+    def _read_snapshot_cache(self, path, source):
+        try:
+            with open(self.snapshot_cache_path(path), 'rb') as f:
+                # The small header comes first so a stale cache is rejected without reading the rows
+                if pickle.load(f) != {'format': SNAPSHOT_CACHE_FORMAT, 'source': list(source)}:
+                    return None
+                with _gc_paused():
+                    return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A damaged cache is not fatal; fall back to the JSON file and rewrite it
+            print(f"Ignoring snapshot cache for {path}: {e}")
+            return None
+
+    def _write_snapshot_cache(self, path, source, rows):
+        cache_path = self.snapshot_cache_path(path)
+        tmp_path = f"{cache_path}.tmp{os.getpid()}.{threading.get_ident()}"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'format': SNAPSHOT_CACHE_FORMAT, 'source': list(source)}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(_intern_strings(rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Could not write snapshot cache for {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _read_wal(self, path):
+        ops = []
+        try:
+            with open(self.wal_path(path), 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        ops.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A crash mid-append can only damage the last line; stop there
+                        break
+        except FileNotFoundError:
+            pass
+        return ops
+
+    def load(self, table_name, path):
+        with self.lock(table_name, path):
+            self._recover(self.journal_path(path))
+            rows = self._read_snapshot(path)
+            ops = self._read_wal(path)
+        return apply_ops(rows, ops) if ops else rows
+
+    def save(self, table_name, path, rows, previous=None, ops=None):
+        with self.lock(table_name, path):
+            self._recover(self.journal_path(path))
+            if not self.wal or (previous is None and ops is None):
+                atomic_write_json(path, rows)
+                self._remove_wal(path)
+                return
+
+            if ops is None:
+                ops, reordered = diff_rows(rows, previous)
+                if reordered:
+                    atomic_write_json(path, rows)
+                    self._remove_wal(path)
+                    return
+            if not ops:
+                return
+            self._repair_wal_tail(path)
+            with open(self.wal_path(path), 'a', encoding='utf-8') as f:
+                for op in ops:
+                    f.write(json.dumps(op, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+        if self._needs_compaction(path):
+            self._schedule_compaction(table_name, path)
+
+    @staticmethod
+    def journal_path(path):
+        return os.path.join(os.path.dirname(path), 'commit.journal')
+
+    def save_many(self, writes):
+        """Save several tables so that either all of the changes land or none do.
+
+        Each table's change is prepared first: log records to append, or a full
+        snapshot written to `<file>.commit`. The list of prepared changes is then
+        written to the commit journal, which is the commit point. After that the
+        changes are applied and the journal is deleted.
+        """
+        if len(writes) == 1:
+            self.save(*writes[0])
+            return
+        journal = self.journal_path(writes[0][1])
+        with ExitStack() as stack:
+            for table_name, path, *_ in sorted(writes, key=lambda w: w[0]):
+                stack.enter_context(self.lock(table_name, path))
+            stack.enter_context(file_lock(journal + '.lock'))
+            self._recover(journal)
+            actions = [action for action in (self._prepare(*write) for write in writes) if action]
+            if actions:
+                atomic_write_json(journal, actions)
+                self._apply(actions)
+                os.remove(journal)
+
+        for table_name, path, *_ in writes:
+            if self._needs_compaction(path):
+                self._schedule_compaction(table_name, path)
+
+    def _prepare(self, table_name, path, rows, previous, ops=None):
+        if self.wal and (previous is not None or ops is not None):
+            reordered = False
+            if ops is None:
+                ops, reordered = diff_rows(rows, previous)
+            if not reordered:
+                if not ops:
+                    return None
+                self._repair_wal_tail(path)
+                log = self._stat(self.wal_path(path))
+                return {'kind': 'wal', 'path': path, 'offset': log[1] if log else 0, 'ops': ops}
+        staged = path + '.commit'
+        _write_json_synced(staged, rows)
+        return {'kind': 'snapshot', 'path': path, 'staged': staged}
+
+    def _apply(self, actions):
+        # Safe to run twice: log appends restart from the recorded offset and a
+        # staged snapshot is only moved into place if it is still there
+        for action in actions:
+            path = action['path']
+            if action['kind'] == 'wal':
+                with open(self.wal_path(path), 'ab') as f:
+                    if os.fstat(f.fileno()).st_size > action['offset']:
+                        f.truncate(action['offset'])
+                    for op in action['ops']:
+                        f.write((json.dumps(op, ensure_ascii=False) + '\n').encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                if os.path.exists(action['staged']):
+                    os.replace(action['staged'], path)
+                self._remove_wal(path)
+
+    def _recover(self, journal):
+        """Finish a save_many() that crashed after writing its commit journal.
+
+        The committer holds the journal lock until the journal is deleted, so a
+        journal found while holding the lock belongs to a process that died.
+        """
+        if not os.path.exists(journal):
+            return
+        with file_lock(journal + '.lock'):
+            try:
+                with open(journal, 'r', encoding='utf-8') as f:
+                    actions = json.load(f)
+            except FileNotFoundError:
+                return
+            self._apply(actions)
+            os.remove(journal)
+
+    def _repair_wal_tail(self, path):
+        """Cut off a partially written last line so new records are not appended after it."""
+        try:
+            with open(self.wal_path(path), 'rb+') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                f.seek(size - 1)
+                if f.read(1) == b'\n':
+                    return
+                f.seek(0)
+                data = f.read()
+                f.truncate(data.rfind(b'\n') + 1)
+        except FileNotFoundError:
+            pass
+
+    def _remove_wal(self, path):
+        try:
+            os.remove(self.wal_path(path))
+        except FileNotFoundError:
+            pass
+
+    def _needs_compaction(self, path):
+        log = self._stat(self.wal_path(path))
+        if log is None:
+            return False
+        snapshot = self._stat(path)
+        return log[1] > max(self.compact_min_bytes, snapshot[1] if snapshot else 0)
+
+    def _schedule_compaction(self, table_name, path):
+        with self._compacting_guard:
+            if path in self._compacting:
+                return
+            self._compacting.add(path)
+        worker = threading.Thread(target=self._compact_in_background, args=(table_name, path),
+                                  name=f"compact-{table_name}", daemon=True)
+        worker.start()
+
+    def _compact_in_background(self, table_name, path):
+        try:
+            self.compact(table_name, path)
+        except Exception as e:
+            print(f"Compaction of {path} failed: {e}")
+        finally:
+            with self._compacting_guard:
+                self._compacting.discard(path)
+
+    def compact(self, table_name, path):
+        """Fold the write-ahead log into a fresh snapshot and delete the log."""
+        with self.lock(table_name, path):
+            if not os.path.exists(self.wal_path(path)):
+                return False
+            atomic_write_json(path, self.load(table_name, path))
+            self._remove_wal(path)
+            return True
+
+
+class SqliteBackend:
+    """All tables in one SQLite file, one row per record.
+
+    Records are stored as JSON documents next to indexed columns for the id,
+    storage-id, mode and the start/end dates. The users table keeps each
+    user's food_timeline in a separate user_timeline table indexed by
+    (user_id, date). save() diffs against the previous version and only
+    inserts, updates or deletes the rows that changed.
+    """
+
+    name = 'sqlite'
+
+    # Tables whose records carry a food_timeline that is stored row by row
+    TIMELINE_TABLES = ('users',)
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            table_name TEXT NOT NULL,
+            id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            storage_id TEXT,
+            mode TEXT,
+            start_date TEXT,
+            end_date TEXT,
+            doc TEXT NOT NULL,
+            PRIMARY KEY (table_name, id)
+        );
+        CREATE INDEX IF NOT EXISTS records_position ON records (table_name, position);
+        CREATE INDEX IF NOT EXISTS records_storage_id ON records (table_name, storage_id);
+        CREATE INDEX IF NOT EXISTS records_mode ON records (table_name, mode);
+        CREATE INDEX IF NOT EXISTS records_dates ON records (table_name, start_date, end_date);
+        CREATE TABLE IF NOT EXISTS user_timeline (
+            user_id TEXT NOT NULL,
+            entry_pos INTEGER NOT NULL,
+            item_pos INTEGER NOT NULL,
+            date TEXT,
+            time TEXT,
+            dish_id TEXT,
+            doc TEXT NOT NULL,
+            PRIMARY KEY (user_id, entry_pos, item_pos)
+        );
+        CREATE INDEX IF NOT EXISTS user_timeline_date ON user_timeline (user_id, date);
+        CREATE INDEX IF NOT EXISTS user_timeline_dish ON user_timeline (dish_id);
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sequences (
+            table_name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def lock(self, table_name, path):
+        return file_lock(f"{self.path}.{table_name}.lock")
+
+    def next_sequence(self, table_name, path, current_max):
+        conn = self._connect()
+        with conn:
+            # BEGIN IMMEDIATE takes the write lock before reading, so two writers cannot get the same value
+            conn.execute('BEGIN IMMEDIATE')
+            found = conn.execute('SELECT value FROM sequences WHERE table_name = ?', (table_name,)).fetchone()
+            value = (found[0] if found else current_max()) + 1
+            conn.execute(
+                'INSERT INTO sequences (table_name, value) VALUES (?, ?) '
+                'ON CONFLICT(table_name) DO UPDATE SET value = excluded.value', (table_name, value))
+        return value
+
+    def reset_sequence(self, table_name, path, value):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT INTO sequences (table_name, value) VALUES (?, ?) '
+                'ON CONFLICT(table_name) DO UPDATE SET value = excluded.value', (table_name, value))
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(record_id):
+        return _record_key({'id': record_id})
+
+    @staticmethod
+    def _columns(row):
+        end_date = row.get('expiration_date') or row.get('max_end_date') or row.get('end_date')
+        storage_id = row.get('storage-id')
+        return (
+            None if storage_id is None else str(storage_id),
+            row.get('mode'),
+            row.get('start_date'),
+            end_date
+        )
+
+    def signature(self, table_name, path):
+        cur = self._connect().execute(
+            'SELECT version FROM table_versions WHERE table_name = ?', (table_name,))
+        found = cur.fetchone()
+        return ('sqlite', found[0]) if found else None
+
+    def content_hash(self, table_name, path):
+        digest = hashlib.blake2b(digest_size=16)
+        conn = self._connect()
+        for (doc,) in conn.execute(
+                'SELECT doc FROM records WHERE table_name = ? ORDER BY position', (table_name,)):
+            digest.update(doc.encode('utf-8'))
+            digest.update(b'\0')
+        if table_name in self.TIMELINE_TABLES:
+            for row in conn.execute('SELECT user_id, entry_pos, item_pos, doc FROM user_timeline '
+                                    'ORDER BY user_id, entry_pos, item_pos'):
+                digest.update(json.dumps(row, ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    def load(self, table_name, path):
+        conn = self._connect()
+        rows = [json.loads(doc) for (doc,) in conn.execute(
+            'SELECT doc FROM records WHERE table_name = ? ORDER BY position', (table_name,))]
+        if table_name in self.TIMELINE_TABLES:
+            timelines = self._load_timelines(conn)
+            for row in rows:
+                timeline = timelines.get(self._key(row.get('id')))
+                if timeline is not None:
+                    row['food_timeline'] = timeline
+        return rows
+
+    def _load_timelines(self, conn):
+        timelines = {}
+        entries = {}
+        for user_key, entry_pos, item_pos, doc in conn.execute(
+                'SELECT user_id, entry_pos, item_pos, doc FROM user_timeline '
+                'ORDER BY user_id, entry_pos, item_pos'):
+            if item_pos < 0:
+                entry = json.loads(doc)
+                entry['intake'] = []
+                entries[(user_key, entry_pos)] = entry
+                timelines.setdefault(user_key, []).append(entry)
+            else:
+                entries[(user_key, entry_pos)]['intake'].append(json.loads(doc))
+        return timelines
+
+    def _write_timeline(self, conn, user_key, timeline):
+        conn.execute('DELETE FROM user_timeline WHERE user_id = ?', (user_key,))
+        params = []
+        for entry_pos, entry in enumerate(timeline or []):
+            header = {k: v for k, v in entry.items() if k != 'intake'}
+            params.append((user_key, entry_pos, -1, entry.get('date'), None, None,
+                           json.dumps(header, ensure_ascii=False)))
+            for item_pos, item in enumerate(entry.get('intake', [])):
+                dish_id = item.get('dish_id')
+                params.append((user_key, entry_pos, item_pos, entry.get('date'), item.get('time'),
+                               None if dish_id is None else str(dish_id),
+                               json.dumps(item, ensure_ascii=False)))
+        conn.executemany('INSERT INTO user_timeline VALUES (?, ?, ?, ?, ?, ?, ?)', params)
+
+    def save(self, table_name, path, rows, previous=None, ops=None):
+        self.save_many([(table_name, path, rows, previous, ops)])
+
+    def save_many(self, writes):
+        """Save several tables in a single SQLite transaction."""
+        conn = self._connect()
+        with conn:
+            for table_name, path, rows, previous, ops in writes:
+                # Appends and updates by id map to single-row statements. Deletes and
+                # positional inserts go through the full diff, which keeps positions dense
+                if ops is not None and all(op.get('op') in ('append', 'update') for op in ops):
+                    self._apply_ops(conn, table_name, ops)
+                else:
+                    self._save_rows(conn, table_name, rows, previous)
+                self._bump_version(conn, table_name)
+
+    @staticmethod
+    def _bump_version(conn, table_name):
+        conn.execute(
+            'INSERT INTO table_versions (table_name, version) VALUES (?, 1) '
+            'ON CONFLICT(table_name) DO UPDATE SET version = version + 1', (table_name,))
+
+    def _write_record(self, conn, table_name, key, position, row):
+        doc_row = row
+        if table_name in self.TIMELINE_TABLES:
+            doc_row = {k: v for k, v in row.items() if k != 'food_timeline'}
+        conn.execute(
+            'INSERT INTO records (table_name, id, position, storage_id, mode, start_date, end_date, doc) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(table_name, id) DO UPDATE SET position = excluded.position, '
+            'storage_id = excluded.storage_id, mode = excluded.mode, start_date = excluded.start_date, '
+            'end_date = excluded.end_date, doc = excluded.doc',
+            (table_name, key, position) + self._columns(row) + (json.dumps(doc_row, ensure_ascii=False),))
+
+    def _apply_ops(self, conn, table_name, ops):
+        has_timeline = table_name in self.TIMELINE_TABLES
+        next_position = None
+        for op in ops:
+            row = op['record']
+            key = self._key(row.get('id'))
+            if op['op'] == 'append':
+                if next_position is None:
+                    next_position = conn.execute(
+                        'SELECT COALESCE(MAX(position), -1) + 1 FROM records WHERE table_name = ?',
+                        (table_name,)).fetchone()[0]
+                position = next_position
+                next_position += 1
+            else:
+                found = conn.execute('SELECT position FROM records WHERE table_name = ? AND id = ?',
+                                     (table_name, key)).fetchone()
+                if found is None:
+                    continue
+                position = found[0]
+            self._write_record(conn, table_name, key, position, row)
+            if has_timeline:
+                self._write_timeline(conn, key, row.get('food_timeline'))
+
+    def _save_rows(self, conn, table_name, rows, previous):
+        has_timeline = table_name in self.TIMELINE_TABLES
+        if previous is None:
+            previous = self.load(table_name, None)
+        prev_by_key = {}
+        for pos, row in enumerate(previous):
+            prev_by_key[self._key(row.get('id'))] = (pos, row)
+
+        seen = set()
+        for pos, row in enumerate(rows):
+            key = self._key(row.get('id'))
+            seen.add(key)
+            prev_pos, prev_row = prev_by_key.get(key, (None, None))
+            if prev_row is not None and prev_pos == pos and prev_row == row:
+                continue
+
+            if has_timeline:
+                prev_timeline = prev_row.get('food_timeline') if prev_row is not None else None
+                if prev_row is None or prev_timeline != row.get('food_timeline'):
+                    self._write_timeline(conn, key, row.get('food_timeline'))
+            self._write_record(conn, table_name, key, pos, row)
+
+        removed = [key for key in prev_by_key if key not in seen]
+        for key in removed:
+            conn.execute('DELETE FROM records WHERE table_name = ? AND id = ?', (table_name, key))
+            if has_timeline:
+                conn.execute('DELETE FROM user_timeline WHERE user_id = ?', (key,))
+
+    def import_json(self, table_name, path):
+        """Replace a table with the contents of a JSON file (and its log). Returns the number of records."""
+        rows = JsonFileBackend().load(table_name, path)
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM records WHERE table_name = ?', (table_name,))
+            if table_name in self.TIMELINE_TABLES:
+                conn.execute('DELETE FROM user_timeline')
+            self._save_rows(conn, table_name, rows, previous=[])
+            self._bump_version(conn, table_name)
+        return len(rows)
+
+
+BACKENDS = {
+    'json': JsonFileBackend,
+    'sqlite': SqliteBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def configure(name=None, **options):
+    """Select the storage backend ('json' or 'sqlite') and return it.
+
+    Without a name the AERO_STORAGE_BACKEND environment variable is used; the
+    SQLite file defaults to AERO_SQLITE_PATH or aero.db. For the JSON backend,
+    AERO_JSON_WAL=0 disables the write-ahead log, AERO_WAL_COMPACT_BYTES sets
+    the minimum log size that triggers compaction and AERO_JSON_SNAPSHOT_CACHE=0
+    disables the <file>.pickle snapshot cache.
+    """
+    global _backend
+    name = name or os.environ.get('AERO_STORAGE_BACKEND', 'json')
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+    if name == 'sqlite':
+        options.setdefault('path', os.environ.get('AERO_SQLITE_PATH', DEFAULT_SQLITE_PATH))
+    elif name == 'json':
+        options.setdefault('wal', os.environ.get('AERO_JSON_WAL', '1') != '0')
+        options.setdefault('snapshot_cache', os.environ.get('AERO_JSON_SNAPSHOT_CACHE', '1') != '0')
+        if 'AERO_WAL_COMPACT_BYTES' in os.environ:
+            options.setdefault('compact_min_bytes', int(os.environ['AERO_WAL_COMPACT_BYTES']))
+    with _backend_lock:
+        _backend = BACKENDS[name](**options)
+    return _backend
+
+
+def get_backend():
+    """Return the configured backend, configuring it from the environment on first use."""
+    if _backend is None:
+        configure()
+    return _backend
+
+
+def compact_all(paths):
+    """Fold pending write-ahead logs into their snapshots. `paths` maps table name -> file."""
+    backend = get_backend()
+    if not hasattr(backend, 'compact'):
+        return []
+    return [name for name, path in paths.items() if backend.compact(name, path)]
@@ -0,0 +1,185 @@
+"""
+storage_timeline.py - 보관 식재료 타임라인 (게이지 위치 계산)
+
+Dates and shelf lives of storage lots are parsed once per distinct value
+(parse_lot() is memoized on the raw fields), so a lot is parsed when it is
+written and reused on every later read. Many lots share the same dates, and
+those share one parse.
+
+get_timeline() returns the gauge geometry of every lot for the storage
+timeline page. All positions are percentages of the lot's bar:
+- production lots: the bar runs from min(start, today) to max_end_date, with a
+  grey gap until a future start, green progress up to today and the expected
+  completion window (min_end_date..max_end_date) in blue;
+- storage lots: the bar runs from start_date to the expiration date (or start
+  plus shelf_life) and is filled up to today.
+
+The geometry is cached per calendar day. When the storage table changes, only
+lots whose row changed are recomputed; the rest are reused as they are. A new
+day recomputes every lot once.
+
+    for item in storage_timeline.get_timeline():
+        item['lot_id'], item['current_progress']
+"""
+
+import re
+import threading
+from datetime import date, datetime
+from functools import lru_cache
+
+from dateutil.relativedelta import relativedelta
+
+import database_handler as db
+
+_SHELF_LIFE_PATTERNS = {
+    unit: re.compile(r'(\d+)\s+' + unit) for unit in ('year', 'month', 'day')
+}
+
+_TIMELINE = {'version': None, 'day': None, 'lots': {}, 'items': []}
+_TIMELINE_LOCK = threading.Lock()
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache(maxsize=65536)
+def _parse(start_date, expiration_date, shelf_life, min_end_date, max_end_date):
+    start = _parse_date(start_date)
+    expiration = _parse_date(expiration_date)
+    if expiration is None and shelf_life and start is not None:
+        amounts = {unit: int(m.group(1)) if (m := pattern.search(shelf_life)) else 0
+                   for unit, pattern in _SHELF_LIFE_PATTERNS.items()}
+        expiration = start + relativedelta(years=amounts['year'], months=amounts['month'], days=amounts['day'])
+    return {
+        'start': start,
+        'expiration': expiration,
+        'min_end': _parse_date(min_end_date),
+        'max_end': _parse_date(max_end_date),
+    }
+
+
+def parse_lot(lot):
+    """Parsed dates of a storaged-ingredient row: start, expiration, min_end, max_end (date or None).
+
+    expiration falls back to start_date + shelf_life ('1 year 6 months') when
+    expiration_date is missing or invalid. Do not modify the result.
+    """
+    shelf_life = lot.get('shelf_life')
+    return _parse(lot.get('start_date'), lot.get('expiration_date'),
+                  shelf_life if isinstance(shelf_life, str) else None,
+                  lot.get('min_end_date'), lot.get('max_end_date'))
+
+
+def usable_on(lot, day):
+    """Whether the stock of a storage lot can still be used on `day` (a date).
+
+    A lot is usable through its expiration date; one without an expiration
+    date never expires. lot_allocator, makeability and forecast all count
+    stock by this rule.
+    """
+    expiration = parse_lot(lot)['expiration']
+    return expiration is None or day <= expiration
+
+
+def _pct(days, span_days):
+    return max(0.0, min(100.0, (days / span_days) * 100.0))
+
+
+def _production_geometry(dates, today):
+    start, min_end, max_end = dates['start'], dates['min_end'], dates['max_end']
+    if min_end is None or max_end is None:
+        return None
+    # The bar starts at the earlier of start_date and today
+    bar_start = min(start, today)
+    span_days = (max_end - bar_start).days
+    if span_days <= 0:
+        return None
+    start_offset = (start - bar_start).days
+    today_offset = (today - bar_start).days
+
+    # 회색: 생산 시작 전 (시작일이 미래인 경우)
+    grey_width = _pct(start_offset - today_offset, span_days) if start > today else 0.0
+    # 초록색: 생산 시작부터 현재까지
+    green_width = 0.0
+    if today >= start:
+        current_offset = (min(today, max_end) - bar_start).days
+        green_width = _pct(max(0, current_offset - start_offset), span_days)
+    return {
+        'is_production': True,
+        'grey_width': grey_width,
+        'green_left': _pct(start_offset, span_days),
+        'green_width': green_width,
+        # 파란색: 예상 완료 구간 (min_end_date ~ max_end_date)
+        'expected_left': _pct((min_end - bar_start).days, span_days),
+        'expected_width': _pct((max_end - min_end).days, span_days),
+        'today_pos': _pct(today_offset, span_days),
+        'start_pos': _pct(start_offset, span_days),
+        'min_end_date': min_end.isoformat(),
+        'max_end_date': max_end.isoformat(),
+    }
+
+
+def _storage_geometry(dates, today):
+    start, expiration = dates['start'], dates['expiration']
+    if expiration is None:
+        return None
+    total_duration = (expiration - start).days
+    if total_duration <= 0:
+        return None
+    # 현재 진행률: 시작일 ~ 유통기한 사이로 제한
+    current = max(min(today, expiration), start)
+    return {
+        'is_production': False,
+        'current_progress': _pct((current - start).days, total_duration),
+        'expiration_date': expiration.isoformat(),
+    }
+
+
+def _lot_item(lot, today):
+    dates = parse_lot(lot)
+    if dates['start'] is None:
+        return None
+    if lot.get('mode') == 'production':
+        geometry = _production_geometry(dates, today)
+    else:
+        geometry = _storage_geometry(dates, today)
+    if geometry is None:
+        return None
+    return dict(geometry,
+                lot_id=lot.get('id'),
+                ingredient_id=lot.get('storage-id'),
+                mass_g=lot.get('mass_g'),
+                start_date=dates['start'].isoformat())
+
+
+def get_timeline(today=None):
+    """Gauge items of the lots that can be drawn, in table order. Do not modify.
+
+    Each item has lot_id, ingredient_id, mass_g, start_date and is_production,
+    plus the production or storage geometry fields described above. Lots
+    without usable dates are left out.
+    """
+    today = today or datetime.now().date()
+    version = db.get_table_version('storaged-ingredient')
+    with _TIMELINE_LOCK:
+        if _TIMELINE['version'] == version and _TIMELINE['day'] == today:
+            return _TIMELINE['items']
+        # Same day: reuse the items of unchanged rows. New day: every gauge moves.
+        previous = _TIMELINE['lots'] if _TIMELINE['day'] == today else {}
+        lots = {}
+        items = []
+        for lot in db.get_table('storaged-ingredient'):
+            cached = previous.get(lot.get('id'))
+            if cached is not None and cached[0] == lot:
+                entry = cached
+            else:
+                entry = (lot, _lot_item(lot, today))
+            lots[lot.get('id')] = entry
+            if entry[1] is not None:
+                items.append(entry[1])
+        _TIMELINE.update(version=version, day=today, lots=lots, items=items)
+        return items
@@ -0,0 +1,83 @@
+"""
+Shared setup for tests that run database_handler on tables of their own.
+
+TableTestCase gives every test an empty temporary directory as the working
+directory, writes the tables of TABLES and CATEGORIES there and drops the
+process-wide caches. The user table is redirected there too, so the
+repository's data files are never read or written.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+import database_handler as db
+import nutrition_engine
+import storage_backend
+import user_db_handler
+
+CATEGORIES = [
+    {'name': 'Calories', 'unit': 'kcal'},
+    {'name': 'Protein', 'unit': 'g'},
+    {'name': 'Fat', 'unit': 'g'},
+]
+
+
+def ingredient(ingredient_id, **nutrients):
+    """An ingredient row with the given per-gram nutrients (Protein=0.2, ...)."""
+    return {'id': ingredient_id, 'name': {'kor': ingredient_id, 'eng': ingredient_id}, 'research_ids': [],
+            'nutrition': [{'name': name, 'amount_per_unit_mass': amount} for name, amount in nutrients.items()],
+            'production_time': {'producible': False}}
+
+
+def dish(dish_id, *items, **fields):
+    """A dish row; items are (id, grams) for ingredients or ('dish', id, grams) for sub-dishes."""
+    required = []
+    for item in items:
+        if len(item) == 3:
+            required.append({'type': item[0], 'id': item[1], 'amount_g': item[2]})
+        else:
+            required.append({'type': 'ingredient', 'id': item[0], 'amount_g': item[1]})
+    return dict({'id': dish_id, 'name': {'kor': dish_id, 'eng': dish_id}, 'image_url': None,
+                 'required_ingredients': required, 'cooking-method-ids': [], 'nutrition_info': []}, **fields)
+
+
+def storage_lot(lot_id, ingredient_id, mass_g, expiration_date, start_date='2026-01-01'):
+    return {'id': lot_id, 'storage-id': ingredient_id, 'mass_g': mass_g, 'mode': 'storage',
+            'start_date': start_date, 'processing_type': None, 'expiration_date': expiration_date}
+
+
+class TableTestCase(unittest.TestCase):
+    """Each test runs in a fresh data directory holding TABLES ({table name: rows})."""
+
+    TABLES = {}
+    CATEGORIES = CATEGORIES
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.data_dir = tmp.name
+        cwd = os.getcwd()
+        os.chdir(self.data_dir)
+        self.addCleanup(os.chdir, cwd)
+
+        user_path = os.path.join(self.data_dir, 'user_db.json')
+        for patcher in (mock.patch.dict(db.DATA_FILES, {user_db_handler.USER_TABLE: user_path}),
+                        mock.patch.object(storage_backend, '_backend', None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # No background compaction and no pickle cache, so the files stay as the test wrote them
+        storage_backend.configure('json', compact_min_bytes=1 << 30, snapshot_cache=False)
+
+        for table_name, rows in self.TABLES.items():
+            storage_backend.atomic_write_json(db.DATA_FILES[table_name], rows)
+        storage_backend.atomic_write_json(nutrition_engine.CATEGORY_FILE, self.CATEGORIES)
+        nutrition_engine._CATEGORY_CACHE.clear()
+        db.invalidate_table_cache()
+        self.addCleanup(db.invalidate_table_cache)
@@ -0,0 +1,61 @@
+"""
+Tests for flattening dishes into base ingredients (bom).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from table_fixture import TableTestCase, dish, ingredient
+
+import bom
+import database_handler as db
+
+
+class _Abort(Exception):
+    pass
+
+
+class ExpandDishTest(TableTestCase):
+
+    TABLES = {
+        'ingredient': [ingredient('i1'), ingredient('i2'), ingredient('i3')],
+        'dish': [
+            dish('d1', ('i1', 100), ('i2', 50)),  # 150 g
+            dish('d2', ('dish', 'd1', 60), ('i3', 40)),  # 100 g
+            dish('d3', ('dish', 'd2', 50), ('i1', 50)),  # 100 g
+        ],
+    }
+
+    def assertGrams(self, actual, expected):
+        self.assertEqual(sorted(actual), sorted(expected))
+        for ingredient_id, grams in expected.items():
+            self.assertAlmostEqual(actual[ingredient_id], grams, msg=ingredient_id)
+
+    def test_nested_sub_dishes_scale_to_base_grams(self):
+        self.assertGrams(bom.expand_dish('d2'), {'i1': 40, 'i2': 20, 'i3': 40})
+        self.assertGrams(bom.expand_dish('d3'), {'i1': 70, 'i2': 10, 'i3': 20})
+        self.assertGrams(bom.expand_dish('d3', amount_g=200), {'i1': 140, 'i2': 20, 'i3': 40})
+
+    def test_meals_add_up(self):
+        self.assertGrams(bom.expand_meals(['d2', ('d3', 50), 'd2']), {'i1': 115, 'i2': 45, 'i3': 90})
+
+    def test_memo_follows_the_dish_table(self):
+        self.assertGrams(bom.expand_dish('d2'), {'i1': 40, 'i2': 20, 'i3': 40})
+        db.update_dish('d1', {'kor': 'd1'}, None, dish('d1', ('i1', 30))['required_ingredients'], [])
+        self.assertGrams(bom.expand_dish('d2'), {'i1': 60, 'i3': 40})
+
+    def test_memo_follows_pending_changes_and_rollback(self):
+        expected = {'i1': 40, 'i2': 20, 'i3': 40}
+        self.assertGrams(bom.expand_dish('d2'), expected)
+        with self.assertRaises(_Abort):
+            with db.transaction('dish'):
+                db.update_dish('d1', {'kor': 'd1'}, None, dish('d1', ('i2', 10))['required_ingredients'], [])
+                self.assertGrams(bom.expand_dish('d2'), {'i2': 60, 'i3': 40})
+                raise _Abort()
+        self.assertGrams(bom.expand_dish('d2'), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""
+Tests for keeping stored dish nutrition up to date: propagation of ingredient
+edits (database_handler.update_ingredient) and the startup refresh
+(database_handler.refresh_dish_nutrition).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import json
+import unittest
+
+from table_fixture import TableTestCase, dish, ingredient
+
+import database_handler as db
+import nutrition_engine
+import storage_backend
+
+INGREDIENTS = [ingredient('i1', Calories=2.0, Protein=0.1), ingredient('i2', Calories=1.0, Fat=0.3),
+               ingredient('i3', Protein=0.5)]
+DISHES = [
+    dish('d1', ('i1', 100)),
+    dish('d2', ('dish', 'd1', 50), ('i2', 50)),  # uses i1 through d1
+    dish('d3', ('dish', 'd2', 100), ('i3', 20)),  # uses i1 through d2 and d1
+    dish('d4', ('i2', 80)),
+    dish('d5', ('i3', 10), ('i2', 10)),
+]
+
+
+def recomputed():
+    """{dish id: dish} with every dish recalculated from the current tables."""
+    dishes = db._load_table('dish')
+    db.recalculate_all_dish_nutrition(dishes, db.get_table('ingredient'))
+    return {d['id']: d for d in dishes}
+
+
+class NutritionTestCase(TableTestCase):
+
+    TABLES = {'ingredient': INGREDIENTS, 'dish': DISHES}
+
+    def setUp(self):
+        super().setUp()
+        with db.unit_of_work('dish') as uow:
+            db.recalculate_all_dish_nutrition(uow.load('dish'), db.get_table('ingredient'))
+            uow.save('dish')
+
+    def assertMatchesFullRecompute(self):
+        expected = recomputed()
+        for row in db.get_table('dish'):
+            self.assertEqual(row, expected[row['id']], row['id'])
+
+
+class UpdateIngredientTest(NutritionTestCase):
+
+    def _wal_ops(self):
+        try:
+            with open(storage_backend.JsonFileBackend.wal_path(db.DATA_FILES['dish']), 'rb') as f:
+                return [json.loads(line) for line in f.read().splitlines()]
+        except FileNotFoundError:
+            return []
+
+    def test_direct_and_transitive_dependents_are_updated(self):
+        before = {row['id']: row for row in db.get_table('dish')}
+        logged = len(self._wal_ops())
+
+        source = db.get_record('ingredient', 'i1')
+        db.update_ingredient('i1', source['name'], [], [{'name': 'Calories', 'amount_per_unit_mass': 4.0}],
+                             source['production_time'])
+
+        after = {row['id']: row for row in db.get_table('dish')}
+        for dish_id in ('d1', 'd2', 'd3'):
+            self.assertNotEqual(after[dish_id]['calories'], before[dish_id]['calories'], dish_id)
+        self.assertEqual(after['d1']['calories'], 400.0)
+        self.assertMatchesFullRecompute()
+        # Unrelated dishes are neither copied nor written
+        self.assertIs(after['d4'], before['d4'])
+        self.assertIs(after['d5'], before['d5'])
+        ops = self._wal_ops()[logged:]
+        self.assertEqual(sorted((op['op'], op['id']) for op in ops),
+                         [('update', 'd1'), ('update', 'd2'), ('update', 'd3')])
+
+    def test_edit_without_nutrition_change_leaves_dishes_alone(self):
+        dishes = db.get_table('dish')
+        source = db.get_record('ingredient', 'i2')
+        db.update_ingredient('i2', {'kor': 'new', 'eng': 'new'}, [], source['nutrition'], source['production_time'])
+        self.assertIs(db.get_table('dish'), dishes)
+        self.assertEqual(db.get_record('ingredient', 'i2')['name']['kor'], 'new')
+
+
+class RefreshDishNutritionTest(NutritionTestCase):
+    """Tables are edited through the backend, as by another process, so only the refresh updates dishes."""
+
+    def _edit(self, table_name, change):
+        rows = db._load_table(table_name)
+        change({row['id']: row for row in rows})
+        storage_backend.get_backend().save(table_name, db.DATA_FILES[table_name], rows)
+        db.invalidate_table_cache(table_name)
+
+    def test_full_unchanged_then_incremental(self):
+        self.assertEqual(db.refresh_dish_nutrition(), 'full')
+        self.assertEqual(db.refresh_dish_nutrition(), 'unchanged')
+
+        self._edit('ingredient', lambda rows: rows['i3']['nutrition'][0].update(amount_per_unit_mass=0.9))
+        before = {row['id']: row for row in db.get_table('dish')}
+        self.assertEqual(db.refresh_dish_nutrition(), 'incremental')
+        self.assertMatchesFullRecompute()
+        after = {row['id']: row for row in db.get_table('dish')}
+        self.assertNotEqual(after['d3']['nutrition_totals'], before['d3']['nutrition_totals'])
+        self.assertEqual(after['d4'], before['d4'])
+        self.assertEqual(db.refresh_dish_nutrition(), 'unchanged')
+
+    def test_dish_edit_is_incremental(self):
+        db.refresh_dish_nutrition()
+        self._edit('dish', lambda rows: rows['d1']['required_ingredients'].append(
+            {'type': 'ingredient', 'id': 'i2', 'amount_g': 100}))
+        self.assertEqual(db.refresh_dish_nutrition(), 'incremental')
+        self.assertEqual(db.get_record('dish', 'd1')['total_mass_g'], 200)
+        # d2 and d3 use d1 and follow it
+        self.assertMatchesFullRecompute()
+        self.assertEqual(db.refresh_dish_nutrition(), 'unchanged')
+
+    def test_category_edit_is_full(self):
+        db.refresh_dish_nutrition()
+        storage_backend.atomic_write_json(nutrition_engine.CATEGORY_FILE,
+                                          self.CATEGORIES + [{'name': 'Sodium', 'unit': 'mg'}])
+        self.assertEqual(db.refresh_dish_nutrition(), 'full')
+        names = [nutr['name'] for nutr in db.get_record('dish', 'd4')['nutrition_info']]
+        self.assertEqual(names, ['Calories (Total)', 'Protein', 'Fat', 'Sodium'])
+        self.assertMatchesFullRecompute()
+        self.assertEqual(db.refresh_dish_nutrition(), 'unchanged')
+
+
+if __name__ == '__main__':
+    unittest.main()
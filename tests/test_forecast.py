@@ -0,0 +1,80 @@
+"""
+Tests for the stock-out and expiry waste forecast (forecast).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import unittest
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from table_fixture import TableTestCase, dish, ingredient, storage_lot
+
+import forecast
+import user_db_handler
+
+TODAY = datetime(2030, 1, 10, 12, 0)
+
+
+def _timeline(days, dish_id):
+    """One serving of dish_id on each of the `days` days up to today, newest first."""
+    return [{'date': (TODAY.date() - timedelta(days=n)).isoformat(), 'intake': [{'dish_id': dish_id, 'time': '12:00'}]}
+            for n in range(days)]
+
+
+class GetForecastTest(TableTestCase):
+
+    TABLES = {
+        'ingredient': [ingredient('i1'), ingredient('i2')],
+        'dish': [dish('d1', ('i1', 100))],
+        # 10 days logged out of the 30-day window: 100 g of i1 a day
+        user_db_handler.USER_TABLE: [{'id': 1, 'username': 'crew', 'food_timeline': _timeline(10, 'd1')}],
+        'storaged-ingredient': [
+            storage_lot(2, 'i1', 1000, '2030-03-01'),
+            # Drawn first; usable through the 12th, i.e. 3 days: 300 of its 500 g are used
+            storage_lot(1, 'i1', 500, '2030-01-12'),
+            # Not eaten at all: expires whole
+            storage_lot(3, 'i2', 100, '2030-01-15'),
+        ],
+    }
+
+    def setUp(self):
+        super().setUp()
+        clock = mock.patch.object(forecast, 'datetime')
+        clock.start().now.return_value = TODAY
+        self.addCleanup(clock.stop)
+        self.result = forecast.get_forecast()
+
+    def test_rates_come_from_the_logged_days(self):
+        rates = dict(zip(self.result['ingredient_ids'], self.result['rates_g_per_day'].tolist()))
+        self.assertEqual(rates, {'i1': 100.0, 'i2': 0.0})
+
+    def test_stockout_date(self):
+        # Lot 1 gives 3 days, lot 2 another 10
+        self.assertEqual(self.result['stockout'], {'i1': (date(2030, 1, 10) + timedelta(days=13)).isoformat(),
+                                                   'i2': None})
+
+    def test_expected_waste_per_lot(self):
+        self.assertEqual(self.result['waste'], {1: 200.0, 2: 0.0, 3: 100.0})
+
+    def test_daily_stock(self):
+        row = self.result['ingredient_ids'].index('i1')
+        stock = self.result['stock_g'][row]
+        self.assertEqual(stock[0], 1500)
+        self.assertEqual(stock[2], 1300)
+        # Lot 1 expired with 200 g left; lot 2 has been drawn from since
+        self.assertEqual(stock[3], 1000)
+        self.assertEqual(stock[8], 500)
+        self.assertEqual(stock[13], 0)
+        self.assertEqual(self.result['unmet_g'][row][13], 0)
+        self.assertAlmostEqual(self.result['unmet_g'][row][15], 200, places=3)
+
+    def test_cached_until_the_day_changes(self):
+        self.assertIs(forecast.get_forecast(), self.result)
+        forecast.datetime.now.return_value = TODAY + timedelta(days=1)
+        self.assertEqual(forecast.get_forecast()['start'], date(2030, 1, 11))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+Tests for the inventory ledger: checkpoints and the state as of a past time
+(inventory_ledger.state_as_of, database_handler.get_inventory_as_of).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import itertools
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from table_fixture import TableTestCase, ingredient, storage_lot
+
+import database_handler as db
+import inventory_ledger
+
+
+def _at(*args):
+    return datetime(*args).isoformat(timespec='microseconds')
+
+
+class LedgerTestCase(TableTestCase):
+
+    TABLES = {
+        'ingredient': [ingredient('i1')],
+        # Existed before the ledger: goes into the opening checkpoint
+        'storaged-ingredient': [storage_lot(1, 'i1', 1000, '2099-12-31')],
+    }
+
+    def setUp(self):
+        super().setUp()
+        # Each ledger row takes the next time from self.clock
+        clock = mock.patch.object(inventory_ledger, 'now', side_effect=lambda: next(self.clock))
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def record(self, at, *events):
+        self.clock = itertools.repeat(at)
+        return db.record_inventory_events(list(events))
+
+    def consume(self, at, lot_id, grams):
+        return self.record(at, {'type': inventory_ledger.CONSUMPTION, 'lot_id': lot_id, 'mass_g': grams})
+
+    def masses(self, as_of):
+        return {lot['id']: lot['mass_g'] for lot in db.get_inventory_as_of(as_of)}
+
+
+class InventoryAsOfTest(LedgerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.consume(_at(2030, 1, 1, 10), 1, 100)
+        self.record(_at(2030, 1, 2, 9), {'type': inventory_ledger.RECEIPT,
+                                         'lot': storage_lot(2, 'i1', 500, '2099-12-31')})
+        self.consume(_at(2030, 1, 2, 18), 2, 50)
+
+    def test_before_the_first_event(self):
+        self.assertEqual(self.masses('2029-12-31'), {})
+        self.assertEqual(self.masses(_at(2030, 1, 1, 9, 59)), {})
+
+    def test_a_date_includes_the_whole_day(self):
+        self.assertEqual(self.masses('2030-01-01'), {1: 900})
+        self.assertEqual(self.masses('2030-01-02'), {1: 900, 2: 450})
+
+    def test_timestamps(self):
+        self.assertEqual(self.masses(_at(2030, 1, 2, 9)), {1: 900, 2: 500})
+        self.assertEqual(self.masses('2030-01-02T12:00'), {1: 900, 2: 500})
+        self.assertEqual(self.masses(_at(2030, 1, 2, 8, 59, 59)), {1: 900})
+
+    def test_latest_state_is_the_storage_table(self):
+        self.assertEqual(sorted(db.get_inventory_as_of('2099-01-01'), key=lambda lot: lot['id']),
+                         sorted(db.get_table('storaged-ingredient'), key=lambda lot: lot['id']))
+
+
+class CheckpointTest(LedgerTestCase):
+
+    EVENTS = 2 * inventory_ledger.CHECKPOINT_INTERVAL + 50
+
+    def setUp(self):
+        super().setUp()
+        start = datetime(2030, 1, 1)
+        self.clock = ((start + timedelta(minutes=n)).isoformat(timespec='microseconds') for n in itertools.count())
+        db.record_inventory_events([{'type': inventory_ledger.CONSUMPTION, 'lot_id': 1, 'mass_g': 1}] * self.EVENTS)
+        rows = db.get_table('inventory-ledger')
+        self.times = [row['at'] for row in rows if row['type'] != inventory_ledger.CHECKPOINT]
+        self.checkpoint_times = [row['at'] for row in rows if row['type'] == inventory_ledger.CHECKPOINT]
+
+    def test_a_checkpoint_follows_every_interval(self):
+        rows = db.get_table('inventory-ledger')
+        _, positions = inventory_ledger.checkpoint_positions(rows)
+        interval = inventory_ledger.CHECKPOINT_INTERVAL
+        # The opening checkpoint, then one after every `interval` events
+        self.assertEqual(positions, [0, interval + 1, 2 * interval + 2])
+        self.assertEqual(rows[positions[1]]['lots'][0]['mass_g'], 1000 - interval)
+        self.assertEqual(len(rows), self.EVENTS + len(positions))
+
+    def _replayed(self, as_of):
+        with mock.patch.object(inventory_ledger, 'apply_event', wraps=inventory_ledger.apply_event) as apply:
+            masses = self.masses(as_of)
+        return masses, apply.call_count
+
+    def test_query_on_a_checkpoint(self):
+        interval = inventory_ledger.CHECKPOINT_INTERVAL
+        # Only the checkpoint is applied
+        masses, applied = self._replayed(self.checkpoint_times[1])
+        self.assertEqual((masses, applied), ({1: 1000 - interval}, 1))
+        masses, applied = self._replayed(self.checkpoint_times[0])
+        self.assertEqual((masses, applied), ({1: 1000}, 1))
+
+    def test_query_past_a_checkpoint(self):
+        interval = inventory_ledger.CHECKPOINT_INTERVAL
+        masses, applied = self._replayed(self.times[interval + 4])
+        self.assertEqual((masses, applied), ({1: 1000 - interval - 5}, 6))
+        masses, applied = self._replayed(self.times[-1])
+        self.assertEqual((masses, applied), ({1: 1000 - self.EVENTS}, 51))
+
+    def test_dates_replay_from_the_last_checkpoint_of_the_day(self):
+        day = self.times[-1][:10]
+        masses, applied = self._replayed(day)
+        self.assertEqual((masses, applied), ({1: 1000 - self.EVENTS}, 51))
+
+    def test_latest_state_is_the_storage_table(self):
+        self.assertEqual(db.get_inventory_as_of('2099-01-01'), db.get_table('storaged-ingredient'))
+
+    def test_cut_checkpoint_times_are_kept_until_the_ledger_changes(self):
+        _, (times, _) = db._ledger_checkpoints(10)
+        self.assertIs(db._ledger_checkpoints(10)[1][0], times)
+        # Enough events for one more checkpoint: the kept list is extended
+        event = {'type': inventory_ledger.CONSUMPTION, 'lot_id': 1, 'mass_g': 1}
+        self.record(_at(2030, 2, 1), *[event] * inventory_ledger.CHECKPOINT_INTERVAL)
+        _, (after, positions) = db._ledger_checkpoints(10)
+        self.assertEqual(len(positions), 4)
+        self.assertEqual(after, ['2030-01-01'] * 3 + ['2030-02-01'])
+        self.assertEqual(self.masses('2030-02-01'), {1: 1000 - self.EVENTS - inventory_ledger.CHECKPOINT_INTERVAL})
+
+
+if __name__ == '__main__':
+    unittest.main()
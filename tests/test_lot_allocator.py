@@ -0,0 +1,109 @@
+"""
+Tests for first-expiring-first-out lot allocation (lot_allocator).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from table_fixture import TableTestCase, ingredient, storage_lot
+
+import database_handler as db
+import inventory_ledger
+import lot_allocator
+import storage_backend
+
+TODAY = datetime(2030, 1, 10, 12, 0)
+
+
+class AllocateTest(TableTestCase):
+
+    TABLES = {
+        'ingredient': [ingredient('i1'), ingredient('i2')],
+        'storaged-ingredient': [
+            storage_lot(1, 'i1', 200, '2030-03-01'),
+            storage_lot(2, 'i1', 100, '2030-02-01'),
+            storage_lot(3, 'i1', 500, '2030-01-05'),  # expired five days ago
+            storage_lot(4, 'i1', 80, None),  # no expiration date: drawn last
+            storage_lot(5, 'i2', 40, '2030-01-12'),
+        ],
+    }
+
+    def setUp(self):
+        super().setUp()
+        clock = mock.patch.object(lot_allocator, 'datetime')
+        clock.start().now.return_value = TODAY
+        self.addCleanup(clock.stop)
+
+    def test_earliest_expiring_lot_first(self):
+        plan, missing = lot_allocator.allocate({'i1': 50})
+        self.assertEqual(plan, [(2, 'i1', 50)])
+        self.assertEqual(missing, {})
+
+    def test_requirement_split_across_lots(self):
+        plan, missing = lot_allocator.allocate({'i1': 250, 'i2': 40})
+        self.assertEqual(plan, [(2, 'i1', 100), (1, 'i1', 150), (5, 'i2', 40)])
+        self.assertEqual(missing, {})
+
+    def test_expired_lot_is_skipped(self):
+        plan, _ = lot_allocator.allocate({'i1': 380})
+        self.assertEqual(plan, [(2, 'i1', 100), (1, 'i1', 200), (4, 'i1', 80)])
+        # Lot 5 is usable today but not on the 13th
+        plan, missing = lot_allocator.allocate({'i2': 10}, as_of='2030-01-13')
+        self.assertEqual((plan, missing), ([], {'i2': 10}))
+        self.assertEqual(lot_allocator.allocate({'i2': 10})[0], [(5, 'i2', 10)])
+
+    def test_shortfall_reports_missing_and_changes_nothing(self):
+        lots = db.get_table('storaged-ingredient')
+        plan, missing = lot_allocator.allocate({'i1': 1000, 'i2': 5})
+        self.assertEqual(missing, {'i1': 1000 - 380})
+        self.assertEqual(sum(grams for _, ingredient_id, grams in plan if ingredient_id == 'i1'), 380)
+        self.assertIs(db.get_table('storaged-ingredient'), lots)
+        self.assertEqual(db.get_table('inventory-ledger'), [])
+        # Planning does not use up the heaps
+        self.assertEqual(lot_allocator.allocate({'i1': 1000, 'i2': 5}), (plan, missing))
+
+    def test_consume_records_the_plan(self):
+        plan, _ = lot_allocator.allocate({'i1': 250})
+        lot_allocator.consume(plan, dish_id='d1')
+        self.assertEqual(db.get_record('storaged-ingredient', 2)['mass_g'], 0)
+        self.assertEqual(db.get_record('storaged-ingredient', 1)['mass_g'], 50)
+        events = [row for row in db.get_table('inventory-ledger') if row['type'] == inventory_ledger.CONSUMPTION]
+        self.assertEqual([(row['lot_id'], row['mass_g'], row['dish_id']) for row in events],
+                         [(2, 100, 'd1'), (1, 150, 'd1')])
+        # The emptied lot is dropped, the rest is drawn next
+        self.assertEqual(lot_allocator.allocate({'i1': 100})[0], [(1, 'i1', 50), (4, 'i1', 50)])
+
+    def test_heaps_follow_a_new_receipt(self):
+        lot_allocator.consume(lot_allocator.allocate({'i1': 10})[0])
+        # The first ledger rows cost one rebuild; from then on the heaps follow the ledger
+        lot_allocator.allocate({'i1': 10})
+        with mock.patch.object(lot_allocator, '_build_heaps', wraps=lot_allocator._build_heaps) as build:
+            db.record_inventory_events([{'type': inventory_ledger.RECEIPT,
+                                         'lot': storage_lot(9, 'i1', 30, '2030-01-20')}])
+            plan, _ = lot_allocator.allocate({'i1': 50})
+            self.assertEqual(plan, [(9, 'i1', 30), (2, 'i1', 20)])
+            build.assert_not_called()
+
+    def test_heaps_rebuild_after_an_outside_change(self):
+        lot_allocator.allocate({'i1': 10})
+        lots = db._load_table('storaged-ingredient')
+        lots.append(storage_lot(9, 'i1', 30, '2030-01-20'))
+        db._save_table('storaged-ingredient', lots)
+        self.assertEqual(lot_allocator.allocate({'i1': 10})[0], [(9, 'i1', 10)])
+
+    def test_heaps_rebuild_after_a_reload_with_an_empty_ledger(self):
+        lot_allocator.allocate({'i1': 10})
+        # Edited by hand, then every table re-read: the (still empty) ledger says nothing about it
+        lots = db._load_table('storaged-ingredient')
+        lots.append(storage_lot(9, 'i1', 30, '2030-01-20'))
+        storage_backend.get_backend().save('storaged-ingredient', db.DATA_FILES['storaged-ingredient'], lots)
+        db.invalidate_table_cache()
+        self.assertEqual(lot_allocator.allocate({'i1': 10})[0], [(9, 'i1', 10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
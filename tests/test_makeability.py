@@ -0,0 +1,72 @@
+"""
+Tests for the index of dishes that can be made from stored lots (makeability).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from table_fixture import TableTestCase, dish, ingredient, storage_lot
+
+import database_handler as db
+import inventory_ledger
+import makeability
+
+TODAY = datetime(2030, 1, 10, 12, 0)
+
+
+class MakeabilityTest(TableTestCase):
+
+    TABLES = {
+        'ingredient': [ingredient('i1'), ingredient('i2')],
+        'dish': [
+            dish('d1', ('i1', 100), ('i2', 50)),
+            dish('d2', ('dish', 'd1', 100), ('i2', 50)),  # i1 66.7 g, i2 83.3 g
+            dish('d3', ('i9', 10)),  # nothing in stock
+        ],
+        'storaged-ingredient': [
+            storage_lot(1, 'i1', 350, '2099-12-31'),
+            storage_lot(2, 'i2', 120, '2099-12-31'),
+            storage_lot(3, 'i2', 200, TODAY.date().isoformat()),  # usable through today
+        ],
+    }
+
+    def setUp(self):
+        super().setUp()
+        clock = mock.patch.object(makeability, 'datetime')
+        self.clock = clock.start()
+        self.addCleanup(clock.stop)
+        self.clock.now.return_value = TODAY
+
+    def assertMakeability(self, expected):
+        for dish_id, value in expected.items():
+            self.assertEqual(makeability.get_makeability(dish_id), value, dish_id)
+        self.assertEqual(makeability.get_makeable_dish_ids(),
+                         {dish_id for dish_id, (servings, _) in expected.items() if servings >= 1})
+
+    def test_initial_stock(self):
+        self.assertMakeability({'d1': (3, 'i1'), 'd2': (3, 'i2'), 'd3': (0, 'i9')})
+        self.assertEqual(makeability.get_makeability('d404'), (0, None))
+
+    def test_consume_lowers_servings(self):
+        self.assertMakeability({'d1': (3, 'i1'), 'd2': (3, 'i2'), 'd3': (0, 'i9')})
+        db.record_inventory_events([{'type': inventory_ledger.CONSUMPTION, 'lot_id': 1, 'mass_g': 160}])
+        self.assertMakeability({'d1': (1, 'i1'), 'd2': (2, 'i1'), 'd3': (0, 'i9')})
+
+    def test_receipt_moves_the_limiting_ingredient(self):
+        self.assertMakeability({'d1': (3, 'i1'), 'd2': (3, 'i2'), 'd3': (0, 'i9')})
+        db.add_storaged_ingredient('i1', 1000, '2030-01-10', 'storage', expiration_date='2099-12-31')
+        self.assertMakeability({'d1': (6, 'i2'), 'd2': (3, 'i2'), 'd3': (0, 'i9')})
+
+    def test_lot_expires_when_the_day_rolls_over(self):
+        self.assertMakeability({'d1': (3, 'i1'), 'd2': (3, 'i2'), 'd3': (0, 'i9')})
+        self.clock.now.return_value = datetime(2030, 1, 11, 0, 5)
+        # Lot 3 expired overnight: only lot 2's 120 g of i2 are left
+        self.assertMakeability({'d1': (2, 'i2'), 'd2': (1, 'i2'), 'd3': (0, 'i9')})
+
+
+if __name__ == '__main__':
+    unittest.main()
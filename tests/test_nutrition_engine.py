@@ -0,0 +1,185 @@
+"""
+Tests for the vectorized dish nutrition calculation (nutrition_engine).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from table_fixture import TableTestCase, dish, ingredient
+
+import database_handler as db
+import nutrition_engine
+
+INGREDIENTS = {
+    # Protein is listed twice: the amounts add up
+    'i1': {'id': 'i1', 'nutrition': [{'name': 'Protein', 'amount_per_unit_mass': 0.1},
+                                     {'name': 'Protein', 'amount_per_unit_mass': 0.05},
+                                     {'name': 'Calories', 'amount_per_unit_mass': 2.0}]},
+    # 'Calories (Total)' shares the Calories column; Sodium is not a category
+    'i2': {'id': 'i2', 'nutrition': [{'name': 'Calories (Total)', 'amount_per_unit_mass': 1.0},
+                                     {'name': 'Fat', 'amount_per_unit_mass': 0.3},
+                                     {'name': 'Sodium', 'amount_per_unit_mass': 0.002}]},
+}
+
+# Not part of the batch: contributes its stored nutrition_info
+STORED = dish('d9', ('i1', 10), nutrition_info=[{'name': 'Calories (Total)', 'amount_per_unit_mass': 1.5},
+                                                 {'name': 'Protein', 'amount_per_unit_mass': 0.2}])
+
+
+def _batch():
+    # Users before their sub-dishes, so the engine has to order them
+    return [
+        dish('d3', ('dish', 'd9', 100), ('dish', 'd2', 50), ('i1', 10)),
+        dish('d2', ('dish', 'd1', 200), ('i2', 30)),
+        dish('d1', ('i1', 100), ('i2', 50)),
+        dish('d0', ('i1', 0)),
+    ]
+
+
+def _reference(dishes, ingredient_map, dish_map):
+    """The per-dish dict accumulation the engine replaced: {dish id: {output name: per gram}}."""
+    dish_map = dict(dish_map)
+    results = {}
+
+    def compute(current):
+        if current['id'] in results:
+            return
+        sums = {}
+        total_mass = 0.0
+        for req in current['required_ingredients']:
+            amount = req.get('amount_g', 0)
+            total_mass += amount
+            if req.get('type') == 'dish':
+                if req['id'] not in dish_map:
+                    continue
+                if any(d['id'] == req['id'] for d in dishes):
+                    compute(dish_map[req['id']])
+                nutrition = dish_map[req['id']]['nutrition_info']
+            else:
+                nutrition = ingredient_map[req['id']]['nutrition']
+            for nutr in nutrition:
+                sums[nutr['name']] = sums.get(nutr['name'], 0.0) + nutr['amount_per_unit_mass'] * amount
+        per_gram = {}
+        for name, total in sums.items():
+            output_name = 'Calories (Total)' if name == 'Calories' else name
+            per_gram[output_name] = per_gram.get(output_name, 0.0) + (total / total_mass if total_mass > 0 else 0.0)
+        results[current['id']] = per_gram
+        dish_map[current['id']] = dict(current, nutrition_info=[
+            {'name': name, 'amount_per_unit_mass': value} for name, value in per_gram.items()])
+
+    for current in dishes:
+        compute(current)
+    return results
+
+
+def _as_dict(nutrition_info):
+    values = {}
+    for nutr in nutrition_info:
+        values[nutr['name']] = values.get(nutr['name'], 0.0) + nutr['amount_per_unit_mass']
+    return values
+
+
+class ComputeDishFieldsTest(TableTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dishes = _batch()
+        self.dish_map = {d['id']: d for d in self.dishes + [STORED]}
+        self.fields = dict(zip([d['id'] for d in self.dishes],
+                               nutrition_engine.compute_dish_fields(self.dishes, INGREDIENTS, self.dish_map)))
+
+    def test_matches_the_per_dish_calculation(self):
+        expected = _reference(self.dishes, INGREDIENTS, self.dish_map)
+        for dish_id, fields in self.fields.items():
+            actual = _as_dict(fields['nutrition_info'])
+            for name in expected[dish_id].keys() | actual.keys():
+                self.assertAlmostEqual(actual.get(name, 0.0), expected[dish_id].get(name, 0.0), places=12,
+                                       msg=f'{dish_id} {name}')
+
+    def test_repeated_names_and_calorie_alias_share_a_column(self):
+        d1 = _as_dict(self.fields['d1']['nutrition_info'])
+        self.assertAlmostEqual(d1['Protein'], 100 * 0.15 / 150)
+        self.assertAlmostEqual(d1['Calories (Total)'], (100 * 2.0 + 50 * 1.0) / 150)
+        self.assertNotIn('Calories', d1)
+        # Categories first (zeros included), then other nutrients
+        names = [nutr['name'] for nutr in self.fields['d1']['nutrition_info']]
+        self.assertEqual(names, ['Calories (Total)', 'Protein', 'Fat', 'Sodium'])
+
+    def test_serving_fields(self):
+        d1 = self.fields['d1']
+        self.assertEqual(d1['total_mass_g'], 150)
+        self.assertAlmostEqual(d1['nutrition_totals']['Protein'], 15.0)
+        self.assertAlmostEqual(d1['calories'], 250.0)
+
+    def test_sub_dish_outside_the_batch_uses_its_stored_nutrition(self):
+        d2 = _as_dict(self.fields['d2']['nutrition_info'])
+        d3 = _as_dict(self.fields['d3']['nutrition_info'])
+        expected = (100 * 1.5 + 50 * d2['Calories (Total)'] + 10 * 2.0) / 160
+        self.assertAlmostEqual(d3['Calories (Total)'], expected)
+
+    def test_dish_without_mass_is_all_zero(self):
+        d0 = self.fields['d0']
+        self.assertEqual(d0['total_mass_g'], 0)
+        self.assertTrue(all(nutr['amount_per_unit_mass'] == 0 for nutr in d0['nutrition_info']))
+        self.assertEqual(d0['calories'], 0)
+
+
+class DependencyOrderTest(unittest.TestCase):
+
+    def _ids(self, dishes):
+        return [dishes[row]['id'] for row in nutrition_engine.dependency_order(dishes)]
+
+    def test_sub_dishes_come_first(self):
+        dishes = [dish('d3', ('dish', 'd2', 10)), dish('d2', ('dish', 'd1', 10), ('dish', 'd9', 5)),
+                  dish('d1', ('i1', 10)), dish('d4', ('i1', 10))]
+        order = self._ids(dishes)
+        self.assertEqual(sorted(order), ['d1', 'd2', 'd3', 'd4'])
+        self.assertLess(order.index('d1'), order.index('d2'))
+        self.assertLess(order.index('d2'), order.index('d3'))
+
+    def test_two_cycle(self):
+        dishes = [dish('d1', ('dish', 'd2', 10)), dish('d2', ('dish', 'd1', 10)), dish('d3', ('i1', 10))]
+        with self.assertRaises(nutrition_engine.DishCycleError) as raised:
+            nutrition_engine.dependency_order(dishes)
+        self.assertEqual(raised.exception.cycle, ['d1', 'd2', 'd1'])
+
+    def test_three_cycle_behind_a_user(self):
+        dishes = [dish('d0', ('dish', 'd1', 10)), dish('d1', ('dish', 'd2', 10)),
+                  dish('d2', ('dish', 'd3', 10)), dish('d3', ('dish', 'd1', 10))]
+        with self.assertRaises(nutrition_engine.DishCycleError) as raised:
+            nutrition_engine.dependency_order(dishes)
+        # d0 only waits on the cycle and is not part of it
+        self.assertEqual(raised.exception.cycle, ['d1', 'd2', 'd3', 'd1'])
+        self.assertIn('d1 -> d2 -> d3 -> d1', str(raised.exception))
+
+
+class UpdateDishCycleTest(TableTestCase):
+
+    TABLES = {
+        'ingredient': [ingredient('i1', Protein=0.1)],
+        'dish': [dish('d1', ('i1', 100)), dish('d2', ('dish', 'd1', 50)), dish('d3', ('dish', 'd2', 50))],
+    }
+
+    def _update(self, dish_id, *items):
+        db.update_dish(dish_id, {'kor': dish_id}, None, dish(dish_id, *items)['required_ingredients'], [])
+
+    def test_edit_that_closes_a_cycle_is_rejected(self):
+        before = db.get_table('dish')
+        with self.assertRaises(db.DishCycleError) as raised:
+            self._update('d1', ('dish', 'd3', 10))
+        self.assertEqual(raised.exception.cycle, ['d1', 'd3', 'd2', 'd1'])
+        self.assertIs(db.get_table('dish'), before)
+
+    def test_dish_cannot_contain_itself(self):
+        with self.assertRaises(db.DishCycleError):
+            self._update('d2', ('dish', 'd2', 10))
+
+    def test_edit_without_a_cycle_is_saved(self):
+        self._update('d1', ('i1', 200))
+        self.assertEqual(db.get_record('dish', 'd1')['total_mass_g'], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
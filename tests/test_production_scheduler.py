@@ -0,0 +1,90 @@
+"""
+Tests for production batch scheduling (production_scheduler).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import unittest
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from table_fixture import TableTestCase, dish, ingredient, storage_lot
+
+import forecast
+import production_scheduler
+import user_db_handler
+
+TODAY = date(2030, 1, 10)
+
+
+def producible(ingredient_id, min_days, max_days):
+    return dict(ingredient(ingredient_id), production_time={'producible': True, 'min': min_days, 'max': max_days})
+
+
+def _day(n):
+    return (TODAY + timedelta(days=n)).isoformat()
+
+
+class ScheduleTest(unittest.TestCase):
+
+    INGREDIENTS = {'p1': producible('p1', 2, 5), 'p2': producible('p2', 1, 5), 'i1': ingredient('i1')}
+
+    def batches(self, lots, rates, horizon_days, batch_days=10):
+        projection = forecast.project(lots, rates, TODAY, horizon_days)
+        return [(batch['ingredient_id'], batch['start_date'], batch['mass_g'], batch['late'])
+                for batch in production_scheduler.schedule(projection, self.INGREDIENTS, batch_days)]
+
+    def test_batches_start_the_worst_case_time_before_the_shortfall(self):
+        # 1000 g last 10 days: each batch must arrive by day 10, 20, 30 and may take 5 days
+        batches = self.batches([storage_lot(1, 'p1', 1000, '2099-12-31')], {'p1': 100}, 40)
+        self.assertEqual(batches, [('p1', _day(5), 1000, False),
+                                   ('p1', _day(15), 1000, False),
+                                   ('p1', _day(25), 1000, False)])
+
+    def test_last_batch_covers_the_rest_of_the_horizon(self):
+        # Integer rates give integer batch sizes; the remainder must not be cut to whole grams
+        batches = self.batches([storage_lot(1, 'p1', 1000, '2099-12-31')], {'p1': 100}, 35)
+        self.assertEqual([mass for _, _, mass, _ in batches], [1000, 1000, 500])
+
+    def test_expiring_lot_brings_the_batch_forward(self):
+        # Half of the lot expires unused after day 4: the batch must arrive by day 5
+        batches = self.batches([storage_lot(1, 'p1', 1000, _day(4))], {'p1': 100}, 10)
+        self.assertEqual(batches, [('p1', _day(0), 500, False)])
+
+    def test_batch_that_should_have_started_is_late(self):
+        batches = self.batches([], {'p2': 50}, 20)
+        # Needed on day 0 with up to 5 days of production: starts today, late
+        self.assertEqual(batches, [('p2', _day(0), 500, True), ('p2', _day(5), 500, False)])
+
+    def test_end_dates_follow_the_production_time(self):
+        projection = forecast.project([], {'p2': 50}, TODAY, 10)
+        batch, = production_scheduler.schedule(projection, self.INGREDIENTS, 10)
+        self.assertEqual((batch['min_end_date'], batch['max_end_date']), (_day(1), _day(5)))
+
+    def test_no_batches_without_a_shortfall_or_production(self):
+        self.assertEqual(self.batches([storage_lot(1, 'p1', 5000, '2099-12-31')], {'p1': 100}, 40), [])
+        self.assertEqual(self.batches([], {'i1': 100}, 40), [])
+
+
+class ProposeScheduleTest(TableTestCase):
+
+    TABLES = {
+        'ingredient': [producible('p1', 2, 5), ingredient('i1')],
+        'dish': [dish('d1', ('p1', 100), ('i1', 100))],
+        user_db_handler.USER_TABLE: [{'id': 1, 'username': 'crew', 'food_timeline': [
+            {'date': _day(-n), 'intake': [{'dish_id': 'd1', 'time': '12:00'}]} for n in range(10)]}],
+        'storaged-ingredient': [storage_lot(1, 'p1', 1000, '2099-12-31'), storage_lot(2, 'i1', 10, '2099-12-31')],
+    }
+
+    def test_proposes_batches_for_producible_ingredients_only(self):
+        with mock.patch.object(production_scheduler, 'datetime') as clock:
+            clock.now.return_value = datetime(2030, 1, 10, 12, 0)
+            batches = production_scheduler.propose_schedule(horizon_days=40, batch_days=10)
+        self.assertEqual([(batch['ingredient_id'], batch['start_date'], batch['mass_g'], batch['late'])
+                          for batch in batches],
+                         [('p1', _day(5), 1000, False), ('p1', _day(15), 1000, False), ('p1', _day(25), 1000, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Tests for dashboard recommendations (recommender): bitset like/forbid
+matching through sub-dishes and top-k ordering.
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from table_fixture import TableTestCase, dish, ingredient, storage_lot
+
+import database_handler as db
+import recommender
+
+FILLERS = [f'i{n}' for n in range(100, 170)]
+
+INGREDIENTS = [ingredient('i1', Protein=0.1), ingredient('i2', Protein=0.2), ingredient('i3'), ingredient('i4')]
+INGREDIENTS += [ingredient(ingredient_id) for ingredient_id in FILLERS]
+
+DISHES = [
+    # Listed first, so i1..i4 get bits past the first 64-bit word. No stock: never recommended.
+    dish('d0', *[(ingredient_id, 1) for ingredient_id in FILLERS]),
+    dish('d1', ('i1', 100)),  # protein 10 g
+    dish('d2', ('dish', 'd1', 50), ('i2', 50)),  # protein 15 g, i1 only through d1
+    dish('d3', ('i3', 100), ('i4', 100)),
+    dish('d4', ('i2', 100)),  # protein 20 g
+    dish('d5', ('i4', 10)),
+]
+
+LOTS = [storage_lot(n, ingredient_id, 10000, '2099-12-31') for n, ingredient_id in enumerate(['i1', 'i2', 'i3', 'i4'], 1)]
+
+REQUIREMENTS = {'Protein': 100}
+
+
+class RecommendDishesTest(TableTestCase):
+
+    TABLES = {'ingredient': INGREDIENTS, 'dish': DISHES, 'storaged-ingredient': LOTS}
+
+    def setUp(self):
+        super().setUp()
+        with db.unit_of_work('dish') as uow:
+            db.recalculate_all_dish_nutrition(uow.load('dish'), db.get_table('ingredient'))
+            uow.save('dish')
+
+    def _ids(self, k=10, **lists):
+        return [row['id'] for row in recommender.recommend_dishes(REQUIREMENTS, {}, k=k, **lists)]
+
+    def test_bitsets_span_several_words(self):
+        model = recommender.get_model()
+        self.assertEqual(model['ingredient_bits'].shape, (len(DISHES), 2))
+        self.assertGreaterEqual(model['bit_index']['i1'], 64)
+
+    def test_k_larger_than_the_candidates(self):
+        # Ranked by protein; d3 and d5 tie and keep catalog order; d0 has no stock
+        self.assertEqual(self._ids(), ['d4', 'd2', 'd1', 'd3', 'd5'])
+        self.assertEqual(self._ids(k=2), ['d4', 'd2'])
+        self.assertEqual(self._ids(k=0), [])
+
+    def test_forbidden_ingredient_inside_a_sub_dish(self):
+        self.assertEqual(self._ids(forbid_ids=['i1']), ['d4', 'd3', 'd5'])
+        # Legacy numeric ids mean the same ingredient
+        self.assertEqual(self._ids(forbid_ids=[1]), ['d4', 'd3', 'd5'])
+
+    def test_likes_are_counted(self):
+        # d3 holds two liked ingredients (+100), d5 one (+50)
+        self.assertEqual(self._ids(like_ids=['i3', 'i4']), ['d3', 'd5', 'd4', 'd2', 'd1'])
+        scores, _ = recommender.score_dishes(REQUIREMENTS, {}, like_ids=['i3', 'i4', 'i999'])
+        # Neither has protein: the score is the like bonus alone; unknown ids are ignored
+        self.assertEqual(scores[3], 2 * recommender.LIKE_BONUS)
+        self.assertEqual(scores[5], recommender.LIKE_BONUS)
+
+    def test_liked_ingredient_inside_a_sub_dish(self):
+        scores, _ = recommender.score_dishes(REQUIREMENTS, {}, like_ids=['i1'])
+        self.assertAlmostEqual(scores[2], 15 + recommender.LIKE_BONUS)
+        self.assertEqual(self._ids(k=2, like_ids=['i1']), ['d2', 'd1'])
+
+    def test_met_requirements_do_not_score(self):
+        self.assertEqual(self._ids(k=3), ['d4', 'd2', 'd1'])
+        ranked = [row['id'] for row in recommender.recommend_dishes(REQUIREMENTS, {'Protein': 100}, k=10)]
+        self.assertEqual(ranked, ['d1', 'd2', 'd3', 'd4', 'd5'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+Tests for the JSON file backend: write-ahead log replay, torn log lines and
+commit journal recovery.
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+import storage_backend
+
+ROWS = [
+    {'id': 1, 'name': 'rice', 'mass_g': 100},
+    {'id': 2, 'name': 'kimchi', 'mass_g': 50},
+]
+
+
+def _backend():
+    # No background compaction and no pickle cache, so the files stay as the test wrote them
+    return storage_backend.JsonFileBackend(compact_min_bytes=1 << 30, snapshot_cache=False)
+
+
+class WalTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'table.json')
+        self.backend = _backend()
+        self.backend.save('table', self.path, ROWS)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _wal_lines(self):
+        with open(self.backend.wal_path(self.path), 'rb') as f:
+            return f.read().splitlines()
+
+    def test_changes_are_logged_and_replayed(self):
+        with open(self.path, 'rb') as f:
+            snapshot = f.read()
+        rows = [dict(ROWS[0], mass_g=80), {'id': 3, 'name': 'egg', 'mass_g': 60}]
+        self.backend.save('table', self.path, rows, previous=ROWS)
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), snapshot)
+        self.assertEqual(len(self._wal_lines()), 3)  # delete 2, update 1, insert 3
+        self.assertEqual(_backend().load('table', self.path), rows)
+
+    def test_explicit_ops_are_written_without_diffing(self):
+        rows = [ROWS[0], dict(ROWS[1], mass_g=40), {'id': 3, 'name': 'egg', 'mass_g': 60}]
+        ops = [{'op': 'update', 'id': 2, 'record': rows[1]}, {'op': 'append', 'record': rows[2]}]
+        # previous is deliberately wrong: with ops the backend must not diff against it
+        self.backend.save('table', self.path, rows, previous=[], ops=ops)
+
+        self.assertEqual([json.loads(line) for line in self._wal_lines()], ops)
+        self.assertEqual(_backend().load('table', self.path), rows)
+
+    def test_torn_last_line_is_ignored_and_repaired(self):
+        rows = [dict(ROWS[0], mass_g=80), ROWS[1]]
+        self.backend.save('table', self.path, rows, previous=ROWS)
+        # A crash in the middle of an append leaves half a record without a newline
+        with open(self.backend.wal_path(self.path), 'ab') as f:
+            f.write(b'{"op": "update", "id": 2, "rec')
+
+        self.assertEqual(_backend().load('table', self.path), rows)
+
+        newer = [rows[0], dict(ROWS[1], mass_g=10)]
+        self.backend.save('table', self.path, newer, previous=rows)
+        for line in self._wal_lines():
+            json.loads(line)
+        self.assertEqual(_backend().load('table', self.path), newer)
+
+
+class CommitJournalTest(unittest.TestCase):
+    """save_many() across two tables, with the writer killed at different points."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.paths = {name: os.path.join(self._tmp.name, f'{name}.json') for name in ('a', 'b')}
+        backend = _backend()
+        for name, path in self.paths.items():
+            backend.save(name, path, ROWS)
+        self.rows = {
+            'a': [dict(ROWS[0], mass_g=1), ROWS[1]],
+            'b': ROWS + [{'id': 3, 'name': 'egg', 'mass_g': 60}],
+        }
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _save_many_and_die(self, patch):
+        """Run save_many() in a child process that exits abruptly where `patch` says."""
+        script = textwrap.dedent(f"""
+            import os, sys
+            sys.path.insert(0, {repo_root!r})
+            import storage_backend
+            backend = storage_backend.JsonFileBackend(compact_min_bytes=1 << 30, snapshot_cache=False)
+            {patch}
+            backend.save_many([
+                ('a', {self.paths['a']!r}, {self.rows['a']!r}, {ROWS!r}, None),
+                ('b', {self.paths['b']!r}, {self.rows['b']!r}, {ROWS!r}, None),
+            ])
+        """)
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 17, result.stderr)
+
+    def _load(self, name):
+        return _backend().load(name, self.paths[name])
+
+    def test_journal_is_replayed_after_crash_before_apply(self):
+        # Killed after the journal (the commit point) was written, before any table changed
+        self._save_many_and_die("storage_backend.JsonFileBackend._apply = lambda self, actions: os._exit(17)")
+        journal = storage_backend.JsonFileBackend.journal_path(self.paths['a'])
+        self.assertTrue(os.path.exists(journal))
+
+        self.assertEqual(self._load('a'), self.rows['a'])
+        self.assertEqual(self._load('b'), self.rows['b'])
+        self.assertFalse(os.path.exists(journal))
+
+    def test_journal_is_replayed_after_crash_during_apply(self):
+        # Killed after the first table's log was appended: replay must not append it twice
+        patch = textwrap.dedent("""
+            apply = storage_backend.JsonFileBackend._apply
+            def _apply_first(self, actions):
+                apply(self, actions[:1])
+                os._exit(17)
+            storage_backend.JsonFileBackend._apply = _apply_first
+        """).replace('\n', '\n            ')
+        self._save_many_and_die(patch)
+
+        self.assertEqual(self._load('a'), self.rows['a'])
+        self.assertEqual(self._load('b'), self.rows['b'])
+        with open(storage_backend.JsonFileBackend.wal_path(self.paths['a']), 'rb') as f:
+            self.assertEqual(len(f.read().splitlines()), 1)
+
+    def test_nothing_lands_when_killed_before_the_journal(self):
+        patch = textwrap.dedent("""
+            write = storage_backend.atomic_write_json
+            def _die_on_journal(path, data):
+                if path.endswith('commit.journal'):
+                    os._exit(17)
+                write(path, data)
+            storage_backend.atomic_write_json = _die_on_journal
+        """).replace('\n', '\n            ')
+        self._save_many_and_die(patch)
+
+        self.assertEqual(self._load('a'), ROWS)
+        self.assertEqual(self._load('b'), ROWS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""
+Tests for saves that name their changed rows (database_handler._tracked_changes).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repo_root not in sys.path:
+    sys.path.insert(0, repo_root)
+
+import database_handler as db
+import storage_backend
+
+CURRENT = [{'id': n, 'mass_g': n * 10} for n in range(1, 6)]
+
+
+class TrackedChangesTest(unittest.TestCase):
+
+    def test_update_delete_and_append(self):
+        data = [dict(row) for row in CURRENT if row['id'] != 2] + [{'id': 6, 'mass_g': 60}]
+        data[2]['mass_g'] = 1  # id 4
+        rows, ops = db._tracked_changes(CURRENT, data, [2, 4, 6])
+
+        self.assertEqual(rows, data)
+        self.assertEqual([op['op'] for op in ops], ['delete', 'update', 'append'])
+        self.assertEqual(storage_backend.apply_ops([dict(row) for row in CURRENT], ops), data)
+        # Unchanged rows are shared with the current table, changed ones are copies
+        self.assertIs(rows[0], CURRENT[0])
+        self.assertIsNot(rows[2], data[2])
+
+    def test_unchanged_rows_produce_no_ops(self):
+        rows, ops = db._tracked_changes(CURRENT, [dict(row) for row in CURRENT], [1, 3])
+        self.assertEqual(ops, [])
+        self.assertIs(rows[0], CURRENT[0])
+
+    def test_reordered_rows_fall_back_to_a_full_save(self):
+        data = [CURRENT[1], CURRENT[0]] + CURRENT[2:]
+        self.assertIsNone(db._tracked_changes(CURRENT, data, [1]))
+
+    def test_row_added_in_the_middle_falls_back_to_a_full_save(self):
+        data = CURRENT[:2] + [{'id': 9}] + CURRENT[2:]
+        self.assertIsNone(db._tracked_changes(CURRENT, data, [9]))
+
+
+if __name__ == '__main__':
+    unittest.main()
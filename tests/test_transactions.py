@@ -0,0 +1,51 @@
+"""
+Tests for the table versions seen inside transactions (database_handler.get_table_version).
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+
+import unittest
+
+from table_fixture import TableTestCase, ingredient
+
+import database_handler as db
+
+
+class _Abort(Exception):
+    pass
+
+
+class PendingVersionTest(TableTestCase):
+
+    TABLES = {'ingredient': [ingredient('i1', Protein=0.1)]}
+
+    def _aborted_version(self, name):
+        try:
+            with db.transaction('ingredient'):
+                db._append_rows('ingredient', [ingredient(name)])
+                version = db.get_table_version('ingredient')
+                self.assertEqual(db.get_table('ingredient')[-1]['id'], name)
+                raise _Abort()
+        except _Abort:
+            return version
+
+    def test_versions_of_aborted_transactions_never_repeat(self):
+        committed = db.get_table_version('ingredient')
+        versions = [self._aborted_version(f'i{n}') for n in range(2, 300)]
+
+        self.assertEqual(len(set(versions)), len(versions))
+        self.assertNotIn(committed, versions)
+        self.assertEqual(db.get_table_version('ingredient'), committed)
+        self.assertEqual([row['id'] for row in db.get_table('ingredient')], ['i1'])
+
+    def test_version_changes_with_every_save_in_a_transaction(self):
+        with db.transaction('ingredient'):
+            db._append_rows('ingredient', [ingredient('i2')])
+            first = db.get_table_version('ingredient')
+            db._append_rows('ingredient', [ingredient('i3')])
+            self.assertNotEqual(db.get_table_version('ingredient'), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
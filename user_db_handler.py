@@ -2,22 +2,36 @@ import json
 import os
 from datetime import datetime
 
+import storage_backend
+
 USER_DB_PATH = os.path.join(os.path.dirname(__file__), 'user_db.json')
+USER_TABLE = 'users'
 
 def load_users():
-    """Loads the list of users from the JSON file."""
-    if not os.path.exists(USER_DB_PATH):
+    """Loads the list of users from the configured storage backend."""
+    try:
+        return storage_backend.get_backend().load(USER_TABLE, USER_DB_PATH)
+    except json.JSONDecodeError:
         return []
-    with open(USER_DB_PATH, 'r', encoding='utf-8') as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return []
 
 def save_users(users):
-    """Saves the list of users to the JSON file."""
-    with open(USER_DB_PATH, 'w', encoding='utf-8') as f:
-        json.dump(users, f, ensure_ascii=False, indent=4)
+    """Saves the list of users to the configured storage backend (atomic replace)."""
+    with users_lock():
+        storage_backend.get_backend().save(USER_TABLE, USER_DB_PATH, users)
+
+def users_lock():
+    """Exclusive cross-process lock for read-modify-write of the user list."""
+    return storage_backend.get_backend().lock(USER_TABLE, USER_DB_PATH)
+
+def normalize_ingredient_ids(ids):
+    """Ingredient ids of a like/forbid list as table ids; legacy entries stored as n become "i{n}"."""
+    normalized = []
+    for item in ids or []:
+        if isinstance(item, int) or (isinstance(item, str) and item.isdigit()):
+            item = f"i{item}"
+        if item not in normalized:
+            normalized.append(item)
+    return normalized
 
 def get_user_by_id(user_id):
     """Finds a user by their ID."""
@@ -37,53 +51,63 @@ def get_user_by_username(username):
 
 def update_user(user_id, update_fields):
     """Updates a user's information by their ID."""
-    users = load_users()
-    user_found = False
-    for i, user in enumerate(users):
-        if user.get('id') == user_id:
-            users[i].update(update_fields)
-            user_found = True
-            break
-    if user_found:
-        save_users(users)
+    with users_lock():
+        users = load_users()
+        user_found = False
+        for i, user in enumerate(users):
+            if user.get('id') == user_id:
+                users[i].update(update_fields)
+                user_found = True
+                break
+        if user_found:
+            save_users(users)
     return user_found
 
 def add_food_to_timeline(user_id, food_intake_data):
-    """Adds a food intake record to a user's timeline for the current day."""
-    users = load_users()
-    user_found = False
-    today_str = datetime.now().strftime('%Y-%m-%d')
+    """Adds a food intake record to a user's timeline for the current day.
 
-    for user in users:
-        if user.get('id') == user_id:
-            user_found = True
-            if 'food_timeline' not in user:
-                user['food_timeline'] = []
-
-            # Find today's entry
-            todays_entry = None
-            for entry in user['food_timeline']:
-                if entry.get('date') == today_str:
-                    todays_entry = entry
-                    break
+    The user's daily_totals are updated in the same save (see intake_totals).
+    """
+    # Imported here: intake_totals imports database_handler, which imports this module
+    import intake_totals
+
+    with users_lock():
+        users = load_users()
+        user_found = False
+        today_str = datetime.now().strftime('%Y-%m-%d')
+
+        for user in users:
+            if user.get('id') == user_id:
+                user_found = True
+                if 'food_timeline' not in user:
+                    user['food_timeline'] = []
+
+                # Find today's entry
+                todays_entry = None
+                for entry in user['food_timeline']:
+                    if entry.get('date') == today_str:
+                        todays_entry = entry
+                        break
             
-            # Add current time to intake data
-            food_intake_data['time'] = datetime.now().strftime('%H:%M')
-
-            if todays_entry:
-                # Add to existing entry for today
-                todays_entry['intake'].append(food_intake_data)
-            else:
-                # Create a new entry for today
-                user['food_timeline'].append({
-                    "date": today_str,
-                    "intake": [food_intake_data]
-                })
-            break
-
-    if user_found:
-        save_users(users)
-    return user_found
+                # Add current time to intake data
+                food_intake_data['time'] = datetime.now().strftime('%H:%M')
+
+                if todays_entry:
+                    # Add to existing entry for today
+                    todays_entry['intake'].append(food_intake_data)
+                else:
+                    # Create a new entry for today
+                    user['food_timeline'].append({
+                        "date": today_str,
+                        "intake": [food_intake_data]
+                    })
+                    user['food_timeline'].sort(key=lambda x: x['date'], reverse=True)
+                intake_totals.add_intake(user, today_str, food_intake_data.get('dish_id'))
+                break
+
+        if user_found:
+            save_users(users)
+        return user_found
 
 def get_all_users():
     """Returns the full list of users."""
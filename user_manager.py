@@ -1,18 +1,15 @@
-import json
 from werkzeug.security import generate_password_hash, check_password_hash
 
-DB_FILE = 'user_db.json'
+import user_db_handler
+
+DB_FILE = user_db_handler.USER_DB_PATH
 
 def load_users():
-    try:
-        with open(DB_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return [] # 이제 리스트를 반환
+    # Same storage as user_db_handler so both modules see the configured backend
+    return user_db_handler.load_users() # 이제 리스트를 반환
 
 def save_users(users):
-    with open(DB_FILE, 'w', encoding='utf-8') as f:
-        json.dump(users, f, ensure_ascii=False, indent=4)
+    user_db_handler.save_users(users)
 
 def get_user_by_username(username):
     users = load_users()
@@ -27,6 +24,11 @@ def _get_next_id(users):
     return max(user.get('id', 0) for user in users) + 1
 
 def add_user(username, password, name, height, weight, age, gender, like_ids, forbid_ids, activity_level, language='kor'):
+    with user_db_handler.users_lock():
+        return _add_user_locked(username, password, name, height, weight, age, gender,
+                                like_ids, forbid_ids, activity_level, language)
+
+def _add_user_locked(username, password, name, height, weight, age, gender, like_ids, forbid_ids, activity_level, language):
     users = load_users()
     if get_user_by_username(username):
         return False  # 이미 존재하는 사용자
@@ -43,7 +45,8 @@ def add_user(username, password, name, height, weight, age, gender, like_ids, fo
         "activity_level": activity_level,
         "language": language,
         "like": like_ids,
-        "forbid": forbid_ids
+        "forbid": forbid_ids,
+        "daily_totals": {}
     }
     users.append(new_user)
     save_users(users)